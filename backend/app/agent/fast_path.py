@@ -0,0 +1,136 @@
+"""Keyword fast path that answers obvious intents without an LLM round-trip."""
+import re
+from typing import Optional
+
+from app.agent.prompts import (
+    GREETING_TEMPLATE,
+    SPACES_LIST_TEMPLATE,
+    CANCEL_BOOKING_PROMPT_TEMPLATE,
+    NO_BOOKINGS_TO_CANCEL_MESSAGE,
+)
+from app.agent.tools import get_spaces_info, get_user_bookings
+from app.utils.json import loads as json_loads
+
+# Patterns are anchored so only short, unambiguous messages take the fast path;
+# anything with extra detail (dates, times, booking IDs) still goes to the LLM.
+_GREETING_RE = re.compile(
+    r"^\s*(hi|hello|hey|good (morning|afternoon|evening))( there)?[\s!.,]*$",
+    re.IGNORECASE,
+)
+_BROWSE_RE = re.compile(
+    r"^\s*(please )?(show|list)( me)?( all)?( the| your)?( available)?\s+"
+    r"(?P<kind>meeting rooms|rooms|hot desks|desks|private offices|offices|spaces)"
+    r"(\s+in\s+(?P<location>kl|pj|jb|kuala lumpur|petaling jaya|johor bahru))?[\s?.!]*$",
+    re.IGNORECASE,
+)
+_CANCEL_RE = re.compile(
+    r"^\s*(please |i want to |i'd like to )?cancel (my |a )?bookings?[\s?.!]*$",
+    re.IGNORECASE,
+)
+
+# Browse keyword -> (space_type filter, label used in the reply)
+_SPACE_KINDS = {
+    "meeting rooms": ("meeting_room", "meeting rooms"),
+    "rooms": ("meeting_room", "meeting rooms"),
+    "hot desks": ("hot_desk", "hot desks"),
+    "desks": ("hot_desk", "hot desks"),
+    "private offices": ("private_office", "private offices"),
+    "offices": ("private_office", "private offices"),
+    "spaces": (None, "spaces"),
+}
+
+
+def _fast_intent(message: str) -> Optional[tuple[str, dict]]:
+    """Classify obvious intents with regexes; returns (intent, params) or None."""
+    if _GREETING_RE.match(message):
+        return "greeting", {}
+
+    match = _BROWSE_RE.match(message)
+    if match:
+        return "inquiry", {
+            "kind": match["kind"].lower(),
+            "location": match["location"],
+        }
+
+    if _CANCEL_RE.match(message):
+        return "cancel_booking", {}
+
+    return None
+
+
+def _format_space_line(index: int, space: dict) -> str:
+    """Format one space from get_spaces_info as a numbered list entry."""
+    rates = [
+        space[key]
+        for key in ("hourly_rate", "daily_rate", "monthly_rate")
+        if space.get(key)
+    ]
+    line = f"{index}. **{space['name']}** - {space['location']}, up to {space['capacity']} people"
+    if rates:
+        line += f" ({', '.join(rates)})"
+    return line
+
+
+async def run_fast_path(
+    message: str,
+    user_id: str,
+    user_name: Optional[str] = None,
+    language: str = "english"
+) -> Optional[dict]:
+    """
+    Answer greetings, simple browse requests and bare cancel requests directly.
+
+    Returns a dict with response and virtual_tour, or None when the message
+    should go through the full agent.
+    """
+    # Templates are English-only; other languages always use the LLM
+    if language != "english":
+        return None
+
+    classified = _fast_intent(message)
+    if not classified:
+        return None
+    intent, params = classified
+
+    if intent == "greeting":
+        name = f" {user_name.split()[0]}" if user_name else ""
+        return {"response": GREETING_TEMPLATE.format(name=name), "virtual_tour": None}
+
+    if intent == "inquiry":
+        space_type, label = _SPACE_KINDS[params["kind"]]
+        data = json_loads(await get_spaces_info.ainvoke({
+            "space_type": space_type,
+            "location": params["location"],
+        }))
+        spaces = data.get("spaces") or []
+        if not spaces:
+            # Let the LLM suggest alternatives
+            return None
+        location_suffix = f" in {spaces[0]['location']}" if params["location"] else ""
+        return {
+            "response": SPACES_LIST_TEMPLATE.format(
+                label=label,
+                location_suffix=location_suffix,
+                space_lines="\n".join(
+                    _format_space_line(i, space) for i, space in enumerate(spaces, start=1)
+                ),
+            ),
+            "virtual_tour": data.get("virtual_tour"),
+        }
+
+    if intent == "cancel_booking":
+        data = json_loads(await get_user_bookings.ainvoke({"user_id": user_id}))
+        bookings = [b for b in data.get("bookings", []) if b.get("status") != "cancelled"]
+        if not bookings:
+            return {"response": NO_BOOKINGS_TO_CANCEL_MESSAGE, "virtual_tour": None}
+        return {
+            "response": CANCEL_BOOKING_PROMPT_TEMPLATE.format(
+                booking_lines="\n".join(
+                    f"{i}. **{b['space_name']}** on {b['date']}, {b['start_time']} - {b['end_time']} ({b['status']})"
+                    for i, b in enumerate(bookings, start=1)
+                ),
+            ),
+            "virtual_tour": None,
+        }
+
+    return None
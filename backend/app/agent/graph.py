@@ -2,15 +2,21 @@
 import os
 import json
 import asyncio
-from typing import Literal
+import logging
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from typing import AsyncIterator, Literal, Optional
+from zoneinfo import ZoneInfo
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
 
 from app.config import get_settings
 from app.agent.state import AgentState
 from app.agent.prompts import SYSTEM_PROMPT
+from app.agent.fast_path import run_fast_path
+from app.utils.json import loads as json_loads
 from app.agent.tools import (
     get_spaces_info,
     get_space_details,
@@ -24,16 +30,21 @@ from app.agent.tools import (
 )
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
-# Initialize LLM
-llm = ChatOpenAI(
-    model=settings.OPENAI_MODEL,
-    temperature=0.7,
-    api_key=settings.OPENAI_API_KEY,
-    # Each LLM call is bounded, but the flow can make multiple calls (tools + follow-up)
-    timeout=20,
-    max_retries=1,
-)
+LOCAL_TZ = ZoneInfo(settings.TIMEZONE)
+
+# Date format for the prompt's current-date context
+_DATE_FMT = "%B %d, %Y"
+
+# aiohttp-backed transport keeps concurrent chat sessions from queueing inside httpx's
+# connection pool. Requires the openai[aiohttp] extra; otherwise use the default client.
+try:
+    from openai import DefaultAioHttpClient
+
+    llm_http_async_client = DefaultAioHttpClient()
+except Exception:
+    llm_http_async_client = None
 
 # Custom tools for Supabase operations
 custom_tools = [
@@ -54,8 +65,98 @@ stripe_tools = []
 # Combine all tools (only Supabase-backed tools)
 all_tools = custom_tools
 
-# Bind tools to LLM
-llm_with_tools = llm.bind_tools(all_tools)
+
+@lru_cache(maxsize=1)
+def _get_llm_with_tools():
+    """Build the LLM and bind the tool schemas once, on first use."""
+    llm = ChatOpenAI(
+        model=settings.OPENAI_MODEL,
+        temperature=0.7,
+        api_key=settings.OPENAI_API_KEY,
+        # Each LLM call is bounded, but the flow can make multiple calls (tools + follow-up)
+        timeout=20,
+        max_retries=1,
+        # Module-level client so the connection pool is shared across requests
+        http_async_client=llm_http_async_client,
+    )
+    # bind_tools serializes every tool's JSON schema, so only do it once per process.
+    # Parallel calls let independent lookups share one round-trip (tool_node runs them
+    # concurrently). strict mode is left off: it requires every parameter to be
+    # required, which our optional tool arguments are not.
+    return llm.bind_tools(all_tools, parallel_tool_calls=True)
+
+
+# Conversation history window sent to the LLM: last few plain user/assistant turns,
+# further capped by a token budget so the prompt tail stays small and stable.
+HISTORY_MAX_MESSAGES = 6
+HISTORY_MAX_TOKENS = 1500
+
+
+@lru_cache(maxsize=1)
+def _get_token_encoding():
+    """Get the tiktoken encoding for the configured model (None if unavailable)."""
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(settings.OPENAI_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # tiktoken missing or its BPE file cannot be downloaded
+        return None
+
+
+@lru_cache(maxsize=2048)
+def _count_tokens(text: str) -> int:
+    """Count tokens in a history message (cached: the same turns repeat every request)."""
+    encoding = _get_token_encoding()
+    if encoding is None:
+        # Rough estimate of ~4 characters per token
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def _trim_history(history: list) -> list:
+    """Keep the most recent user/assistant turns that fit the history budgets."""
+    # Tool outputs are stateless and never replayed; only plain text turns are kept
+    turns = [
+        msg for msg in history
+        if msg.get("role") in ("user", "assistant") and msg.get("content")
+    ][-HISTORY_MAX_MESSAGES:]
+
+    kept = []
+    budget = HISTORY_MAX_TOKENS
+    for msg in reversed(turns):
+        budget -= _count_tokens(msg["content"])
+        if budget < 0:
+            break
+        kept.append(msg)
+    kept.reverse()
+    return kept
+
+
+# Tool lookup by name for the parallel tool node
+tool_map = {t.name: t for t in all_tools}
+
+# Cap concurrent tool executions so a burst of tool calls can't exhaust the Supabase pool
+MAX_CONCURRENT_TOOL_CALLS = 8
+_tool_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TOOL_CALLS)
+
+# Static system prompt, built once and reused on every call so the tools + system
+# prefix can be cached by the provider. Only this message carries a cache breakpoint.
+if settings.LLM_PROMPT_CACHE_CONTROL:
+    STATIC_SYSTEM_MESSAGE = SystemMessage(content=[
+        {"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+    ])
+else:
+    STATIC_SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+
+
+async def close_llm_clients() -> None:
+    """Close the shared LLM HTTP client (called on application shutdown)."""
+    if llm_http_async_client is not None:
+        await llm_http_async_client.aclose()
 
 
 def should_continue(state: AgentState) -> Literal["tools", "respond"]:
@@ -74,85 +175,135 @@ async def agent_node(state: AgentState) -> dict:
     """Main agent node that processes messages and decides actions."""
     messages = state["messages"]
 
-    # Build the message list with system prompt
-    system_message = SystemMessage(content=SYSTEM_PROMPT)
+    # Add current date context (critical for date-based bookings). Date only: a
+    # minute-level clock would change the prompt on every call.
+    now_date = state.get("now_date") or datetime.now(LOCAL_TZ).date()
+    dynamic_context = f"**Current Date**: {now_date.strftime(_DATE_FMT)}"
+    dynamic_context += f"\n**Current Day**: {now_date.strftime('%A')}"
+    dynamic_context += "\n**Important**: When suggesting dates, always start from TODAY or later. Never suggest past dates."
 
-    # Add current date/time context (critical for date-based bookings)
-    from datetime import datetime
-    now = datetime.now()
-    time_context = f"\n\n**Current Date & Time**: {now.strftime('%B %d, %Y at %I:%M %p')}"
-    time_context += f"\n**Current Day**: {now.strftime('%A')}"
-    time_context += "\n**Important**: When suggesting dates, always start from TODAY or later. Never suggest past dates."
-
-    # Add user context to system message if available
-    user_context = time_context
+    # Add user context if available
     if state.get("user_id"):
-        user_context += f"\n\nCurrent user ID: {state['user_id']}"
+        dynamic_context += f"\n\nCurrent user ID: {state['user_id']}"
     if state.get("user_name"):
-        user_context += f"\nUser name: {state['user_name']}"
+        dynamic_context += f"\nUser name: {state['user_name']}"
     if state.get("user_email"):
-        user_context += f"\nUser email: {state['user_email']}"
-
-    if user_context:
-        system_message = SystemMessage(content=SYSTEM_PROMPT + user_context)
+        dynamic_context += f"\nUser email: {state['user_email']}"
 
     # Add booking context if exists
     if state.get("booking_context"):
         ctx = state["booking_context"]
-        booking_info = "\n\nCurrent booking context:"
+        dynamic_context += "\n\nCurrent booking context:"
         if ctx.get("space_name"):
-            booking_info += f"\n- Space: {ctx['space_name']}"
+            dynamic_context += f"\n- Space: {ctx['space_name']}"
         if ctx.get("date"):
-            booking_info += f"\n- Date: {ctx['date']}"
+            dynamic_context += f"\n- Date: {ctx['date']}"
         if ctx.get("start_time"):
-            booking_info += f"\n- Time: {ctx['start_time']} - {ctx.get('end_time', 'TBD')}"
+            dynamic_context += f"\n- Time: {ctx['start_time']} - {ctx.get('end_time', 'TBD')}"
         if ctx.get("total_amount"):
-            booking_info += f"\n- Amount: RM{ctx['total_amount']:.2f}"
-        system_message = SystemMessage(content=system_message.content + booking_info)
+            dynamic_context += f"\n- Amount: RM{ctx['total_amount']:.2f}"
+
+    # Volatile per-turn context lives in its own message (no cache breakpoint) after the
+    # static prefix, which stays byte-identical across calls for prompt caching.
+    context_message = SystemMessage(content=dynamic_context)
 
-    full_messages = [system_message] + list(messages)
+    full_messages = [STATIC_SYSTEM_MESSAGE, context_message] + list(messages)
 
     # Call the LLM
     # Use async call so we don't block the event loop during LLM/tool routing
-    response = await llm_with_tools.ainvoke(full_messages)
+    response = await _get_llm_with_tools().ainvoke(full_messages)
+
+    usage = getattr(response, "usage_metadata", None) or {}
+    logger.debug(
+        "LLM usage: prompt_tokens=%s cached_tokens=%s",
+        usage.get("input_tokens"),
+        (usage.get("input_token_details") or {}).get("cache_read", 0),
+    )
 
     return {"messages": [response]}
 
 
-def response_node(state: AgentState) -> dict:
-    """Format the final response to return to the user."""
-    messages = state["messages"]
-    last_message = messages[-1]
+async def tool_node(state: AgentState) -> dict:
+    """Execute the LLM's tool calls concurrently and return results in call order."""
+    tool_calls = state["messages"][-1].tool_calls
 
-    response_text = last_message.content if hasattr(last_message, "content") else str(last_message)
+    async def _run(tool_call: dict):
+        selected_tool = tool_map.get(tool_call["name"])
+        if selected_tool is None:
+            raise ValueError(f"Unknown tool: {tool_call['name']}")
+        async with _tool_semaphore:
+            return await selected_tool.ainvoke(tool_call["args"])
+
+    # Independent Supabase-backed lookups run side by side: max-of-latencies, not sum
+    results = await asyncio.gather(
+        *(_run(tool_call) for tool_call in tool_calls),
+        return_exceptions=True,
+    )
+
+    tool_messages = []
+    updates = {}
+    for tool_call, result in zip(tool_calls, results):
+        if isinstance(result, BaseException):
+            # Surface the failure to the LLM instead of aborting the whole turn
+            tool_messages.append(ToolMessage(
+                content=json.dumps({"error": f"Tool {tool_call['name']} failed: {result}"}),
+                name=tool_call["name"],
+                tool_call_id=tool_call["id"],
+                status="error",
+            ))
+            continue
+
+        content = result if isinstance(result, str) else json.dumps(result)
+        tool_messages.append(ToolMessage(
+            content=content,
+            name=tool_call["name"],
+            tool_call_id=tool_call["id"],
+        ))
+        # Lift payment link / virtual tour into state once, so response_node never re-parses
+        updates.update(_extract_tool_artifacts(content))
+
+    return {"messages": tool_messages, **updates}
+
+
+def _extract_tool_artifacts(content: str) -> dict:
+    """Pull payment_link and virtual_tour out of a JSON tool result."""
+    # Only JSON objects carry artifacts; skip parsing plain-text or list output
+    if not isinstance(content, str) or not content.lstrip().startswith("{"):
+        return {}
+    try:
+        data = json_loads(content)
+    except (TypeError, ValueError):
+        # JSONDecodeError (stdlib and orjson) subclasses ValueError
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    artifacts = {}
+
+    # Extract payment link
+    if "pay.stripe.com" in str(data.get("url", "")):
+        artifacts["payment_link"] = data["url"]
+    elif data.get("payment_link"):
+        artifacts["payment_link"] = data["payment_link"]
 
-    # Check if we need to extract payment link or virtual tour from tool results
-    payment_link = None
-    virtual_tour = None
+    # Extract virtual tour
+    if data.get("virtual_tour"):
+        artifacts["virtual_tour"] = data["virtual_tour"]
 
-    for msg in reversed(messages):
-        if hasattr(msg, "content") and isinstance(msg.content, str):
-            try:
-                data = json.loads(msg.content)
+    return artifacts
 
-                # Extract payment link
-                if not payment_link:
-                    if "url" in data and "pay.stripe.com" in str(data.get("url", "")):
-                        payment_link = data["url"]
-                    elif "payment_link" in data:
-                        payment_link = data["payment_link"]
 
-                # Extract virtual tour
-                if not virtual_tour and "virtual_tour" in data:
-                    virtual_tour = data["virtual_tour"]
+def response_node(state: AgentState) -> dict:
+    """Format the final response to return to the user."""
+    last_message = state["messages"][-1]
 
-            except:
-                pass
+    response_text = last_message.content if hasattr(last_message, "content") else str(last_message)
 
+    # Payment link and virtual tour were already lifted into state by tool_node
     return {
         "response": response_text,
-        "payment_link": payment_link,
-        "virtual_tour": virtual_tour
+        "payment_link": state.get("payment_link"),
+        "virtual_tour": state.get("virtual_tour"),
     }
 
 
@@ -163,7 +314,7 @@ def build_booking_agent():
 
     # Add nodes
     workflow.add_node("agent", agent_node)
-    workflow.add_node("tools", ToolNode(all_tools))
+    workflow.add_node("tools", tool_node)
     workflow.add_node("respond", response_node)
 
     # Set entry point
@@ -189,40 +340,49 @@ def build_booking_agent():
     return workflow.compile()
 
 
-# Create the agent instance
-booking_agent = build_booking_agent()
+@lru_cache(maxsize=1)
+def _get_agent():
+    """Get the compiled booking agent, building it on first use."""
+    return build_booking_agent()
 
 
-async def run_booking_agent(
+async def _try_fast_path(
     message: str,
     user_id: str,
-    user_name: str = None,
-    user_email: str = None,
-    conversation_id: str = None,
-    history: list = None,
-    language: str = "english"
-) -> dict:
-    """
-    Run the booking agent with a user message.
-
-    Args:
-        message: The user's message
-        user_id: The user's ID (required for bookings)
-        user_name: The user's name (optional)
-        user_email: The user's email (optional)
-        conversation_id: Session ID for conversation continuity
-        history: Previous messages in the conversation
-        language: Preferred language
+    user_name: Optional[str],
+    language: str,
+    conversation_id: Optional[str]
+) -> Optional[dict]:
+    """Answer obvious intents from templates without calling the LLM."""
+    try:
+        fast = await run_fast_path(message, user_id, user_name, language)
+    except Exception as e:
+        print(f"Fast path failed, falling back to agent: {e}")
+        return None
+    if not fast:
+        return None
+    return {
+        "response": fast["response"],
+        "payment_link": None,
+        "virtual_tour": fast.get("virtual_tour"),
+        "conversation_id": conversation_id or str(uuid.uuid4()),
+    }
 
-    Returns:
-        Dict with response, payment_link (if any), and updated state
-    """
-    import uuid
 
+def _build_initial_state(
+    message: str,
+    user_id: str,
+    user_name: Optional[str],
+    user_email: Optional[str],
+    conversation_id: Optional[str],
+    history: Optional[list],
+    language: str
+) -> AgentState:
+    """Build the graph input state from the request and trimmed history."""
     # Build initial messages from history
     messages = []
     if history:
-        for msg in history[-10:]:  # Last 10 messages
+        for msg in _trim_history(history):
             if msg.get("role") == "user":
                 messages.append(HumanMessage(content=msg["content"]))
             elif msg.get("role") == "assistant":
@@ -231,14 +391,15 @@ async def run_booking_agent(
     # Add current message
     messages.append(HumanMessage(content=message))
 
-    # Initial state
-    initial_state: AgentState = {
+    return {
         "messages": messages,
         "user_id": user_id,
         "user_name": user_name,
         "user_email": user_email,
         "conversation_id": conversation_id or str(uuid.uuid4()),
         "language": language,
+        # One clock read per invocation, shared by every agent step
+        "now_date": datetime.now(LOCAL_TZ).date(),
         "booking_context": None,
         "payment_context": None,
         "current_intent": None,
@@ -249,16 +410,54 @@ async def run_booking_agent(
         "virtual_tour": None,
     }
 
+
+AGENT_TIMEOUT_SECONDS = 60
+TIMEOUT_MESSAGE = "Sorry, the assistant is taking too long to respond. Please try again in a moment."
+ERROR_MESSAGE = "I hit a snag while processing that booking. Please try again in a moment."
+
+
+async def run_booking_agent(
+    message: str,
+    user_id: str,
+    user_name: str = None,
+    user_email: str = None,
+    conversation_id: str = None,
+    history: list = None,
+    language: str = "english"
+) -> dict:
+    """
+    Run the booking agent with a user message.
+
+    Args:
+        message: The user's message
+        user_id: The user's ID (required for bookings)
+        user_name: The user's name (optional)
+        user_email: The user's email (optional)
+        conversation_id: Session ID for conversation continuity
+        history: Previous messages in the conversation
+        language: Preferred language
+
+    Returns:
+        Dict with response, payment_link (if any), and updated state
+    """
+    fast = await _try_fast_path(message, user_id, user_name, language, conversation_id)
+    if fast:
+        return fast
+
+    initial_state = _build_initial_state(
+        message, user_id, user_name, user_email, conversation_id, history, language
+    )
+
     # Run the agent with a hard timeout to avoid hanging the UI
     try:
         # Allow enough headroom for multi-turn tool use (LLM -> tool -> LLM)
         final_state = await asyncio.wait_for(
-            booking_agent.ainvoke(initial_state),
-            timeout=60,
+            _get_agent().ainvoke(initial_state),
+            timeout=AGENT_TIMEOUT_SECONDS,
         )
     except asyncio.TimeoutError:
         return {
-            "response": "Sorry, the assistant is taking too long to respond. Please try again in a moment.",
+            "response": TIMEOUT_MESSAGE,
             "payment_link": None,
             "conversation_id": initial_state["conversation_id"],
         }
@@ -266,7 +465,7 @@ async def run_booking_agent(
         # Catch tool/runtime errors (e.g., Stripe price issues) and return a graceful response
         print(f"Agent execution error: {exc}")
         return {
-            "response": "I hit a snag while processing that booking. Please try again in a moment.",
+            "response": ERROR_MESSAGE,
             "payment_link": None,
             "conversation_id": initial_state["conversation_id"],
         }
@@ -277,3 +476,57 @@ async def run_booking_agent(
         "virtual_tour": final_state.get("virtual_tour"),
         "conversation_id": final_state.get("conversation_id"),
     }
+
+
+async def stream_booking_agent(
+    message: str,
+    user_id: str,
+    user_name: str = None,
+    user_email: str = None,
+    conversation_id: str = None,
+    history: list = None,
+    language: str = "english"
+) -> AsyncIterator[dict]:
+    """
+    Run the booking agent and stream the reply as it is generated.
+
+    Yields {"type": "token", "content": ...} for each model text delta, then a
+    single {"type": "done", ...} event carrying the same fields as
+    run_booking_agent's result. Text emitted before a tool call may be
+    streamed too, so clients should replace the streamed text with the final
+    "response" on "done".
+    """
+    fast = await _try_fast_path(message, user_id, user_name, language, conversation_id)
+    if fast:
+        yield {"type": "done", **fast}
+        return
+
+    initial_state = _build_initial_state(
+        message, user_id, user_name, user_email, conversation_id, history, language
+    )
+    final = None
+
+    try:
+        async with asyncio.timeout(AGENT_TIMEOUT_SECONDS):
+            async for event in _get_agent().astream_events(initial_state, version="v2"):
+                kind = event["event"]
+                if kind == "on_chat_model_stream":
+                    content = event["data"]["chunk"].content
+                    if content and isinstance(content, str):
+                        yield {"type": "token", "content": content}
+                elif kind == "on_chain_end" and event["name"] == "respond":
+                    final = event["data"].get("output")
+    except TimeoutError:
+        final = {"response": TIMEOUT_MESSAGE}
+    except Exception as exc:
+        print(f"Agent execution error: {exc}")
+        final = {"response": ERROR_MESSAGE}
+
+    final = final or {}
+    yield {
+        "type": "done",
+        "response": final.get("response") or "I apologize, but I encountered an issue. Please try again.",
+        "payment_link": final.get("payment_link"),
+        "virtual_tour": final.get("virtual_tour"),
+        "conversation_id": initial_state["conversation_id"],
+    }
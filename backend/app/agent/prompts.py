@@ -133,3 +133,27 @@ To confirm your reservation, please complete the payment using the link below:
 Your booking will be automatically confirmed once payment is complete.
 
 Need help? Contact us at hello@infinity8.my"""
+
+
+GREETING_TEMPLATE = """Hi{name}! I'm the Infinity8 booking assistant. I can help you:
+
+1. Find and book meeting rooms, hot desks, and private offices
+2. Check availability for a date and time
+3. Take a 360° virtual tour of our spaces
+4. View or cancel your bookings
+
+What would you like to do today?"""
+
+SPACES_LIST_TEMPLATE = """Here are our {label}{location_suffix}:
+
+{space_lines}
+
+You can take a 360° virtual tour to explore the space before booking. Which one would you like to book, and for what date and time?"""
+
+CANCEL_BOOKING_PROMPT_TEMPLATE = """Which booking would you like to cancel?
+
+{booking_lines}
+
+Reply with the number of the booking and I'll cancel it for you."""
+
+NO_BOOKINGS_TO_CANCEL_MESSAGE = "You don't have any upcoming bookings to cancel. Would you like to make a new booking?"
\ No newline at end of file
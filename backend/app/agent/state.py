@@ -1,4 +1,5 @@
 """Agent state definitions for the booking agent."""
+from datetime import date
 from typing import TypedDict, Annotated, Sequence, Optional, Literal
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
@@ -53,6 +54,7 @@ class AgentState(TypedDict):
     # Session info
     conversation_id: str
     language: str
+    now_date: Optional[date]  # Local business date, computed once per invocation
 
     # Control flow
     current_intent: Optional[str]
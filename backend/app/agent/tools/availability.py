@@ -1,11 +1,20 @@
 """Agent tools for checking space availability."""
-import json
-from datetime import datetime, timedelta
+import math
+import re
+from functools import lru_cache
+from datetime import date, datetime, time, timedelta
+from types import MappingProxyType
 from typing import Optional
+from zoneinfo import ZoneInfo
 from langchain_core.tools import tool
 
+from app.config import get_settings
+from app.utils.json import dumps
 from app.services.supabase import get_supabase_service
 
+LOCAL_TZ = ZoneInfo(get_settings().TIMEZONE)
+_ONE_HOUR = timedelta(hours=1)
+
 # Default virtual tour URLs (embeddable and full Google Maps Street View)
 # Using user-specified Street View link for Regus Singapore One Fullerton
 DEFAULT_VIRTUAL_TOUR_URL = "https://www.google.com/maps/embed?pb=!4v1702100000000!6m8!1m7!1sCIHM0ogKEICAgIC4s9fTwwE!2m2!1d1.2860713!2d103.8539747!3f257.43!4f76.38!5f0.7820865974627469"
@@ -16,58 +25,90 @@ DEFAULT_VIRTUAL_TOUR_HEADING = 257.43
 DEFAULT_VIRTUAL_TOUR_PITCH = 76.38
 DEFAULT_VIRTUAL_TOUR_PANO_ID = "CIHM0ogKEICAgIC4s9fTwwE"
 
+# Shared virtual tour payload, built once; responses only add the space_name
+_DEFAULT_TOUR = MappingProxyType({
+    "url": DEFAULT_VIRTUAL_TOUR_URL,
+    "full_url": DEFAULT_VIRTUAL_TOUR_FULL_URL,
+    "lat": DEFAULT_VIRTUAL_TOUR_LAT,
+    "lng": DEFAULT_VIRTUAL_TOUR_LNG,
+    "heading": DEFAULT_VIRTUAL_TOUR_HEADING,
+    "pitch": DEFAULT_VIRTUAL_TOUR_PITCH,
+    "pano_id": DEFAULT_VIRTUAL_TOUR_PANO_ID,
+})
 
-def parse_date(date_str: str) -> datetime:
-    """Parse date string in various formats."""
-    formats = [
-        "%Y-%m-%d",
-        "%d/%m/%Y",
-        "%d-%m-%Y",
-        "%B %d, %Y",
-        "%b %d, %Y"
-    ]
-    for fmt in formats:
+# Location abbreviations accepted from users -> stored location names
+_LOCATION_ABBREV = MappingProxyType({
+    "kl": "Kuala Lumpur",
+    "pj": "Petaling Jaya",
+    "jb": "Johor Bahru",
+})
+
+
+# Display formats for tool responses
+_DATE_FMT = "%B %d, %Y"
+_TIME_FMT = "%I:%M %p"
+
+# "08:00 AM"-style label for each hour of the day, so slot lists are built by lookup
+_HOUR_LABELS = tuple(time(hour).strftime(_TIME_FMT) for hour in range(24))
+
+
+# Relative date keywords -> day offset from today (checked first: the common case)
+_RELATIVE_DAYS = {"today": 0, "tomorrow": 1, "next week": 7}
+
+# Fallback strptime formats, tried after the ISO fast path
+_DATE_FORMATS = (
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%B %d, %Y",
+    "%b %d, %Y",
+)
+
+
+def parse_date(date_str: str, today: Optional[date] = None) -> datetime:
+    """Parse date string in various formats; relative dates resolve against `today`."""
+    # Handle relative dates
+    offset = _RELATIVE_DAYS.get(date_str.strip().lower())
+    if offset is not None:
+        if today is None:
+            today = datetime.now(LOCAL_TZ).date()
+        return datetime.combine(today, time()) + timedelta(days=offset)
+
+    # ISO dates (YYYY-MM-DD) go through the C parser. Only that exact shape: it
+    # would also take compact and week dates, and the result must stay a naive
+    # midnight like the stored booking times
+    if len(date_str) == 10 and date_str[4] == "-" and date_str[7] == "-":
+        try:
+            return datetime.combine(date.fromisoformat(date_str), time())
+        except ValueError:
+            pass
+
+    for fmt in _DATE_FORMATS:
         try:
             return datetime.strptime(date_str, fmt)
         except ValueError:
             continue
 
-    # Handle relative dates
-    lower = date_str.lower()
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Could not parse date: {date_str}")
 
-    if lower == "today":
-        return today
-    elif lower == "tomorrow":
-        return today + timedelta(days=1)
-    elif lower == "next week":
-        return today + timedelta(weeks=1)
 
-    raise ValueError(f"Could not parse date: {date_str}")
+# Matches "2pm", "2 pm", "14:00", "2:00 PM" in a single pass
+_TIME_RE = re.compile(r"^\s*(\d{1,2})(?::(\d{2}))?\s*([AaPp][Mm])?\s*$")
 
 
+@lru_cache(maxsize=1024)
 def parse_time(time_str: str) -> tuple[int, int]:
     """Parse time string and return (hour, minute)."""
-    time_str = time_str.strip().upper()
-
-    # Handle formats like "2pm", "2 pm", "14:00", "2:00 PM"
-    if ":" in time_str:
-        parts = time_str.replace("AM", "").replace("PM", "").strip().split(":")
-        hour = int(parts[0])
-        minute = int(parts[1]) if len(parts) > 1 else 0
-        if "PM" in time_str.upper() and hour < 12:
-            hour += 12
-        elif "AM" in time_str.upper() and hour == 12:
-            hour = 0
-    else:
-        # Format like "2pm" or "14"
-        time_str_clean = time_str.replace("AM", "").replace("PM", "").strip()
-        hour = int(time_str_clean)
-        minute = 0
-        if "PM" in time_str.upper() and hour < 12:
-            hour += 12
-        elif "AM" in time_str.upper() and hour == 12:
-            hour = 0
+    match = _TIME_RE.match(time_str)
+    if not match:
+        raise ValueError(f"Could not parse time: {time_str}")
+
+    hour = int(match[1])
+    minute = int(match[2] or 0)
+    ampm = (match[3] or "").upper()
+    if ampm == "PM" and hour < 12:
+        hour += 12
+    elif ampm == "AM" and hour == 12:
+        hour = 0
 
     return hour, minute
 
@@ -83,19 +124,19 @@ async def check_availability(
     location: Optional[str] = None
 ) -> str:
     """
-    Check availability of spaces for a specific date and time.
+    Check space availability for a date (and time slot, for meeting rooms).
 
     Args:
-        space_type: Type of space - 'hot_desk', 'private_office', or 'meeting_room'
-        date: Date in YYYY-MM-DD format, or natural language like 'today', 'tomorrow'
-        start_time: Start time in HH:MM format (24-hour) or '2pm' format. Required for meeting rooms.
-        end_time: End time in HH:MM format (24-hour) or '4pm' format. Optional if duration_hours provided.
-        duration_hours: Duration in hours. Alternative to end_time.
-        attendees: Number of attendees (used to filter by capacity)
-        location: Preferred location - 'KL', 'PJ', 'JB' or full name. Optional.
+        space_type: 'hot_desk', 'private_office', or 'meeting_room'
+        date: YYYY-MM-DD, 'today' or 'tomorrow'
+        start_time: e.g. '14:00' or '2pm'. Required for meeting rooms.
+        end_time: e.g. '16:00' or '4pm'. Or use duration_hours.
+        duration_hours: Alternative to end_time
+        attendees: Minimum capacity
+        location: 'KL', 'PJ', 'JB' or full name
 
     Returns:
-        JSON string with available spaces and time slots for the requested criteria.
+        JSON with available spaces.
     """
     supabase = get_supabase_service()
 
@@ -103,25 +144,20 @@ async def check_availability(
     try:
         booking_date = parse_date(date)
     except ValueError as e:
-        return json.dumps({"error": str(e)})
+        return dumps({"error": str(e)})
 
     # Normalize location
-    location_map = {
-        "kl": "Kuala Lumpur",
-        "pj": "Petaling Jaya",
-        "jb": "Johor Bahru"
-    }
     if location:
-        location = location_map.get(location.lower(), location)
+        location = _LOCATION_ABBREV.get(location.casefold(), location)
 
     # Get spaces matching criteria
-    spaces = await supabase.get_spaces(
+    spaces = await supabase.get_spaces_cached(
         space_type=space_type,
         location=location
     )
 
     if not spaces:
-        return json.dumps({
+        return dumps({
             "available": False,
             "message": f"No {space_type.replace('_', ' ')}s found" +
                       (f" in {location}" if location else "") + "."
@@ -131,7 +167,7 @@ async def check_availability(
     if attendees:
         spaces = [s for s in spaces if s["capacity"] >= attendees]
         if not spaces:
-            return json.dumps({
+            return dumps({
                 "available": False,
                 "message": f"No spaces found with capacity for {attendees} attendees."
             })
@@ -150,14 +186,15 @@ async def check_availability(
             # Default to 1 hour
             end_datetime = start_datetime + timedelta(hours=1)
 
+        booked_ids = await supabase.get_booked_space_ids(
+            [space["id"] for space in spaces],
+            start_datetime,
+            end_datetime
+        )
+
         available_spaces = []
         for space in spaces:
-            is_available = await supabase.check_space_availability(
-                space["id"],
-                start_datetime,
-                end_datetime
-            )
-            if is_available:
+            if space["id"] not in booked_ids:
                 # Calculate price
                 hours = (end_datetime - start_datetime).total_seconds() / 3600
                 price = float(space["hourly_rate"]) * hours if space.get("hourly_rate") else 0
@@ -174,33 +211,24 @@ async def check_availability(
                 })
 
         if not available_spaces:
-            return json.dumps({
+            return dumps({
                 "available": False,
-                "message": f"No meeting rooms available on {booking_date.strftime('%B %d, %Y')} "
-                          f"from {start_datetime.strftime('%I:%M %p')} to {end_datetime.strftime('%I:%M %p')}.",
+                "message": f"No meeting rooms available on {booking_date.strftime(_DATE_FMT)} "
+                          f"from {start_datetime.strftime(_TIME_FMT)} to {end_datetime.strftime(_TIME_FMT)}.",
                 "suggestion": "Try a different time or check another location."
             })
 
-        return json.dumps({
+        return dumps({
             "available": True,
-            "date": booking_date.strftime("%Y-%m-%d"),
+            "date": booking_date.date().isoformat(),
             "time_slot": {
-                "start": start_datetime.strftime("%I:%M %p"),
-                "end": end_datetime.strftime("%I:%M %p"),
+                "start": start_datetime.strftime(_TIME_FMT),
+                "end": end_datetime.strftime(_TIME_FMT),
                 "duration_hours": hours
             },
             "spaces": available_spaces,
-            "virtual_tour": {
-                "url": DEFAULT_VIRTUAL_TOUR_URL,
-                "full_url": DEFAULT_VIRTUAL_TOUR_FULL_URL,
-                "lat": DEFAULT_VIRTUAL_TOUR_LAT,
-                "lng": DEFAULT_VIRTUAL_TOUR_LNG,
-                "heading": DEFAULT_VIRTUAL_TOUR_HEADING,
-                "pitch": DEFAULT_VIRTUAL_TOUR_PITCH,
-                "pano_id": DEFAULT_VIRTUAL_TOUR_PANO_ID,
-                "space_name": "Our Meeting Rooms"
-            }
-        }, indent=2)
+            "virtual_tour": {**_DEFAULT_TOUR, "space_name": "Our Meeting Rooms"}
+        })
 
     # For hot desks and private offices, just return available spaces
     available_spaces = []
@@ -222,23 +250,14 @@ async def check_availability(
 
         available_spaces.append(formatted)
 
-    return json.dumps({
+    return dumps({
         "available": True,
-        "date": booking_date.strftime("%Y-%m-%d"),
+        "date": booking_date.date().isoformat(),
         "spaces": available_spaces,
         "note": "Hot desks and private offices are generally available. "
                "Book now to secure your spot.",
-        "virtual_tour": {
-            "url": DEFAULT_VIRTUAL_TOUR_URL,
-            "full_url": DEFAULT_VIRTUAL_TOUR_FULL_URL,
-            "lat": DEFAULT_VIRTUAL_TOUR_LAT,
-            "lng": DEFAULT_VIRTUAL_TOUR_LNG,
-            "heading": DEFAULT_VIRTUAL_TOUR_HEADING,
-            "pitch": DEFAULT_VIRTUAL_TOUR_PITCH,
-            "pano_id": DEFAULT_VIRTUAL_TOUR_PANO_ID,
-            "space_name": "Our Coworking Spaces"
-        }
-    }, indent=2)
+        "virtual_tour": {**_DEFAULT_TOUR, "space_name": "Our Coworking Spaces"}
+    })
 
 
 @tool
@@ -262,59 +281,50 @@ async def get_available_time_slots(
     try:
         booking_date = parse_date(date)
     except ValueError as e:
-        return json.dumps({"error": str(e)})
+        return dumps({"error": str(e)})
 
     # Get space details
-    space = await supabase.get_space_by_id(space_id)
+    space = await supabase.get_space_by_id_cached(space_id)
     if not space:
-        return json.dumps({"error": f"Space not found: {space_id}"})
+        return dumps({"error": f"Space not found: {space_id}"})
 
     # Business hours: 8 AM to 10 PM
     business_start = 8
     business_end = 22
 
-    # Get existing bookings for the day
-    day_start = booking_date.replace(hour=0, minute=0, second=0)
-    day_end = booking_date.replace(hour=23, minute=59, second=59)
+    # Get existing bookings that overlap the day
+    day_start = booking_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_end = day_start + timedelta(days=1)
     bookings = await supabase.get_bookings_for_space(space_id, day_start, day_end)
 
-    # Build list of booked hours
+    # Build list of booked hours: every hour a booking touches on this day, in one
+    # range per booking. Bookings are clamped to the day so multi-day and overnight
+    # bookings block the right hours (day_end maps to hour 24).
     booked_hours = set()
     for booking in bookings:
-        start = datetime.fromisoformat(booking["start_time"].replace("Z", "+00:00"))
-        end = datetime.fromisoformat(booking["end_time"].replace("Z", "+00:00"))
-        current = start
-        while current < end:
-            booked_hours.add(current.hour)
-            current += timedelta(hours=1)
-
-    # Generate available slots
-    available_slots = []
-    for hour in range(business_start, business_end):
-        if hour not in booked_hours:
-            slot_start = booking_date.replace(hour=hour, minute=0)
-            slot_end = booking_date.replace(hour=hour + 1, minute=0)
-            available_slots.append({
-                "start_time": slot_start.strftime("%I:%M %p"),
-                "end_time": slot_end.strftime("%I:%M %p"),
-                "available": True
-            })
+        start = max(datetime.fromisoformat(booking["start_time"]).replace(tzinfo=None), day_start)
+        end = min(datetime.fromisoformat(booking["end_time"]).replace(tzinfo=None), day_end)
+        if start >= end:
+            continue
+        booked_hours.update(range(start.hour, math.ceil((end - day_start) / _ONE_HOUR)))
+
+    # Generate available slots from the precomputed hour labels
+    available_slots = [
+        {
+            "start_time": _HOUR_LABELS[hour],
+            "end_time": _HOUR_LABELS[(hour + 1) % 24],
+            "available": True
+        }
+        for hour in range(business_start, business_end)
+        if hour not in booked_hours
+    ]
 
-    return json.dumps({
+    return dumps({
         "space_id": space_id,
         "space_name": space["name"],
-        "date": booking_date.strftime("%Y-%m-%d"),
+        "date": booking_date.date().isoformat(),
         "business_hours": f"{business_start}:00 AM - {business_end % 12 or 12}:00 PM",
         "available_slots": available_slots,
         "total_available": len(available_slots),
-        "virtual_tour": {
-            "url": DEFAULT_VIRTUAL_TOUR_URL,
-            "full_url": DEFAULT_VIRTUAL_TOUR_FULL_URL,
-            "lat": DEFAULT_VIRTUAL_TOUR_LAT,
-            "lng": DEFAULT_VIRTUAL_TOUR_LNG,
-            "heading": DEFAULT_VIRTUAL_TOUR_HEADING,
-            "pitch": DEFAULT_VIRTUAL_TOUR_PITCH,
-            "pano_id": DEFAULT_VIRTUAL_TOUR_PANO_ID,
-            "space_name": space["name"]
-        }
-    }, indent=2)
+        "virtual_tour": {**_DEFAULT_TOUR, "space_name": space["name"]}
+    })
@@ -1,60 +1,41 @@
 """Agent tools for creating and managing bookings."""
-import json
-from datetime import datetime, timedelta
+import uuid
+import zlib
+import asyncio
+from datetime import datetime
+from functools import lru_cache
 from typing import Optional
-from uuid import UUID
 from langchain_core.tools import tool
 
+from app.agent.tools.availability import LOCAL_TZ, parse_date, parse_time
+from app.utils.ids import is_uuid
+from app.utils.json import dumps
 from app.services.supabase import get_supabase_service
+from app.services.stripe_prices import get_stripe_price_cache
 from app.config import get_settings
 
 settings = get_settings()
 
+# Display formats for tool responses
+_DATE_FMT = "%B %d, %Y"
+_TIME_FMT = "%I:%M %p"
+_DATETIME_FMT = "%B %d, %Y at %I:%M %p"
+_SLOT_FMT = "%Y-%m-%d %I:%M %p"
 
-def parse_datetime(date_str: str, time_str: str) -> datetime:
-    """Parse date and time strings into datetime."""
-    # Parse date
-    date_formats = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"]
-    booking_date = None
+# Price for a space by duration type; None when the space has no such rate
+_PRICE_FN = {
+    "hourly": lambda space, hours: float(space["hourly_rate"]) * hours if space.get("hourly_rate") else None,
+    "daily": lambda space, hours: float(space["daily_rate"]) if space.get("daily_rate") else None,
+    "monthly": lambda space, hours: float(space["monthly_rate"]) if space.get("monthly_rate") else None,
+}
 
-    lower = date_str.lower()
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-
-    if lower == "today":
-        booking_date = today
-    elif lower == "tomorrow":
-        booking_date = today + timedelta(days=1)
-    else:
-        for fmt in date_formats:
-            try:
-                booking_date = datetime.strptime(date_str, fmt)
-                break
-            except ValueError:
-                continue
-
-    if not booking_date:
-        raise ValueError(f"Could not parse date: {date_str}")
-
-    # Parse time
-    time_str = time_str.strip().upper()
-    if ":" in time_str:
-        parts = time_str.replace("AM", "").replace("PM", "").strip().split(":")
-        hour = int(parts[0])
-        minute = int(parts[1]) if len(parts) > 1 else 0
-        if "PM" in time_str and hour < 12:
-            hour += 12
-        elif "AM" in time_str and hour == 12:
-            hour = 0
-    else:
-        time_clean = time_str.replace("AM", "").replace("PM", "").strip()
-        hour = int(time_clean)
-        minute = 0
-        if "PM" in time_str and hour < 12:
-            hour += 12
-        elif "AM" in time_str and hour == 12:
-            hour = 0
-
-    return booking_date.replace(hour=hour, minute=minute)
+def parse_datetime(date_str: str, time_str: str, now: Optional[datetime] = None) -> datetime:
+    """Parse date and time strings into datetime; relative dates resolve against `now`."""
+    # Shares the availability parsers: relative dates, ISO via the C parser,
+    # and a single cached regex match for the time
+    hour, minute = parse_time(time_str)
+    today = now.date() if now else None
+    return parse_date(date_str, today).replace(hour=hour, minute=minute)
 
 
 @tool
@@ -87,67 +68,73 @@ async def create_booking(
     supabase = get_supabase_service()
 
     # Validate UUID inputs early so we don't send bad values to the DB
-    try:
-        UUID(space_id)
-    except Exception:
-        return json.dumps({
+    if not is_uuid(space_id):
+        return dumps({
             "error": "Invalid space_id format; expected a UUID.",
             "hint": "Use the space id from availability results (e.g., 123e4567-e89b-12d3-a456-426614174000).",
             "received": space_id
         })
 
-    try:
-        UUID(user_id)
-    except Exception:
-        return json.dumps({
+    if not is_uuid(user_id):
+        return dumps({
             "error": "Invalid user_id format; expected a UUID.",
             "received": user_id
         })
 
+    # One clock read for the whole call: wall-clock time in the business timezone,
+    # used both to resolve "today"/"tomorrow" and for the past-booking check
+    now = datetime.now(LOCAL_TZ).replace(tzinfo=None)
+
     # Parse datetimes
     try:
-        start_datetime = parse_datetime(date, start_time)
-        end_datetime = parse_datetime(date, end_time)
+        start_datetime = parse_datetime(date, start_time, now)
+        end_datetime = parse_datetime(date, end_time, now)
     except ValueError as e:
-        return json.dumps({"error": str(e)})
+        return dumps({"error": str(e)})
 
     # Validate that booking is not in the past
-    now = datetime.now()
     if start_datetime < now:
-        return json.dumps({
+        return dumps({
             "error": "Cannot book in the past",
-            "requested_time": start_datetime.strftime("%B %d, %Y at %I:%M %p"),
-            "current_time": now.strftime("%B %d, %Y at %I:%M %p"),
+            "requested_time": start_datetime.strftime(_DATETIME_FMT),
+            "current_time": now.strftime(_DATETIME_FMT),
             "suggestion": "Please choose a date and time in the future. Use 'today' or 'tomorrow' for quick booking."
         })
 
     # Validate times
     if end_datetime <= start_datetime:
-        return json.dumps({
+        return dumps({
             "error": "End time must be after start time",
             "start": start_datetime.isoformat(),
             "end": end_datetime.isoformat()
         })
 
-    # Get space details for pricing
-    space = await supabase.get_space_by_id(space_id)
+    # Space details (for pricing), availability and any earlier attempt at this exact
+    # booking are independent lookups; run them together. An unknown space simply has
+    # no bookings, so the not-found check below still wins.
+    space, is_available, existing = await asyncio.gather(
+        supabase.get_space_by_id_cached(space_id),
+        supabase.check_space_availability(space_id, start_datetime, end_datetime),
+        supabase.get_pending_booking_for_slot(user_id, space_id, start_datetime, end_datetime),
+    )
     if not space:
-        return json.dumps({
+        return dumps({
             "error": f"Space not found: {space_id}",
             "hint": "Use the space id returned from the availability check."
         })
 
-    # Check availability
-    is_available = await supabase.check_space_availability(
-        space_id, start_datetime, end_datetime
-    )
+    if existing:
+        # A retried call (agent or tool retry) gets the booking and payment link it
+        # already created rather than a second booking and PaymentLink
+        return dumps(await _existing_booking_response(existing, space, start_datetime, end_datetime))
+
     if not is_available:
-        return json.dumps({
+        return dumps({
             "error": "Space is not available for the requested time slot",
             "space": space["name"],
             "requested_time": {
-                "start": start_datetime.strftime("%Y-%m-%d %I:%M %p"),
-                "end": end_datetime.strftime("%Y-%m-%d %I:%M %p")
+                "start": start_datetime.strftime(_SLOT_FMT),
+                "end": end_datetime.strftime(_SLOT_FMT)
             },
             "suggestion": "Please try a different time or choose another space."
         })
@@ -155,81 +142,65 @@ async def create_booking(
     # Calculate total amount
     duration_hours = (end_datetime - start_datetime).total_seconds() / 3600
 
-    if duration_type == "hourly" and space.get("hourly_rate"):
-        total_amount = float(space["hourly_rate"]) * duration_hours
-    elif duration_type == "daily" and space.get("daily_rate"):
-        total_amount = float(space["daily_rate"])
-    elif duration_type == "monthly" and space.get("monthly_rate"):
-        total_amount = float(space["monthly_rate"])
-    else:
-        # Default to hourly calculation
-        if space.get("hourly_rate"):
-            total_amount = float(space["hourly_rate"]) * duration_hours
-        elif space.get("daily_rate"):
-            total_amount = float(space["daily_rate"])
-        else:
-            return json.dumps({
-                "error": "Could not determine pricing for this space and duration type",
-                "space": space["name"],
-                "duration_type": duration_type
-            })
-
-    # Create the booking
-    try:
-        booking = await supabase.create_booking(
-            user_id=user_id,
-            space_id=space_id,
-            start_time=start_datetime,
-            end_time=end_datetime,
-            duration_type=duration_type,
-            total_amount=total_amount,
-            attendees_count=attendees_count,
-            notes=notes
-        )
-    except Exception as exc:
-        # Surface Supabase errors clearly to aid debugging (e.g., RLS/permission issues)
-        return json.dumps({
-            "error": "Failed to create booking",
-            "details": str(exc),
-            "hint": "Ensure SUPABASE_SERVICE_KEY is a service_role key and RLS allows inserts into bookings."
+    # Requested duration type first, then fall back to hourly, then daily
+    price_fn = _PRICE_FN.get(duration_type)
+    total_amount = (
+        (price_fn and price_fn(space, duration_hours))
+        or _PRICE_FN["hourly"](space, duration_hours)
+        or _PRICE_FN["daily"](space, duration_hours)
+    )
+    if not total_amount:
+        return dumps({
+            "error": "Could not determine pricing for this space and duration type",
+            "space": space["name"],
+            "duration_type": duration_type
         })
 
-    if not booking:
-        return json.dumps({"error": "Failed to create booking"})
-
-    payment_link = None
-    payment_error = None
-    payment_metadata = None
+    # The booking ID is generated here rather than by the database so the Stripe
+    # payment link (which embeds it) can be created while the booking row is inserted
+    booking_id = str(uuid.uuid4())
+    amount_cents = int(round(total_amount * 100))
 
-    def _create_payment_link_sync():
-        """Create the Stripe price + payment link synchronously (run in a thread)."""
+    async def _create_payment_link():
+        """Create the Stripe price (unless cached) + payment link."""
         import stripe  # type: ignore
 
         stripe.api_key = settings.STRIPE_SECRET_KEY
-        amount_cents = int(round(total_amount * 100))
-
-        price = stripe.Price.create(
-            currency="myr",
-            unit_amount=amount_cents,
-            product_data={
-                "name": f"{space['name']} booking"
-            },
-            metadata={
-                "space_id": space_id,
-                "booking_id": booking["id"]
-            }
-        )
 
-        link = stripe.PaymentLink.create(
-            line_items=[{"price": price.id, "quantity": 1}],
+        price_cache = get_stripe_price_cache()
+        cached_price = await price_cache.get(space_id, amount_cents)
+        if cached_price:
+            price_id = cached_price["price_id"]
+            product_id = cached_price["product_id"]
+        else:
+            # Prices are shared across bookings of the same space/amount, so only
+            # booking-independent metadata goes here; the link carries booking_id
+            price = await stripe.Price.create_async(
+                currency="myr",
+                unit_amount=amount_cents,
+                product_data={
+                    "name": f"{space['name']} booking"
+                },
+                metadata={
+                    "space_id": space_id
+                },
+                # Concurrent cache misses for the same space/amount (e.g. across workers)
+                # resolve to one Price; the name is part of the key since it is a parameter
+                idempotency_key=f"price-{space_id}-{amount_cents}-myr-{zlib.crc32(space['name'].encode())}"
+            )
+            price_id = price.id
+            product_id = price.product
+
+        link_request = stripe.PaymentLink.create_async(
+            line_items=[{"price": price_id, "quantity": 1}],
             metadata={
-                "booking_id": booking["id"],
+                "booking_id": booking_id,
                 "user_id": user_id
             },
             payment_intent_data={
                 # Ensure the webhook receives booking/user context
                 "metadata": {
-                    "booking_id": booking["id"],
+                    "booking_id": booking_id,
                     "user_id": user_id,
                     "space_id": space_id,
                 }
@@ -238,69 +209,112 @@ async def create_booking(
                 "type": "redirect",
                 "redirect": {
                     # Return with a success hint for the UI to show the assistant state
-                    "url": f"{settings.FRONTEND_URL}/?payment_status=success&booking_id={booking['id']}"
+                    "url": f"{settings.FRONTEND_URL}/?payment_status=success&booking_id={booking_id}"
                 }
             }
         )
+        if cached_price:
+            link = await link_request
+        else:
+            # Caching the new price overlaps with the PaymentLink round-trip
+            link, _ = await asyncio.gather(
+                link_request,
+                price_cache.set(space_id, amount_cents, price_id, product_id),
+            )
 
-        return price, link
+        return price_id, product_id, link
 
-    # Create a Stripe payment link in a background thread with a hard timeout to avoid hanging the agent
-    if settings.STRIPE_SECRET_KEY:
+    async def _record_payment(link_id: str):
+        """Record the pending payment in Supabase (best-effort)."""
         try:
-            import asyncio
-            import stripe  # type: ignore
+            await supabase.create_payment_record(
+                user_id=user_id,
+                booking_id=booking_id,
+                amount=total_amount,
+                payment_status="pending",
+                payment_provider="stripe",
+                transaction_id=link_id
+            )
+        except Exception as exc:
+            print(f"Warning: Failed to create payment record: {exc}")
 
-            async def _run_with_timeout():
-                return await asyncio.wait_for(
-                    asyncio.to_thread(_create_payment_link_sync),
-                    timeout=12  # seconds
-                )
-
-            price, link = await _run_with_timeout()
-
-            payment_link = link.url
-            payment_metadata = {
-                "payment_link_id": link.id,
-                "price_id": price.id,
-                "product_id": price.product,
-                "amount_cents": int(round(total_amount * 100)),
-                "currency": "myr"
-            }
+    async def _create_payment_link_with_timeout():
+        # Hard timeout to avoid hanging the agent
+        return await asyncio.wait_for(_create_payment_link(), timeout=12)  # seconds
 
-            # Record the pending payment in Supabase (best-effort, non-blocking)
-            try:
-                await supabase.create_payment_record(
-                    user_id=user_id,
-                    booking_id=booking["id"],
-                    amount=total_amount,
-                    payment_status="pending",
-                    payment_provider="stripe",
-                    transaction_id=link.id
-                )
-            except Exception as exc:
-                print(f"Warning: Failed to create payment record: {exc}")
+    async def _deactivate_payment_link(link_id: str):
+        """Disable a payment link whose booking could not be saved (best-effort)."""
+        try:
+            import stripe  # type: ignore
 
+            await stripe.PaymentLink.modify_async(link_id, active=False)
         except Exception as exc:
-            payment_error = f"Failed to create payment link: {exc}"
-            print(f"Warning: {payment_error}")
+            print(f"Warning: Failed to deactivate orphaned payment link {link_id}: {exc}")
+
+    insert_booking = supabase.create_booking(
+        user_id=user_id,
+        space_id=space_id,
+        start_time=start_datetime,
+        end_time=end_datetime,
+        duration_type=duration_type,
+        total_amount=total_amount,
+        attendees_count=attendees_count,
+        notes=notes,
+        booking_id=booking_id
+    )
+    link_result = None
+    if settings.STRIPE_SECRET_KEY:
+        booking, link_result = await asyncio.gather(
+            insert_booking,
+            _create_payment_link_with_timeout(),
+            return_exceptions=True,
+        )
+    else:
+        try:
+            booking = await insert_booking
+        except Exception as exc:
+            booking = exc
+
+    if not booking or isinstance(booking, BaseException):
+        if link_result is not None and not isinstance(link_result, BaseException):
+            # Failure path, so just wait: an orphaned link must not stay payable
+            await _deactivate_payment_link(link_result[2].id)
+        if not booking:
+            return dumps({"error": "Failed to create booking"})
+        # Surface Supabase errors clearly to aid debugging (e.g., RLS/permission issues)
+        return dumps({
+            "error": "Failed to create booking",
+            "details": str(booking),
+            "hint": "Ensure SUPABASE_SERVICE_KEY is a service_role key and RLS allows inserts into bookings."
+        })
+
+    payment_link = None
+    payment_error = None
+    payment_metadata = None
+
+    if isinstance(link_result, BaseException):
+        payment_error = f"Failed to create payment link: {link_result}"
+        print(f"Warning: {payment_error}")
+    elif link_result is not None:
+        price_id, product_id, link = link_result
+        payment_link = link.url
+        payment_metadata = {
+            "payment_link_id": link.id,
+            "price_id": price_id,
+            "product_id": product_id,
+            "amount_cents": amount_cents,
+            "currency": "myr"
+        }
+
+        # Awaited, not detached: reconcile, confirmation and the email idempotency
+        # check all rely on this row
+        await _record_payment(link.id)
 
     response_payload = {
         "success": True,
-        "booking": {
-            "id": booking["id"],
-            "space_name": space["name"],
-            "space_type": space["type"],
-            "location": space["location"],
-            "date": start_datetime.strftime("%B %d, %Y"),
-            "start_time": start_datetime.strftime("%I:%M %p"),
-            "end_time": end_datetime.strftime("%I:%M %p"),
-            "duration_hours": duration_hours,
-            "attendees": attendees_count,
-            "total_amount": total_amount,
-            "currency": "MYR",
-            "status": "pending"
-        },
+        "booking": _pending_booking_details(
+            booking["id"], space, start_datetime, end_datetime, attendees_count, total_amount
+        ),
         "message": "Booking created successfully. Please complete payment to confirm.",
         "next_step": "payment_required",
         "payment_link": payment_link,
@@ -315,7 +329,103 @@ async def create_booking(
             "Please contact support or try again."
         )
 
-    return json.dumps(response_payload, indent=2)
+    return dumps(response_payload)
+
+
+def _pending_booking_details(
+    booking_id: str,
+    space: dict,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    attendees_count: int,
+    total_amount: float
+) -> dict:
+    """Shape a newly created (pending) booking for the agent."""
+    return {
+        "id": booking_id,
+        "space_name": space["name"],
+        "space_type": space["type"],
+        "location": space["location"],
+        "date": start_datetime.strftime(_DATE_FMT),
+        "start_time": start_datetime.strftime(_TIME_FMT),
+        "end_time": end_datetime.strftime(_TIME_FMT),
+        "duration_hours": (end_datetime - start_datetime).total_seconds() / 3600,
+        "attendees": attendees_count,
+        "total_amount": total_amount,
+        "currency": "MYR",
+        "status": "pending"
+    }
+
+
+async def _existing_booking_response(
+    booking: dict,
+    space: dict,
+    start_datetime: datetime,
+    end_datetime: datetime
+) -> dict:
+    """Build the create_booking response for a pending booking made by an earlier call."""
+    payment_link = None
+    payment = await get_supabase_service().get_payment_by_booking(booking["id"])
+    link_id = payment and payment.get("transaction_id")
+    if link_id and settings.STRIPE_SECRET_KEY:
+        try:
+            import stripe  # type: ignore
+
+            stripe.api_key = settings.STRIPE_SECRET_KEY
+            link = await stripe.PaymentLink.retrieve_async(link_id)
+            if link.active:
+                payment_link = link.url
+        except Exception as exc:
+            print(f"Warning: Failed to retrieve payment link {link_id}: {exc}")
+
+    response_payload = {
+        "success": True,
+        "booking": _pending_booking_details(
+            booking["id"],
+            space,
+            start_datetime,
+            end_datetime,
+            booking.get("attendees_count", 1),
+            float(booking["total_amount"]),
+        ),
+        "message": "This booking already exists and is awaiting payment.",
+        "next_step": "payment_required",
+        "payment_link": payment_link,
+        "payment_provider": "stripe" if payment_link else None,
+    }
+    if not payment_link:
+        response_payload["message"] = (
+            "This booking already exists and is awaiting payment, but its payment link "
+            "is not available. Please contact support."
+        )
+    return response_payload
+
+
+@lru_cache(maxsize=4096)
+def _fmt_rm(amount: float) -> str:
+    """Format an amount as ringgit; amounts repeat (rate x hours), so memoize."""
+    return f"RM{amount:.2f}"
+
+
+def _format_booking(booking: dict) -> dict:
+    """Shape one bookings row (with embedded space) for the agent."""
+    space = booking.get("spaces") or {}
+    # Python 3.11+ fromisoformat accepts the trailing "Z" Supabase may return
+    start = datetime.fromisoformat(booking["start_time"])
+    end = datetime.fromisoformat(booking["end_time"])
+
+    return {
+        "id": booking["id"],
+        "space_name": space.get("name", "Unknown"),
+        "space_type": space.get("type", "Unknown"),
+        "location": space.get("location", "Unknown"),
+        "date": start.strftime(_DATE_FMT),
+        "start_time": start.strftime(_TIME_FMT),
+        "end_time": end.strftime(_TIME_FMT),
+        "status": booking["status"],
+        "total_amount": _fmt_rm(booking["total_amount"]),
+        "attendees": booking["attendees_count"]
+    }
 
 
 @tool
@@ -345,34 +455,17 @@ async def get_user_bookings(
     )
 
     if not bookings:
-        return json.dumps({
+        return dumps({
             "message": "No bookings found.",
             "bookings": []
         })
 
-    formatted_bookings = []
-    for booking in bookings:
-        space = booking.get("spaces", {})
-        start = datetime.fromisoformat(booking["start_time"].replace("Z", "+00:00"))
-        end = datetime.fromisoformat(booking["end_time"].replace("Z", "+00:00"))
-
-        formatted_bookings.append({
-            "id": booking["id"],
-            "space_name": space.get("name", "Unknown"),
-            "space_type": space.get("type", "Unknown"),
-            "location": space.get("location", "Unknown"),
-            "date": start.strftime("%B %d, %Y"),
-            "start_time": start.strftime("%I:%M %p"),
-            "end_time": end.strftime("%I:%M %p"),
-            "status": booking["status"],
-            "total_amount": f"RM{booking['total_amount']:.2f}",
-            "attendees": booking["attendees_count"]
-        })
+    formatted_bookings = [_format_booking(booking) for booking in bookings]
 
-    return json.dumps({
+    return dumps({
         "total": len(formatted_bookings),
         "bookings": formatted_bookings
-    }, indent=2)
+    })
 
 
 @tool
@@ -395,27 +488,27 @@ async def cancel_booking(
     # Get booking details first
     booking = await supabase.get_booking_by_id(booking_id)
     if not booking:
-        return json.dumps({
+        return dumps({
             "success": False,
             "error": f"Booking not found: {booking_id}"
         })
 
     # Check if booking belongs to user
     if booking["user_id"] != user_id:
-        return json.dumps({
+        return dumps({
             "success": False,
             "error": "You can only cancel your own bookings."
         })
 
     # Check if booking can be cancelled
     if booking["status"] == "cancelled":
-        return json.dumps({
+        return dumps({
             "success": False,
             "error": "This booking is already cancelled."
         })
 
     if booking["status"] == "completed":
-        return json.dumps({
+        return dumps({
             "success": False,
             "error": "Cannot cancel a completed booking."
         })
@@ -424,22 +517,22 @@ async def cancel_booking(
     success = await supabase.cancel_booking(booking_id, user_id)
 
     if success:
-        space = booking.get("spaces", {})
-        start = datetime.fromisoformat(booking["start_time"].replace("Z", "+00:00"))
+        space = booking.get("spaces") or {}
+        start = datetime.fromisoformat(booking["start_time"])
 
-        return json.dumps({
+        return dumps({
             "success": True,
             "message": "Booking cancelled successfully.",
             "cancelled_booking": {
                 "id": booking_id,
                 "space": space.get("name", "Unknown"),
-                "date": start.strftime("%B %d, %Y"),
-                "time": start.strftime("%I:%M %p")
+                "date": start.strftime(_DATE_FMT),
+                "time": start.strftime(_TIME_FMT)
             },
             "note": "If you made a payment, a refund will be processed within 5-7 business days."
         })
     else:
-        return json.dumps({
+        return dumps({
             "success": False,
             "error": "Failed to cancel booking. Please try again or contact support."
         })
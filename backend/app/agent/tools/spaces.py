@@ -1,8 +1,9 @@
 """Agent tools for querying coworking spaces."""
-import json
+from types import MappingProxyType
 from typing import Optional
 from langchain_core.tools import tool
 
+from app.utils.json import dumps
 from app.services.supabase import get_supabase_service
 
 # Default virtual tour URLs (embeddable and full Google Maps Street View)
@@ -15,6 +16,24 @@ DEFAULT_VIRTUAL_TOUR_HEADING = 257.43
 DEFAULT_VIRTUAL_TOUR_PITCH = 76.38
 DEFAULT_VIRTUAL_TOUR_PANO_ID = "CIHM0ogKEICAgIC4s9fTwwE"
 
+# Shared virtual tour payload, built once; responses only add the space_name
+_DEFAULT_TOUR = MappingProxyType({
+    "url": DEFAULT_VIRTUAL_TOUR_URL,
+    "full_url": DEFAULT_VIRTUAL_TOUR_FULL_URL,
+    "lat": DEFAULT_VIRTUAL_TOUR_LAT,
+    "lng": DEFAULT_VIRTUAL_TOUR_LNG,
+    "heading": DEFAULT_VIRTUAL_TOUR_HEADING,
+    "pitch": DEFAULT_VIRTUAL_TOUR_PITCH,
+    "pano_id": DEFAULT_VIRTUAL_TOUR_PANO_ID,
+})
+
+# Location abbreviations accepted from users -> stored location names
+_LOCATION_ABBREV = MappingProxyType({
+    "kl": "Kuala Lumpur",
+    "pj": "Petaling Jaya",
+    "jb": "Johor Bahru",
+})
+
 
 @tool
 async def get_spaces_info(
@@ -38,21 +57,16 @@ async def get_spaces_info(
     supabase = get_supabase_service()
 
     # Normalize location abbreviations
-    location_map = {
-        "kl": "Kuala Lumpur",
-        "pj": "Petaling Jaya",
-        "jb": "Johor Bahru"
-    }
     if location:
-        location = location_map.get(location.lower(), location)
+        location = _LOCATION_ABBREV.get(location.casefold(), location)
 
-    spaces = await supabase.get_spaces(
+    spaces = await supabase.get_spaces_cached(
         space_type=space_type,
         location=location
     )
 
     if not spaces:
-        return json.dumps({
+        return dumps({
             "message": "No spaces found matching your criteria.",
             "spaces": []
         })
@@ -83,21 +97,12 @@ async def get_spaces_info(
 
         formatted_spaces.append(formatted)
 
-    return json.dumps({
+    return dumps({
         "total": len(formatted_spaces),
         "spaces": formatted_spaces,
-        "virtual_tour": {
-            "url": DEFAULT_VIRTUAL_TOUR_URL,
-            "full_url": DEFAULT_VIRTUAL_TOUR_FULL_URL,
-            "lat": DEFAULT_VIRTUAL_TOUR_LAT,
-            "lng": DEFAULT_VIRTUAL_TOUR_LNG,
-            "heading": DEFAULT_VIRTUAL_TOUR_HEADING,
-            "pitch": DEFAULT_VIRTUAL_TOUR_PITCH,
-            "pano_id": DEFAULT_VIRTUAL_TOUR_PANO_ID,
-            "space_name": "Our Coworking Spaces"
-        },
+        "virtual_tour": {**_DEFAULT_TOUR, "space_name": "Our Coworking Spaces"},
         "message": "Here are the available spaces. Click the virtual tour button to explore our facilities!"
-    }, indent=2)
+    })
 
 
 @tool
@@ -112,15 +117,15 @@ async def get_space_details(space_id: str) -> str:
         JSON string with full space details including all rates and amenities.
     """
     supabase = get_supabase_service()
-    space = await supabase.get_space_by_id(space_id)
+    space = await supabase.get_space_by_id_cached(space_id)
 
     if not space:
-        return json.dumps({
+        return dumps({
             "error": "Space not found",
             "message": f"No space found with ID: {space_id}"
         })
 
-    return json.dumps({
+    return dumps({
         "id": space["id"],
         "name": space["name"],
         "type": space["type"],
@@ -133,17 +138,50 @@ async def get_space_details(space_id: str) -> str:
         "floor": space.get("floor", ""),
         "amenities": space.get("amenities", []),
         "is_active": space["is_active"],
-        "virtual_tour": {
-            "url": DEFAULT_VIRTUAL_TOUR_URL,
-            "full_url": DEFAULT_VIRTUAL_TOUR_FULL_URL,
-            "lat": DEFAULT_VIRTUAL_TOUR_LAT,
-            "lng": DEFAULT_VIRTUAL_TOUR_LNG,
-            "heading": DEFAULT_VIRTUAL_TOUR_HEADING,
-            "pitch": DEFAULT_VIRTUAL_TOUR_PITCH,
-            "pano_id": DEFAULT_VIRTUAL_TOUR_PANO_ID,
-            "space_name": space["name"]
-        }
-    }, indent=2)
+        "virtual_tour": {**_DEFAULT_TOUR, "space_name": space["name"]}
+    })
+
+
+# Pricing is static, so the tool response is serialized once at import
+_PRICING_INFO = {
+    "hot_desk": {
+        "description": "Flexible workspace in our open area with ergonomic seating",
+        "pricing": {
+            "daily": "RM45-50/day (depending on location)",
+            "monthly": "RM700-800/month (depending on location)"
+        },
+        "includes": ["WiFi", "Power outlets", "Locker", "Coffee/Tea"]
+    },
+    "meeting_room": {
+        "description": "Professional meeting rooms with AV equipment",
+        "pricing": {
+            "hourly": "RM40-120/hour (depending on size)",
+            "daily": "RM250-750/day (depending on size)"
+        },
+        "capacity_options": "4-16 people",
+        "includes": ["WiFi", "TV/Projector", "Whiteboard", "Video conferencing"]
+    },
+    "private_office": {
+        "description": "Fully furnished private offices for teams",
+        "pricing": {
+            "monthly": "RM1,800-4,500/month (depending on size and location)"
+        },
+        "capacity_options": "3-8 people",
+        "includes": ["WiFi", "AC", "24/7 Access", "Lockable door", "Mail handling"]
+    },
+    "locations": [
+        {"name": "Kuala Lumpur", "abbreviation": "KL"},
+        {"name": "Petaling Jaya", "abbreviation": "PJ"},
+        {"name": "Johor Bahru", "abbreviation": "JB"}
+    ],
+    "operating_hours": "Monday-Friday: 8:00 AM - 10:00 PM, Saturday: 9:00 AM - 6:00 PM",
+    "contact": {
+        "email": "hello@infinity8.my",
+        "phone": "+60 3-1234-5678"
+    }
+}
+
+_PRICING_RESPONSE: str = dumps(_PRICING_INFO)
 
 
 @tool
@@ -155,42 +193,4 @@ async def get_pricing_info() -> str:
         JSON string with pricing details for hot desks, meeting rooms,
         and private offices across all locations.
     """
-    pricing_info = {
-        "hot_desk": {
-            "description": "Flexible workspace in our open area with ergonomic seating",
-            "pricing": {
-                "daily": "RM45-50/day (depending on location)",
-                "monthly": "RM700-800/month (depending on location)"
-            },
-            "includes": ["WiFi", "Power outlets", "Locker", "Coffee/Tea"]
-        },
-        "meeting_room": {
-            "description": "Professional meeting rooms with AV equipment",
-            "pricing": {
-                "hourly": "RM40-120/hour (depending on size)",
-                "daily": "RM250-750/day (depending on size)"
-            },
-            "capacity_options": "4-16 people",
-            "includes": ["WiFi", "TV/Projector", "Whiteboard", "Video conferencing"]
-        },
-        "private_office": {
-            "description": "Fully furnished private offices for teams",
-            "pricing": {
-                "monthly": "RM1,800-4,500/month (depending on size and location)"
-            },
-            "capacity_options": "3-8 people",
-            "includes": ["WiFi", "AC", "24/7 Access", "Lockable door", "Mail handling"]
-        },
-        "locations": [
-            {"name": "Kuala Lumpur", "abbreviation": "KL"},
-            {"name": "Petaling Jaya", "abbreviation": "PJ"},
-            {"name": "Johor Bahru", "abbreviation": "JB"}
-        ],
-        "operating_hours": "Monday-Friday: 8:00 AM - 10:00 PM, Saturday: 9:00 AM - 6:00 PM",
-        "contact": {
-            "email": "hello@infinity8.my",
-            "phone": "+60 3-1234-5678"
-        }
-    }
-
-    return json.dumps(pricing_info, indent=2)
+    return _PRICING_RESPONSE
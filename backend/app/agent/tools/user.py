@@ -1,8 +1,9 @@
 """Agent tools for user profile and membership operations."""
-import json
+import asyncio
 from typing import Optional
 from langchain_core.tools import tool
 
+from app.utils.json import dumps
 from app.services.supabase import get_supabase_service
 
 
@@ -19,17 +20,21 @@ async def get_user_profile(user_id: str) -> str:
     """
     supabase = get_supabase_service()
 
-    # Get profile
-    profile = await supabase.get_user_profile(user_id)
+    # Profile and membership live in separate tables; fetch both at once
+    profile, membership = await asyncio.gather(
+        supabase.get_user_profile(user_id),
+        supabase.get_active_membership(user_id),
+        return_exceptions=True,
+    )
+    for result in (profile, membership):
+        if isinstance(result, BaseException):
+            raise result
     if not profile:
-        return json.dumps({
+        return dumps({
             "error": "User profile not found",
             "user_id": user_id
         })
 
-    # Get active membership
-    membership = await supabase.get_active_membership(user_id)
-
     response = {
         "user_id": user_id,
         "full_name": profile.get("full_name", ""),
@@ -57,7 +62,7 @@ async def get_user_profile(user_id: str) -> str:
         response["membership"] = None
         response["membership_message"] = "No active membership. Consider getting a membership plan for better rates!"
 
-    return json.dumps(response, indent=2)
+    return dumps(response)
 
 
 @tool
@@ -75,7 +80,7 @@ async def check_user_payment_setup(user_id: str) -> str:
 
     profile = await supabase.get_user_profile(user_id)
     if not profile:
-        return json.dumps({
+        return dumps({
             "error": "User profile not found",
             "user_id": user_id
         })
@@ -83,12 +88,12 @@ async def check_user_payment_setup(user_id: str) -> str:
     has_stripe = bool(profile.get("stripe_customer_id"))
 
     if has_stripe:
-        return json.dumps({
+        return dumps({
             "payment_setup": True,
             "message": "Your payment method is set up. You can proceed with bookings."
         })
     else:
-        return json.dumps({
+        return dumps({
             "payment_setup": False,
             "message": "You need to set up your payment method before making bookings.",
             "next_step": "create_stripe_customer",
@@ -1,76 +1,92 @@
 """Agent tool for virtual tours of coworking spaces."""
-import json
+import re
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Optional
 from langchain_core.tools import tool
 
+from app.utils.json import dumps
+
 
-# Virtual tour mapping - maps space names/locations to their 360° tour URLs
 # Location: Regus Singapore One Fullerton indoor view (user-provided)
-VIRTUAL_TOURS = {
-    "one_fullerton": {
-        "url": "https://www.google.com/maps/embed?pb=!4v1702100000000!6m8!1m7!1sCIHM0ogKEICAgIC4s9fTwwE!2m2!1d1.2860713!2d103.8539747!3f257.43!4f76.38!5f0.7820865974627469",
-        "full_url": "https://www.google.com/maps/place/Regus+-+Singapore+One+Fullerton/@1.2860713,103.8539747,3a,75y,257.43h,76.38t/data=!3m7!1e1!3m5!1sCIHM0ogKEICAgIC4s9fTwwE!2e10!6shttps:%2F%2Flh3.googleusercontent.com%2Fgpms-cs-s%2FAPRy3c-P0ZKUymI9p4zxpnQEkrFUCOOz9D_nE6oGgKnm0MNNDJzesrRuiAeNFf3Y0coB8e_7SlvkIGBp5-SU4HgFagBY9cGhOfZKVrH_4BymJgkn2ktv3CKAt0XhLyWAcAEsTSJM47p6qg%3Dw900-h600-k-no-pi13.623591235897763-ya267.7302687199337-ro0-fo100!7i13312!8i6656!4m9!3m8!1s0x31da1908e48d020d:0x41d28cd3f47d452f!8m2!3d1.2857163!4d103.8539653!10e5!14m1!1BCgIgARICCAI!16s%2Fg%2F1tglwh4l?entry=ttu&g_ep=EgoyMDI1MTIwMi4wIKXMDSoASAFQAw%3D%3D",
+_ONE_FULLERTON_VIEW = {
+    "url": "https://www.google.com/maps/embed?pb=!4v1702100000000!6m8!1m7!1sCIHM0ogKEICAgIC4s9fTwwE!2m2!1d1.2860713!2d103.8539747!3f257.43!4f76.38!5f0.7820865974627469",
+    "full_url": "https://www.google.com/maps/place/Regus+-+Singapore+One+Fullerton/@1.2860713,103.8539747,3a,75y,257.43h,76.38t/data=!3m7!1e1!3m5!1sCIHM0ogKEICAgIC4s9fTwwE!2e10!6shttps:%2F%2Flh3.googleusercontent.com%2Fgpms-cs-s%2FAPRy3c-P0ZKUymI9p4zxpnQEkrFUCOOz9D_nE6oGgKnm0MNNDJzesrRuiAeNFf3Y0coB8e_7SlvkIGBp5-SU4HgFagBY9cGhOfZKVrH_4BymJgkn2ktv3CKAt0XhLyWAcAEsTSJM47p6qg%3Dw900-h600-k-no-pi13.623591235897763-ya267.7302687199337-ro0-fo100!7i13312!8i6656!4m9!3m8!1s0x31da1908e48d020d:0x41d28cd3f47d452f!8m2!3d1.2857163!4d103.8539653!10e5!14m1!1BCgIgARICCAI!16s%2Fg%2F1tglwh4l?entry=ttu&g_ep=EgoyMDI1MTIwMi4wIKXMDSoASAFQAw%3D%3D",
+    "lat": 1.2860713,
+    "lng": 103.8539747,
+    "heading": 257.43,
+    "pitch": 76.38,
+    "pano_id": "CIHM0ogKEICAgIC4s9fTwwE",
+}
+
+# Virtual tour mapping - maps space names/locations to their 360° tour URLs.
+# Read-only: tours share view data by reference and responses are cached per key.
+VIRTUAL_TOURS = MappingProxyType({
+    "one_fullerton": MappingProxyType({
+        **_ONE_FULLERTON_VIEW,
         "space_name": "One Fullerton Premium Office",
         "location": "Singapore",
         "description": "Premium coworking space with stunning Marina Bay views",
-        "lat": 1.2860713,
-        "lng": 103.8539747,
-        "heading": 257.43,
-        "pitch": 76.38,
-        "pano_id": "CIHM0ogKEICAgIC4s9fTwwE",
-    },
+    }),
     # Default tour for all locations - can be customized per space later
-    "default": {
-        "url": "https://www.google.com/maps/embed?pb=!4v1702100000000!6m8!1m7!1sCIHM0ogKEICAgIC4s9fTwwE!2m2!1d1.2860713!2d103.8539747!3f257.43!4f76.38!5f0.7820865974627469",
-        "full_url": "https://www.google.com/maps/place/Regus+-+Singapore+One+Fullerton/@1.2860713,103.8539747,3a,75y,257.43h,76.38t/data=!3m7!1e1!3m5!1sCIHM0ogKEICAgIC4s9fTwwE!2e10!6shttps:%2F%2Flh3.googleusercontent.com%2Fgpms-cs-s%2FAPRy3c-P0ZKUymI9p4zxpnQEkrFUCOOz9D_nE6oGgKnm0MNNDJzesrRuiAeNFf3Y0coB8e_7SlvkIGBp5-SU4HgFagBY9cGhOfZKVrH_4BymJgkn2ktv3CKAt0XhLyWAcAEsTSJM47p6qg%3Dw900-h600-k-no-pi13.623591235897763-ya267.7302687199337-ro0-fo100!7i13312!8i6656!4m9!3m8!1s0x31da1908e48d020d:0x41d28cd3f47d452f!8m2!3d1.2857163!4d103.8539653!10e5!14m1!1BCgIgARICCAI!16s%2Fg%2F1tglwh4l?entry=ttu&g_ep=EgoyMDI1MTIwMi4wIKXMDSoASAFQAw%3D%3D",
+    "default": MappingProxyType({
+        **_ONE_FULLERTON_VIEW,
         "space_name": "Infinity8 Coworking Space",
         "location": "Various",
         "description": "Modern coworking space with premium amenities",
-        "lat": 1.2860713,
-        "lng": 103.8539747,
-        "heading": 257.43,
-        "pitch": 76.38,
-        "pano_id": "CIHM0ogKEICAgIC4s9fTwwE",
-    },
-}
+    }),
+})
 
 
-@tool
-async def get_virtual_tour(
-    space_name: Optional[str] = None,
-    location: Optional[str] = None
-) -> str:
-    """
-    Get a 360° virtual tour link for a coworking space.
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
 
-    Use this tool when a user:
-    - Asks to see a space or take a virtual tour
-    - Wants to preview a room before booking
-    - Asks "what does the space look like?"
-    - Requests to "see" or "view" a meeting room or office
 
-    Args:
-        space_name: Optional name of the specific space to tour.
-        location: Optional location to filter by (e.g., 'Kuala Lumpur', 'Singapore').
+def _normalize(name: str) -> str:
+    """'One Fullerton - Premium' -> 'one_fullerton_premium'."""
+    return _NON_WORD_RE.sub("_", name.lower()).strip("_")
 
-    Returns:
-        JSON string with virtual tour URL and space details.
-        The frontend will render this as an interactive 360° tour button.
-    """
-    tour_key = "default"
-
-    # Check if we have a specific tour for the requested space/location
-    if space_name:
-        normalized_name = space_name.lower().replace(" ", "_").replace("-", "_")
-        if normalized_name in VIRTUAL_TOURS:
-            tour_key = normalized_name
 
+def _build_tour_aliases() -> tuple[dict[str, str], tuple[str, ...]]:
+    """Map normalized keys, display names and distinctive key words to tour keys."""
+    aliases = {}
+    for key, tour in VIRTUAL_TOURS.items():
+        if key == "default":
+            continue
+        aliases[key] = key
+        aliases[_normalize(tour["space_name"])] = key
+        # Distinctive words from the key ("fullerton"); short ones like "one" are too
+        # ambiguous, and display-name words ("office", "premium") are too generic
+        for token in key.split("_"):
+            if len(token) >= 5:
+                aliases.setdefault(token, key)
+    # Longest first so prefix matching prefers the most specific alias
+    return aliases, tuple(sorted(aliases, key=len, reverse=True))
+
+
+_TOUR_ALIASES, _TOUR_ALIASES_BY_LENGTH = _build_tour_aliases()
+
+
+def _match_tour_key(space_name: str) -> str:
+    """Resolve a free-text space name to a VIRTUAL_TOURS key, or 'default'."""
+    normalized = _normalize(space_name)
+    if normalized in _TOUR_ALIASES:
+        return _TOUR_ALIASES[normalized]
+    # "One Fullerton Premium Office" starts with the "one_fullerton" alias
+    for alias in _TOUR_ALIASES_BY_LENGTH:
+        if normalized.startswith(alias + "_"):
+            return _TOUR_ALIASES[alias]
+    # Any distinctive word in the request, e.g. "the Fullerton office"
+    for token in normalized.split("_"):
+        if token in _TOUR_ALIASES:
+            return _TOUR_ALIASES[token]
+    return "default"
+
+
+@lru_cache(maxsize=256)
+def _tour_response(tour_key: str, display_name: str) -> str:
+    """Serialized get_virtual_tour response; tours are static so each is built once."""
     tour_data = VIRTUAL_TOURS[tour_key]
-
-    # If a specific space name was provided, use that in the response
-    display_name = space_name if space_name else tour_data["space_name"]
-
-    return json.dumps({
+    return dumps({
         "virtual_tour": {
             "url": tour_data["url"],
             "full_url": tour_data.get("full_url", tour_data["url"]),
@@ -83,22 +99,16 @@ async def get_virtual_tour(
         },
         "message": f"Here's a 360° virtual tour of {display_name}. Click the button to explore the space interactively!",
         "description": tour_data["description"]
-    }, indent=2)
+    })
 
 
-@tool
-async def list_available_tours() -> str:
-    """
-    List all available virtual tours for coworking spaces.
+# Warm the cache with each tour under its own name (the no-space_name case)
+for _key, _tour in VIRTUAL_TOURS.items():
+    _tour_response(_key, _tour["space_name"])
 
-    Use this tool when a user asks:
-    - "What tours are available?"
-    - "Which spaces can I tour virtually?"
-    - "Show me all virtual tours"
 
-    Returns:
-        JSON string with list of available virtual tours.
-    """
+def _build_tours_list() -> str:
+    """Serialized list_available_tours response."""
     tours = []
     for key, tour in VIRTUAL_TOURS.items():
         if key != "default":
@@ -117,7 +127,57 @@ async def list_available_tours() -> str:
             "description": default["description"]
         })
 
-    return json.dumps({
+    return dumps({
         "available_tours": tours,
         "message": "Here are the spaces with virtual tours available. Ask me to show you a specific tour!"
-    }, indent=2)
+    })
+
+
+_TOURS_LIST_RESPONSE: str = _build_tours_list()
+
+
+@tool
+async def get_virtual_tour(
+    space_name: Optional[str] = None,
+    location: Optional[str] = None
+) -> str:
+    """
+    Get a 360° virtual tour link for a coworking space.
+
+    Use this tool when a user:
+    - Asks to see a space or take a virtual tour
+    - Wants to preview a room before booking
+    - Asks "what does the space look like?"
+    - Requests to "see" or "view" a meeting room or office
+
+    Args:
+        space_name: Optional name of the specific space to tour.
+        location: Optional location to filter by (e.g., 'Kuala Lumpur', 'Singapore').
+
+    Returns:
+        JSON string with virtual tour URL and space details.
+        The frontend will render this as an interactive 360° tour button.
+    """
+    # Check if we have a specific tour for the requested space/location
+    tour_key = _match_tour_key(space_name) if space_name else "default"
+
+    # If a specific space name was provided, use that in the response
+    display_name = space_name if space_name else VIRTUAL_TOURS[tour_key]["space_name"]
+
+    return _tour_response(tour_key, display_name)
+
+
+@tool
+async def list_available_tours() -> str:
+    """
+    List all available virtual tours for coworking spaces.
+
+    Use this tool when a user asks:
+    - "What tours are available?"
+    - "Which spaces can I tour virtually?"
+    - "Show me all virtual tours"
+
+    Returns:
+        JSON string with list of available virtual tours.
+    """
+    return _TOURS_LIST_RESPONSE
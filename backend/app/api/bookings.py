@@ -1,24 +1,68 @@
 """Booking-related API endpoints."""
 import asyncio
-from datetime import datetime
+import logging
+from datetime import datetime, timezone
 from fastapi import APIRouter, HTTPException
 
 from app.config import get_settings
 from app.services.supabase import get_supabase_service
-from app.services.notifications import send_booking_confirmation_email
+from app.services.email_queue import enqueue_booking_confirmation
+from app.services.stripe_client import stripe, STRIPE_AVAILABLE
+from app.utils.json import FastJSONResponse
+from app.utils.ttl_cache import TTLCache
 
 settings = get_settings()
-router = APIRouter(tags=["bookings"])
+router = APIRouter(tags=["bookings"], default_response_class=FastJSONResponse)
+logger = logging.getLogger(__name__)
 
-# Stripe availability flag
-try:
-    import stripe  # type: ignore
+_RECONCILE_PARALLEL_SEARCH = settings.RECONCILE_PARALLEL_SEARCH
 
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-    STRIPE_AVAILABLE = True
-except Exception:
-    stripe = None  # type: ignore
-    STRIPE_AVAILABLE = False
+# The payment success page polls reconcile; short-lived caches collapse a burst of
+# polls for the same booking into one Stripe lookup
+_session_cache = TTLCache(maxsize=1024, ttl=8)
+_pi_retrieve_cache = TTLCache(maxsize=1024, ttl=8)
+_pi_search_cache = TTLCache(maxsize=1024, ttl=8)
+# Confirmed is final, so the whole response can be reused a little longer
+_confirmed_cache = TTLCache(maxsize=1024, ttl=30)
+# Lookups currently in flight, shared by concurrent requests for the same key
+_inflight: dict[tuple, asyncio.Future] = {}
+
+
+async def _cached_stripe_call(cache: TTLCache, key: tuple, func, *args, **kwargs):
+    """Run a blocking Stripe call in a thread, reusing cached or in-flight results."""
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    result = await asyncio.shield(future)
+    cache.set(key, result)
+    return result
+
+
+async def _first_succeeded_intent(lookups):
+    """
+    Run PaymentIntent lookups together and return (intent, error) for the first that
+    finds one; the remaining lookups are cancelled.
+    """
+    pending = {asyncio.ensure_future(lookup) for lookup in lookups}
+    intent = None
+    error = None
+    while pending and not intent:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            try:
+                intent = intent or task.result()
+            except Exception as exc:
+                error = exc
+    for task in pending:
+        task.cancel()
+    return intent, error
 
 
 @router.get("/bookings/{booking_id}")
@@ -37,6 +81,10 @@ async def reconcile_booking_payment(booking_id: str):
     Fallback reconciliation to confirm a booking if a webhook was missed.
     Searches Stripe PaymentIntents by metadata.booking_id and, if succeeded, marks booking as confirmed.
     """
+    confirmed = _confirmed_cache.get(booking_id)
+    if confirmed is not None:
+        return confirmed
+
     supabase = get_supabase_service()
 
     booking = await supabase.get_booking_by_id(booking_id)
@@ -44,90 +92,128 @@ async def reconcile_booking_payment(booking_id: str):
         raise HTTPException(status_code=404, detail="Booking not found")
 
     if booking.get("status") == "confirmed":
-        return {"status": "confirmed", "booking": booking}
+        response = {"status": "confirmed", "booking": booking}
+        _confirmed_cache.set(booking_id, response)
+        return response
 
     if not STRIPE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Stripe SDK not available for reconciliation")
 
-    # First try to reconcile via the Payment Link the booking used (most reliable for Payment Links)
-    payment_record = await supabase.get_payment_by_booking(booking_id)
-    payment_link_id = payment_record.get("transaction_id") if payment_record else None
-    payment_intent_id = None
+    async def _intent_from_payment_link():
+        """Find a succeeded PaymentIntent via the Payment Link's paid checkout session."""
+        payment_record = await supabase.get_payment_by_booking(booking_id)
+        payment_link_id = payment_record.get("transaction_id") if payment_record else None
+        if not payment_link_id:
+            return None
 
-    if payment_link_id:
         try:
-            sessions = stripe.checkout.Session.list(
+            sessions = await _cached_stripe_call(
+                _session_cache,
+                ("sessions", payment_link_id),
+                stripe.checkout.Session.list,
                 payment_link=payment_link_id,
                 limit=5,
             )
-            paid_session = next(
-                (
-                    session
-                    for session in sessions.data
-                    if getattr(session, "payment_status", "") == "paid"
-                    and session.payment_intent
-                ),
-                None,
-            )
-            if paid_session:
-                payment_intent_id = paid_session.payment_intent
         except Exception as exc:
-            print(f"Stripe checkout session lookup failed for booking {booking_id}: {exc}")
-
-    confirmed_intent = None
+            logger.warning("Stripe checkout session lookup failed for booking %s: %s", booking_id, exc)
+            return None
+
+        paid_session = next(
+            (
+                session
+                for session in sessions.data
+                if getattr(session, "payment_status", "") == "paid"
+                and session.payment_intent
+            ),
+            None,
+        )
+        if not paid_session:
+            return None
 
-    # If we already have the PaymentIntent id from a paid session, fetch it to verify status
-    if payment_intent_id:
+        # Fetch the PaymentIntent from the paid session to verify status
+        payment_intent_id = paid_session.payment_intent
         try:
-            confirmed_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            return await _cached_stripe_call(
+                _pi_retrieve_cache,
+                ("intent", payment_intent_id),
+                stripe.PaymentIntent.retrieve,
+                payment_intent_id,
+            )
         except Exception as exc:
-            print(f"Failed to retrieve payment intent {payment_intent_id} for booking {booking_id}: {exc}")
+            logger.warning("Failed to retrieve payment intent %s for booking %s: %s", payment_intent_id, booking_id, exc)
+            return None
 
-    # Fallback: search by metadata (older payments or if payment link lookup failed)
-    if not confirmed_intent:
+    async def _intent_from_search():
+        """Find a succeeded PaymentIntent by metadata (older payments or no Payment Link)."""
+        query = f"metadata['booking_id']:'{booking_id}'"
         try:
-            results = stripe.PaymentIntent.search(
-                query=f"metadata['booking_id']:'{booking_id}'",
+            # Let Stripe filter on status so a single result is enough
+            results = await _cached_stripe_call(
+                _pi_search_cache,
+                ("search", booking_id),
+                stripe.PaymentIntent.search,
+                query=f"{query} AND status:'succeeded'",
+                limit=1,
+            )
+        except stripe.error.InvalidRequestError as exc:
+            logger.warning("Stripe rejected status filter in search, filtering locally: %s", exc)
+            results = await _cached_stripe_call(
+                _pi_search_cache,
+                ("search-all", booking_id),
+                stripe.PaymentIntent.search,
+                query=query,
                 limit=5,
             )
-        except Exception as e:
-            raise HTTPException(status_code=502, detail=f"Stripe search failed: {e}")
+        return next((pi for pi in results.data if pi.status == "succeeded"), None)
+
+    # The Payment Link path is the most reliable for Payment Links; search is the fallback.
+    # Both lookups are independent, so by default run them together and take the first hit.
+    if _RECONCILE_PARALLEL_SEARCH:
+        confirmed_intent, search_error = await _first_succeeded_intent(
+            [_intent_from_payment_link(), _intent_from_search()]
+        )
+    else:
+        confirmed_intent, search_error = await _first_succeeded_intent([_intent_from_payment_link()])
+        if not confirmed_intent:
+            confirmed_intent, search_error = await _first_succeeded_intent([_intent_from_search()])
 
-        confirmed_intent = next((pi for pi in results.data if pi.status == "succeeded"), None)
+    if not confirmed_intent and search_error:
+        raise HTTPException(status_code=502, detail=f"Stripe search failed: {search_error}")
 
     if not confirmed_intent:
         return {"status": "pending", "message": "No successful payment found yet for this booking."}
 
     # Update booking and payment record
     try:
-        await supabase.update_booking_status(booking_id, "confirmed")
-        await supabase.update_payment_status(
-            booking_id=booking_id,
-            payment_status="completed",
-            transaction_id=confirmed_intent.id,
-            paid_at=datetime.now(),
-        )
-        booking = await supabase.get_booking_by_id(booking_id)
-
-        # Fire-and-forget email confirmation in case webhook was missed.
-        # Try to pass an email extracted from the PaymentIntent if we have one.
+        # Email from the PaymentIntent, stored on the payment and passed to the
+        # confirmation email in case the guest has no profile email
         fallback_email = (
             getattr(confirmed_intent, "receipt_email", None)
             or getattr(getattr(confirmed_intent, "charges", None), "data", [{}])[0]
             .get("billing_details", {})
             .get("email")
         )
-        asyncio.create_task(
-            send_booking_confirmation_email(
-                booking_id=booking_id,
-                fallback_email=fallback_email,
-            )
+        await supabase.confirm_booking_payment(
+            booking_id=booking_id,
+            transaction_id=confirmed_intent.id,
+            paid_at=datetime.now(timezone.utc),
+            receipt_email=fallback_email,
+        )
+        # Reflect the update on the row fetched above instead of reading it back
+        booking["status"] = "confirmed"
+
+        # Queue the email confirmation in case webhook was missed
+        await enqueue_booking_confirmation(
+            booking_id=booking_id,
+            fallback_email=fallback_email,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update booking/payment: {e}")
 
-    return {
+    response = {
         "status": "confirmed",
         "booking": booking,
         "payment_intent_id": confirmed_intent.id,
     }
+    _confirmed_cache.set(booking_id, response)
+    return response
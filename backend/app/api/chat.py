@@ -1,13 +1,38 @@
 """Chat API endpoint for the booking agent."""
+import asyncio
+import logging
+import time
 from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
 
-from app.agent.graph import run_booking_agent
+from app.agent.graph import run_booking_agent, stream_booking_agent
+from app.config import get_settings
 from app.services.supabase import get_supabase_service
+from app.utils.json import dumps
+from app.utils.ttl_cache import TTLCache
+
+try:
+    from jose import jwt, JWTError  # type: ignore
+
+    JOSE_AVAILABLE = True
+except ImportError:
+    jwt = None  # type: ignore
+    JWTError = Exception  # type: ignore
+    JOSE_AVAILABLE = False
 
 router = APIRouter(tags=["chat"])
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# user_id -> (name, email); profile details rarely change mid-conversation
+_user_cache = TTLCache(maxsize=10_000, ttl=settings.USER_PROFILE_CACHE_TTL_SECONDS)
+# Profile lookups in flight, shared by concurrent turns for the same user
+_user_inflight: dict[str, asyncio.Future] = {}
+# Raw access token -> verified claims; entries are also checked against the token's exp
+_token_cache = TTLCache(maxsize=10_000, ttl=300)
 
 
 class ChatRequest(BaseModel):
@@ -46,33 +71,96 @@ class HistoryMessage(BaseModel):
     content: str
 
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(
-    request: ChatRequest,
-    authorization: Optional[str] = Header(None)
-):
+def _verify_access_token(authorization: Optional[str]) -> Optional[dict]:
     """
-    Chat with the booking agent.
+    Verify a Supabase access token locally and return its claims.
 
-    This endpoint requires authentication. The user_id must match the
-    authenticated user's ID from the authorization token.
+    Returns None only when verification is not configured; once it is,
+    raises 401 for a missing, empty, invalid or expired token.
     """
+    if not (JOSE_AVAILABLE and settings.SUPABASE_JWT_SECRET):
+        return None
+    token = (authorization or "").removeprefix("Bearer ").strip()
+    if not token:
+        raise HTTPException(status_code=401, detail="Authentication required. Please log in.")
+
+    claims = _token_cache.get(token)
+    if claims is not None and claims.get("exp", 0) > time.time():
+        return claims
+
+    try:
+        claims = jwt.decode(
+            token,
+            settings.SUPABASE_JWT_SECRET,
+            algorithms=["HS256"],
+            audience="authenticated",
+        )
+    except JWTError as e:
+        logger.info("Rejected access token: %s", e)
+        raise HTTPException(status_code=401, detail="Invalid or expired session. Please log in again.")
+
+    _token_cache.set(token, claims)
+    return claims
+
+
+async def _validate_and_load_user(
+    request: ChatRequest,
+    authorization: Optional[str] = None
+) -> tuple[Optional[str], Optional[str]]:
+    """Validate the chat request and return the user's (name, email)."""
     if not request.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
 
     if not request.user_id:
         raise HTTPException(status_code=401, detail="User ID is required. Please log in.")
 
+    claims = _verify_access_token(authorization)
+    if claims is not None:
+        if claims.get("sub") != request.user_id:
+            raise HTTPException(status_code=403, detail="Session does not match the requested user.")
+        # The token already carries name and email for most users
+        full_name = (claims.get("user_metadata") or {}).get("full_name")
+        if full_name and claims.get("email"):
+            return full_name, claims["email"]
+
     # Get user profile for context
-    supabase = get_supabase_service()
+    cached = _user_cache.get(request.user_id)
+    if cached is not None:
+        return cached
+
+    future = _user_inflight.get(request.user_id)
+    if future is None:
+        future = asyncio.ensure_future(get_supabase_service().get_user_profile(request.user_id))
+        _user_inflight[request.user_id] = future
+        future.add_done_callback(lambda _: _user_inflight.pop(request.user_id, None))
+
     try:
-        user_profile = await supabase.get_user_profile(request.user_id)
-        user_name = user_profile.get("full_name") if user_profile else None
-        user_email = user_profile.get("email") if user_profile else None
+        user_profile = await asyncio.shield(future)
     except Exception as e:
-        print(f"Warning: Could not fetch user profile: {e}")
-        user_name = None
-        user_email = None
+        logger.warning("Could not fetch user profile: %s", e)
+        return None, None
+
+    if not user_profile:
+        # Don't cache a missing profile; it may be created moments later
+        return None, None
+
+    identity = (user_profile.get("full_name"), user_profile.get("email"))
+    _user_cache.set(request.user_id, identity)
+    return identity
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(
+    request: ChatRequest,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Chat with the booking agent.
+
+    This endpoint requires authentication. The user_id must match the
+    authenticated user's ID from the authorization token.
+    """
+    user_name, user_email = await _validate_and_load_user(request, authorization)
 
     # Run the booking agent
     try:
@@ -86,7 +174,7 @@ async def chat(
             language=request.language or "english"
         )
     except Exception as e:
-        print(f"Agent error: {e}")
+        logger.exception("Agent error: %s", e)
         raise HTTPException(
             status_code=500,
             detail="I encountered an error processing your request. Please try again."
@@ -101,10 +189,40 @@ async def chat(
         payment_link=result.get("payment_link"),
         booking_summary=result.get("booking_summary"),
         virtual_tour=virtual_tour,
-        timestamp=datetime.now().isoformat()
+        timestamp=datetime.now(timezone.utc).isoformat()
     )
 
 
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Chat with the booking agent, streaming the reply as newline-delimited JSON.
+
+    Emits {"type": "token", "content": ...} lines while the model generates,
+    then one {"type": "done", ...} line with the full ChatResponse fields.
+    """
+    user_name, user_email = await _validate_and_load_user(request, authorization)
+
+    async def event_lines():
+        async for event in stream_booking_agent(
+            message=request.message,
+            user_id=request.user_id,
+            user_name=user_name,
+            user_email=user_email,
+            conversation_id=request.conversation_id,
+            history=request.history,
+            language=request.language or "english"
+        ):
+            if event["type"] == "done":
+                event["timestamp"] = datetime.now(timezone.utc).isoformat()
+            yield dumps(event) + "\n"
+
+    return StreamingResponse(event_lines(), media_type="application/x-ndjson")
+
+
 @router.get("/chat/health")
 async def chat_health():
     """Health check for chat endpoint."""
@@ -1,12 +1,45 @@
 """Knowledge Base API endpoints for RAG functionality."""
-from typing import Optional
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Optional
 from fastapi import APIRouter, UploadFile, File, HTTPException, Query
 from pydantic import BaseModel
 
 from app.services.knowledge_base import get_knowledge_base_service
+from app.utils.json import FastJSONResponse
 
 router = APIRouter(prefix="/knowledge-base", tags=["Knowledge Base"])
 
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+PDF_MAGIC = b"%PDF-"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _spool_upload(source: BinaryIO, max_size: int) -> tuple[str, int, str]:
+    """
+    Copy an upload to a temp file in fixed-size chunks (blocking).
+
+    Returns (path, size, sha256 hex). Raises ValueError once max_size is
+    exceeded; the partial file is removed.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise ValueError("File size exceeds 50MB limit")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
 
 # ==================== REQUEST/RESPONSE MODELS ====================
 
@@ -64,21 +97,31 @@ async def upload_document(
     if file.content_type not in ["application/pdf", "application/x-pdf"]:
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDF files are allowed")
 
-    # Read file content
-    content = await file.read()
-    file_size = len(content)
+    # Extension and content type are client-supplied; check the file signature too
+    head = await file.read(len(PDF_MAGIC))
+    if head != PDF_MAGIC:
+        raise HTTPException(status_code=400, detail="Invalid file type. Only PDF files are allowed")
+    await file.seek(0)
 
-    # Check file size (max 50MB)
-    max_size = 50 * 1024 * 1024
-    if file_size > max_size:
-        raise HTTPException(status_code=400, detail="File size exceeds 50MB limit")
+    # Copy to disk in chunks instead of holding the whole PDF in memory
+    try:
+        local_path, file_size, content_hash = await asyncio.to_thread(
+            _spool_upload, file.file, MAX_UPLOAD_SIZE
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # Release the request's own spooled copy now rather than after the
+        # storage upload and database insert
+        await file.close()
 
     kb_service = get_knowledge_base_service()
     document = await kb_service.upload_document(
-        file_content=content,
+        local_path=local_path,
         file_name=file.filename,
         file_size=file_size,
-        uploaded_by=uploaded_by
+        uploaded_by=uploaded_by,
+        content_hash=content_hash
     )
 
     if not document:
@@ -155,11 +198,12 @@ async def query_knowledge_base(request: RAGQueryRequest):
     return result
 
 
-@router.post("/search")
+@router.post("/search", response_class=FastJSONResponse)
 async def search_documents(
     query: str = Query(..., description="Search query"),
-    threshold: float = Query(0.7, description="Similarity threshold (0-1)"),
-    limit: int = Query(5, description="Maximum number of results")
+    threshold: Optional[float] = Query(None, description="Similarity threshold (0-1); defaults to KB_MATCH_THRESHOLD"),
+    limit: int = Query(5, description="Maximum number of results"),
+    no_cache: bool = Query(False, description="Bypass the query result cache")
 ):
     """
     Search documents by semantic similarity.
@@ -169,14 +213,15 @@ async def search_documents(
     result = await kb_service.query_knowledge_base(
         query=query,
         match_threshold=threshold,
-        match_count=limit
+        match_count=limit,
+        no_cache=no_cache
     )
     return result
 
 
 # ==================== UNANSWERED QUERIES (ADMIN) ====================
 
-@router.get("/unanswered-queries")
+@router.get("/unanswered-queries", response_class=FastJSONResponse)
 async def get_unanswered_queries(
     status: Optional[str] = Query(None, description="Filter by status: pending, answered, dismissed"),
     limit: int = Query(50, description="Maximum number of results")
@@ -225,24 +270,32 @@ async def dismiss_query(query_id: str):
 
 # ==================== STATS ====================
 
-@router.get("/stats")
+@router.get("/stats", response_class=FastJSONResponse)
 async def get_knowledge_base_stats():
     """Get knowledge base statistics."""
     try:
         kb_service = get_knowledge_base_service()
 
-        documents = await kb_service.get_documents()
-        unanswered = await kb_service.get_unanswered_queries(status="pending")
+        documents, unanswered = await asyncio.gather(
+            kb_service.get_documents(),
+            kb_service.get_unanswered_queries(status="pending")
+        )
 
-        total_docs = len(documents)
-        ready_docs = len([d for d in documents if d["status"] == "ready"])
-        processing_docs = len([d for d in documents if d["status"] == "processing"])
-        error_docs = len([d for d in documents if d["status"] == "error"])
-        total_chunks = sum(d.get("chunk_count", 0) or 0 for d in documents)
-        total_size = sum(d.get("file_size", 0) or 0 for d in documents)
+        # Single pass over the documents
+        ready_docs = processing_docs = error_docs = total_chunks = total_size = 0
+        for d in documents:
+            status = d["status"]
+            if status == "ready":
+                ready_docs += 1
+            elif status == "processing":
+                processing_docs += 1
+            elif status == "error":
+                error_docs += 1
+            total_chunks += d.get("chunk_count") or 0
+            total_size += d.get("file_size") or 0
 
         return {
-            "total_documents": total_docs,
+            "total_documents": len(documents),
             "ready_documents": ready_docs,
             "processing_documents": processing_docs,
             "error_documents": error_docs,
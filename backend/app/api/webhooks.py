@@ -1,25 +1,28 @@
 """Stripe webhook handlers."""
 import asyncio
-from datetime import datetime
+import logging
+from datetime import datetime, timezone
 from fastapi import APIRouter, Request, HTTPException, Header
 
 from app.config import get_settings
-from app.services.notifications import send_booking_confirmation_email
+from app.services.email_queue import enqueue_booking_confirmation
+from app.services.stripe_client import stripe, STRIPE_AVAILABLE
 from app.services.supabase import get_supabase_service
+from app.utils.json import FastJSONResponse
+from app.utils.ttl_cache import TTLCache
 
-router = APIRouter(tags=["webhooks"])
+router = APIRouter(tags=["webhooks"], default_response_class=FastJSONResponse)
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
-# Initialize Stripe if available
-try:
-    import stripe  # type: ignore
+_STRIPE_WEBHOOK_SECRET = settings.STRIPE_WEBHOOK_SECRET
 
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-    STRIPE_AVAILABLE = True
-except ImportError:
-    stripe = None  # type: ignore
-    STRIPE_AVAILABLE = False
-    print("Warning: stripe not installed. Stripe webhooks are disabled.")
+# Stripe retries deliveries for up to three days; the table in migration 006
+# covers restarts and other workers, this cache skips the DB round-trip.
+_processed_events = TTLCache(maxsize=10_000, ttl=3 * 24 * 3600)
+
+if not STRIPE_AVAILABLE:
+    logger.warning("stripe not installed. Stripe webhooks are disabled.")
 
 
 @router.post("/webhooks/stripe")
@@ -46,26 +49,46 @@ async def stripe_webhook(
 
     # Verify webhook signature
     try:
-        event = stripe.Webhook.construct_event(
+        # HMAC verification is CPU-bound; keep it off the event loop
+        event = await asyncio.to_thread(
+            stripe.Webhook.construct_event,
             payload,
             stripe_signature,
-            settings.STRIPE_WEBHOOK_SECRET
+            _STRIPE_WEBHOOK_SECRET
         )
     except ValueError as e:
-        print(f"Invalid payload: {e}")
+        logger.warning("Invalid payload: %s", e)
         raise HTTPException(status_code=400, detail="Invalid payload")
     except stripe.error.SignatureVerificationError as e:
-        print(f"Invalid signature: {e}")
+        logger.warning("Invalid signature: %s", e)
         raise HTTPException(status_code=400, detail="Invalid signature")
 
     # Handle the event
+    event_id = event["id"]
     event_type = event["type"]
     event_data = event["data"]["object"]
 
-    print(f"Received Stripe event: {event_type}")
+    logger.info("Received Stripe event: %s", event_type)
 
     supabase = get_supabase_service()
 
+    # Stripe delivers at least once; skip events we have already handled.
+    # Events are only recorded once handled, and a failed handler answers 500,
+    # so a crash or failure mid-way is retried on Stripe's next delivery.
+    if _processed_events.get(event_id):
+        return {"status": "duplicate", "event_id": event_id}
+    try:
+        if await supabase.is_webhook_event_recorded(event_id):
+            _processed_events.set(event_id, True)
+            logger.info("Skipping already processed Stripe event: %s", event_id)
+            return {"status": "duplicate", "event_id": event_id}
+    except Exception as e:
+        # Don't drop the event if the dedupe table is unavailable
+        logger.warning("Could not look up Stripe event %s: %s", event_id, e)
+
+    # Cleared by any handler that fails, so the event isn't recorded as processed
+    handled = True
+
     if event_type == "checkout.session.completed":
         # Payment was successful via Checkout/Payment Link
         session = event_data
@@ -77,39 +100,34 @@ async def stripe_webhook(
         # Payment Link sessions may not carry metadata on the session; fall back to the payment intent
         if not booking_id and payment_intent_id:
             try:
-                pi = stripe.PaymentIntent.retrieve(payment_intent_id)
+                pi = await asyncio.to_thread(stripe.PaymentIntent.retrieve, payment_intent_id)
                 booking_id = pi.get("metadata", {}).get("booking_id")
             except Exception as e:
-                print(f"Error retrieving payment intent {payment_intent_id}: {e}")
+                logger.error("Error retrieving payment intent %s: %s", payment_intent_id, e)
 
         if booking_id:
             try:
-                # Update booking status to confirmed
-                await supabase.update_booking_status(booking_id, "confirmed")
-
-                # Update payment record
-                await supabase.update_payment_status(
+                # Confirm the booking and mark the payment completed in one transaction
+                await supabase.confirm_booking_payment(
                     booking_id=booking_id,
-                    payment_status="completed",
                     transaction_id=payment_intent_id,
-                    paid_at=datetime.now()
+                    paid_at=datetime.now(timezone.utc),
+                    receipt_email=customer_email,
                 )
 
-                print(f"Booking {booking_id} confirmed after payment")
+                logger.info("Booking %s confirmed after payment", booking_id)
 
-                # Fire-and-forget: email confirmation with PDF receipt
-                asyncio.create_task(
-                    send_booking_confirmation_email(
-                        booking_id=booking_id,
-                        fallback_email=customer_email
-                    )
+                # Queue the email confirmation with PDF receipt; a worker sends it
+                await enqueue_booking_confirmation(
+                    booking_id=booking_id,
+                    fallback_email=customer_email
                 )
 
             except Exception as e:
-                print(f"Error updating booking {booking_id}: {e}")
-                # Don't raise - we don't want Stripe to retry for our internal errors
+                logger.exception("Error updating booking %s: %s", booking_id, e)
+                handled = False
 
-        return {"status": "success", "booking_id": booking_id}
+        result = {"status": "success", "booking_id": booking_id}
 
     elif event_type == "payment_intent.succeeded":
         # Additional confirmation
@@ -118,12 +136,13 @@ async def stripe_webhook(
 
         if booking_id:
             try:
-                await supabase.update_booking_status(booking_id, "confirmed")
-                print(f"Booking {booking_id} confirmed via payment_intent.succeeded")
+                await supabase.update_booking_status(booking_id, "confirmed", echo=False)
+                logger.info("Booking %s confirmed via payment_intent.succeeded", booking_id)
             except Exception as e:
-                print(f"Error updating booking: {e}")
+                logger.exception("Error updating booking: %s", e)
+                handled = False
 
-        return {"status": "success"}
+        result = {"status": "success"}
 
     elif event_type == "payment_intent.payment_failed":
         # Payment failed
@@ -136,13 +155,15 @@ async def stripe_webhook(
                 # Keep booking as pending, update payment record
                 await supabase.update_payment_status(
                     booking_id=booking_id,
-                    payment_status="failed"
+                    payment_status="failed",
+                    echo=False,
                 )
-                print(f"Payment failed for booking {booking_id}: {failure_message}")
+                logger.info("Payment failed for booking %s: %s", booking_id, failure_message)
             except Exception as e:
-                print(f"Error updating payment status: {e}")
+                logger.exception("Error updating payment status: %s", e)
+                handled = False
 
-        return {"status": "failed", "message": failure_message}
+        result = {"status": "failed", "message": failure_message}
 
     elif event_type == "customer.created":
         # New Stripe customer created
@@ -151,14 +172,27 @@ async def stripe_webhook(
         customer_email = customer.get("email")
 
         # We might want to link this to a user profile
-        print(f"New Stripe customer created: {customer_id} ({customer_email})")
+        logger.info("New Stripe customer created: %s (%s)", customer_id, customer_email)
 
-        return {"status": "success", "customer_id": customer_id}
+        result = {"status": "success", "customer_id": customer_id}
 
     else:
         # Unhandled event type
-        print(f"Unhandled event type: {event_type}")
-        return {"status": "ignored", "event_type": event_type}
+        logger.info("Unhandled event type: %s", event_type)
+        result = {"status": "ignored", "event_type": event_type}
+
+    if not handled:
+        # A non-2xx response makes Stripe redeliver the event later
+        raise HTTPException(status_code=500, detail=f"Failed to handle Stripe event {event_id}")
+
+    try:
+        await supabase.record_webhook_event(event_id, event_type)
+    except Exception as e:
+        logger.warning("Could not record Stripe event %s: %s", event_id, e)
+    else:
+        _processed_events.set(event_id, True)
+
+    return result
 
 
 @router.get("/webhooks/stripe/test")
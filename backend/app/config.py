@@ -11,6 +11,7 @@ class Settings(BaseSettings):
     APP_NAME: str = "Infinity8 Booking Agent"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = False
+    TIMEZONE: str = "Asia/Kuala_Lumpur"  # Local business timezone for "today"/"now"
 
     # API settings
     API_V1_PREFIX: str = "/api/v1"
@@ -22,6 +23,21 @@ class Settings(BaseSettings):
     # OpenAI
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-4o-mini"
+    # Mark the static system prompt with an explicit cache_control breakpoint.
+    # Enable when routing to Anthropic/Bedrock-style OpenAI-compatible endpoints.
+    LLM_PROMPT_CACHE_CONTROL: bool = False
+    # Concurrent embedding requests when indexing a document; raise on higher OpenAI tiers
+    EMBEDDING_CONCURRENCY: int = 4
+    # OpenAI embedding requests per minute across the process (tier 1 default)
+    OPENAI_MAX_RPM: int = 3500
+    # Knowledge base search results reused for repeated or near-identical questions
+    KB_QUERY_CACHE_TTL_SECONDS: int = 600
+    KB_QUERY_CACHE_SIMILARITY: float = 0.95
+    # Similarity cut-offs for text-embedding-3-small, which scores lower than ada-002:
+    # chunks below KB_MATCH_THRESHOLD are ignored, and answers whose average match is
+    # below KB_CONFIDENCE_THRESHOLD are escalated to an admin
+    KB_MATCH_THRESHOLD: float = 0.3
+    KB_CONFIDENCE_THRESHOLD: float = 0.45
 
     # Supabase
     SUPABASE_URL: str
@@ -32,10 +48,27 @@ class Settings(BaseSettings):
     STRIPE_SECRET_KEY: str
     STRIPE_WEBHOOK_SECRET: str = ""
     STRIPE_PUBLISHABLE_KEY: str = ""
+    STRIPE_TIMEOUT_SECONDS: float = 5.0  # Per-request timeout for Stripe API calls
+    STRIPE_MAX_NETWORK_RETRIES: int = 1
+    STRIPE_PRICE_CACHE_TTL_SECONDS: int = 86400  # Reuse Prices for repeat space/amount bookings
+    # Reconcile runs the PaymentIntent search alongside the Payment Link lookup; disable to
+    # search only after the Payment Link path finds nothing (Search API has tighter rate limits)
+    RECONCILE_PARALLEL_SEARCH: bool = True
+
+    # Redis (optional; shared caches fall back to in-process when unset)
+    REDIS_URL: str = ""
 
     # Resend (email)
     RESEND_API_KEY: str = ""
     RESEND_FROM: str = ""
+    # Resend API requests per second per process (Resend's default team limit is 2)
+    RESEND_MAX_REQUESTS_PER_SECOND: float = 2
+
+    # Email queue (email_jobs table); disable the in-process worker when running
+    # `python -m app.services.email_queue` as a separate process
+    EMAIL_WORKER_ENABLED: bool = True
+    EMAIL_QUEUE_POLL_SECONDS: float = 5.0
+    EMAIL_JOB_MAX_ATTEMPTS: int = 5
 
     # Email / SMTP
     SMTP_HOST: str = ""
@@ -47,6 +80,9 @@ class Settings(BaseSettings):
 
     # Service timeouts
     DB_TIMEOUT_SECONDS: int = 15  # Increased from 10 to handle Supabase connection issues
+    DB_MAX_CONNECTIONS: int = 64  # Pooled HTTP connections to Supabase (PostgREST + storage)
+    SPACE_CACHE_TTL_SECONDS: int = 120  # In-process cache for space rows
+    USER_PROFILE_CACHE_TTL_SECONDS: int = 60  # Name/email reused across chat turns
 
     class Config:
         # Prefer ENV_FILE override, otherwise pick backend/.env when running from repo root,
@@ -61,6 +97,8 @@ class Settings(BaseSettings):
         env_file_encoding = "utf-8"
         case_sensitive = True
         extra = "ignore"
+        # Read once at startup; modules may snapshot values into constants
+        frozen = True
 
 
 @lru_cache()
@@ -1,9 +1,22 @@
 """FastAPI application entry point for Infinity8 Booking Agent."""
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from app.config import get_settings
+from app.agent.graph import close_llm_clients
+from app.services.email_queue import start_email_worker, stop_email_worker
+from app.services.notifications import configure_resend
+from app.services.knowledge_base import (
+    close_openai_client,
+    start_unanswered_query_logger,
+    stop_unanswered_query_logger,
+)
+from app.services.stripe_client import configure_stripe
+from app.services.request_cache import start_request_cache, end_request_cache
+from app.services.supabase import close_supabase_service
+from app.utils.logging import start_logging, stop_logging
+from app.utils.pdf import shutdown_pdf_pool
 from app.api.chat import router as chat_router
 from app.api.webhooks import router as webhooks_router
 from app.api.bookings import router as bookings_router
@@ -16,10 +29,22 @@ settings = get_settings()
 async def lifespan(app: FastAPI):
     """Application lifespan handler."""
     # Startup
+    start_logging()
     print(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
+    configure_stripe()
+    configure_resend()
+    start_email_worker()
+    start_unanswered_query_logger()
     yield
     # Shutdown
     print("Shutting down...")
+    await stop_email_worker()
+    await stop_unanswered_query_logger()
+    await close_llm_clients()
+    await close_openai_client()
+    await close_supabase_service()
+    shutdown_pdf_pool()
+    stop_logging()
 
 
 app = FastAPI(
@@ -37,6 +62,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def request_cache_scope(request: Request, call_next):
+    """Give each request its own cache for repeated reads (e.g. the user's profile)."""
+    token = start_request_cache()
+    try:
+        return await call_next(request)
+    finally:
+        end_request_cache(token)
+
+
 # Include routers
 app.include_router(chat_router, prefix=settings.API_V1_PREFIX)
 app.include_router(webhooks_router, prefix=settings.API_V1_PREFIX)
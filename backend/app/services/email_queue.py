@@ -0,0 +1,142 @@
+"""Durable email queue backed by the email_jobs table.
+
+Request handlers enqueue jobs (one insert) instead of sending inline; a worker
+claims due jobs, sends them and retries failures with backoff. The worker runs
+inside the API process by default, or standalone with:
+
+    python -m app.services.email_queue
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.config import get_settings
+from app.services.notifications import send_booking_confirmation_email
+from app.services.supabase import get_supabase_service
+
+logger = logging.getLogger(__name__)
+
+BOOKING_CONFIRMATION = "booking_confirmation"
+
+# Job kind -> coroutine function called with the job payload as keyword arguments
+_HANDLERS = {
+    BOOKING_CONFIRMATION: send_booking_confirmation_email,
+}
+
+_CLAIM_BATCH_SIZE = 10
+_MAX_BACKOFF_SECONDS = 3600
+
+_wakeup = asyncio.Event()
+_worker_task: Optional[asyncio.Task] = None
+# Inline fallback sends; the loop only holds weak references to tasks
+_inline_tasks: set[asyncio.Task] = set()
+
+
+async def enqueue_booking_confirmation(booking_id: str, fallback_email: Optional[str] = None) -> None:
+    """Queue the confirmation email for a paid booking."""
+    payload = {"booking_id": booking_id, "fallback_email": fallback_email}
+    try:
+        await get_supabase_service().enqueue_email_job(BOOKING_CONFIRMATION, payload)
+    except Exception as e:
+        # Queue unavailable (e.g. migration not applied): send in the background as before
+        logger.warning("Could not enqueue confirmation email for %s, sending inline: %s", booking_id, e)
+        task = asyncio.create_task(send_booking_confirmation_email(**payload))
+        _inline_tasks.add(task)
+        task.add_done_callback(_inline_tasks.discard)
+        return
+    # Let an in-process worker pick it up without waiting for the next poll
+    _wakeup.set()
+
+
+def _retry_at(attempts: int) -> datetime:
+    """Exponential backoff: 30s, 60s, 120s, ... capped at an hour."""
+    delay = min(30 * 2 ** max(attempts - 1, 0), _MAX_BACKOFF_SECONDS)
+    return datetime.now(timezone.utc) + timedelta(seconds=delay)
+
+
+async def _run_job(job: dict) -> None:
+    supabase = get_supabase_service()
+    handler = _HANDLERS.get(job["kind"])
+    if handler is None:
+        await supabase.fail_email_job(job["id"], f"Unknown job kind: {job['kind']}")
+        return
+
+    try:
+        await handler(**(job.get("payload") or {}))
+    except Exception as e:
+        attempts = job.get("attempts") or 1
+        if attempts >= get_settings().EMAIL_JOB_MAX_ATTEMPTS:
+            logger.error("Email job %s failed after %s attempts: %s", job["id"], attempts, e)
+            await supabase.fail_email_job(job["id"], str(e))
+        else:
+            logger.warning("Email job %s failed (attempt %s), will retry: %s", job["id"], attempts, e)
+            await supabase.fail_email_job(job["id"], str(e), retry_at=_retry_at(attempts))
+        return
+
+    await supabase.complete_email_job(job["id"])
+
+
+async def _run_job_safely(job: dict) -> None:
+    try:
+        await _run_job(job)
+    except Exception:
+        # Bookkeeping failed; the job is reclaimed once it goes stale
+        logger.exception("Error processing email job %s", job.get("id"))
+
+
+async def run_email_worker() -> None:
+    """Claim and process due email jobs until cancelled."""
+    poll_seconds = get_settings().EMAIL_QUEUE_POLL_SECONDS
+    supabase = get_supabase_service()
+
+    while True:
+        _wakeup.clear()
+        try:
+            jobs = await supabase.claim_email_jobs(limit=_CLAIM_BATCH_SIZE)
+        except Exception as e:
+            logger.warning("Could not claim email jobs: %s", e)
+            jobs = []
+
+        # Jobs are independent; run the batch concurrently (Resend calls are
+        # throttled in notifications)
+        await asyncio.gather(*(_run_job_safely(job) for job in jobs))
+
+        if len(jobs) == _CLAIM_BATCH_SIZE:
+            # Probably more waiting
+            continue
+
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_email_worker() -> None:
+    """Start the in-process worker (no-op when EMAIL_WORKER_ENABLED is off)."""
+    global _worker_task
+    if _worker_task is None and get_settings().EMAIL_WORKER_ENABLED:
+        _worker_task = asyncio.create_task(run_email_worker())
+
+
+async def stop_email_worker() -> None:
+    """Cancel the in-process worker; unfinished jobs are reclaimed later."""
+    global _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
+
+
+if __name__ == "__main__":
+    from app.services.notifications import configure_resend
+    from app.services.stripe_client import configure_stripe
+    from app.utils.logging import start_logging
+
+    start_logging()
+    configure_stripe()
+    configure_resend()
+    asyncio.run(run_email_worker())
@@ -1,15 +1,37 @@
 """Knowledge Base RAG Service for document processing and retrieval."""
 import asyncio
-import io
+import contextlib
+import os
+import random
+import tempfile
 import uuid
+from collections import Counter
+from functools import lru_cache
 from typing import Optional
 from datetime import datetime
 
-from langchain_openai import OpenAIEmbeddings
-from pypdf import PdfReader
+import httpx
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
 
 from app.config import get_settings
+from app.services.semantic_cache import SemanticQueryCache, unit_vector
 from app.services.supabase import get_supabase_service
+from app.utils.pdf import extract_pdf_pages
+from app.utils.rate_limit import AsyncRateLimiter
+
+try:
+    from semantic_text_splitter import TextSplitter  # type: ignore
+
+    TEXT_SPLITTER_AVAILABLE = True
+except ImportError:
+    TextSplitter = None  # type: ignore
+    TEXT_SPLITTER_AVAILABLE = False
 
 settings = get_settings()
 
@@ -30,105 +52,313 @@ ESCALATION_MESSAGES = {
     ),
 }
 
+# Each chunk row carries a 512-float embedding (~11KB of JSON) plus its text, so
+# a batch is ~1-2MB, well under PostgREST's request size limits
+_CHUNK_INSERT_BATCH_SIZE = 100
+_CHUNK_INSERT_CONCURRENCY = 4
+
+# Texts per embedding request when indexing documents
+_EMBEDDING_BATCH_SIZE = 256
+
+# Must match document_chunks.embedding / match_documents (512 dims); changing
+# either needs a migration and a reindex
+_EMBEDDING_MODEL = "text-embedding-3-small"
+_EMBEDDING_DIMENSIONS = 512
+
+# One HTTP/2 connection pool per process for all OpenAI calls made here
+# (embeddings and RAG answers) instead of each client warming up its own
+_openai_http_client = DefaultAsyncHttpxClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+)
+
+# Retries happen in _embed_with_retry, which also honours Retry-After
+_openai_client = AsyncOpenAI(
+    api_key=settings.OPENAI_API_KEY,
+    max_retries=0,
+    http_client=_openai_http_client,
+)
+
+_RAG_LANGUAGE_INSTRUCTIONS = {
+    "english": "Respond in English.",
+    "malay": "Respond in Bahasa Malaysia.",
+    "chinese": "Respond in Chinese."
+}
+
+# Embedding failures worth retrying: 429s, 5xx and network errors/timeouts
+_RETRYABLE_EMBEDDING_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+_EMBEDDING_MAX_ATTEMPTS = 5
+_EMBEDDING_MAX_BACKOFF_SECONDS = 60
+
+# Unanswered queries are logged off the response path, in batches
+_UNANSWERED_BATCH_SIZE = 50
+_UNANSWERED_FLUSH_SECONDS = 0.5
+_unanswered_queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+_unanswered_flush_task: Optional[asyncio.Task] = None
+
+# Reciprocal rank fusion constant; 60 is the usual choice and damps the
+# advantage of the very top ranks
+_RRF_K = 60
+
+
+async def close_openai_client() -> None:
+    """Close the shared OpenAI HTTP client (called on application shutdown)."""
+    await _openai_client.close()
+
+
+async def _insert_unanswered_queries(rows: list[dict]) -> None:
+    supabase = get_supabase_service()
+    try:
+        await supabase._execute(
+            supabase.client.table("unanswered_queries")
+            .insert(rows)
+        )
+    except Exception as e:
+        print(f"Failed to log {len(rows)} unanswered query(s): {e}")
+
+
+def _drain_unanswered_queue(rows: list[dict], limit: Optional[int]) -> None:
+    while (limit is None or len(rows) < limit) and not _unanswered_queue.empty():
+        rows.append(_unanswered_queue.get_nowait())
+
+
+async def _flush_unanswered_queries() -> None:
+    """Insert queued unanswered queries in batches until cancelled."""
+    rows: list[dict] = []
+    try:
+        while True:
+            rows.append(await _unanswered_queue.get())
+            # Let a batch build up
+            await asyncio.sleep(_UNANSWERED_FLUSH_SECONDS)
+            _drain_unanswered_queue(rows, _UNANSWERED_BATCH_SIZE)
+            batch, rows = rows, []
+            await _insert_unanswered_queries(batch)
+    finally:
+        # Shutting down: write whatever is still pending
+        _drain_unanswered_queue(rows, None)
+        if rows:
+            await _insert_unanswered_queries(rows)
+
+
+def start_unanswered_query_logger() -> None:
+    """Start the background task that writes unanswered queries."""
+    global _unanswered_flush_task
+    if _unanswered_flush_task is None:
+        _unanswered_flush_task = asyncio.create_task(_flush_unanswered_queries())
+
+
+async def stop_unanswered_query_logger() -> None:
+    """Flush pending unanswered queries and stop the background task."""
+    global _unanswered_flush_task
+    if _unanswered_flush_task is not None:
+        _unanswered_flush_task.cancel()
+        try:
+            await _unanswered_flush_task
+        except asyncio.CancelledError:
+            pass
+        _unanswered_flush_task = None
+
+
+@lru_cache(maxsize=1)
+def _get_rag_chain():
+    """Build the RAG prompt and LLM once, on first use."""
+    from langchain_openai import ChatOpenAI
+    from langchain_core.prompts import ChatPromptTemplate
+
+    llm = ChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=0.3,
+        openai_api_key=settings.OPENAI_API_KEY,
+        http_async_client=_openai_http_client
+    )
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", """You are a helpful customer service assistant for Infinity8 coworking space.
+Answer the user's question ONLY using the information provided in the context below.
+Do NOT make up information. If the context doesn't contain enough information to fully answer the question, reply exactly with: HANDOFF_TO_HUMAN
+Keep your response concise and helpful (2-4 sentences).
+{language_instruction}
+
+Context from our knowledge base:
+{context}"""),
+        ("human", "{question}")
+    ])
+
+    return prompt | llm
+
+
+def _fuse_rankings(*rankings: list[dict]) -> list[dict]:
+    """
+    Reciprocal rank fusion: order chunks by the sum of 1 / (k + rank) over the
+    rankings they appear in. The first ranking's copy of a chunk is kept.
+    """
+    scores: dict[str, float] = {}
+    chunks: dict[str, dict] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            scores[chunk["id"]] = scores.get(chunk["id"], 0.0) + 1.0 / (_RRF_K + rank)
+            chunks.setdefault(chunk["id"], chunk)
+    return [chunks[chunk_id] for chunk_id in sorted(scores, key=scores.__getitem__, reverse=True)]
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    """Seconds from an error response's Retry-After header, if it has one."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _remove_file(path: str) -> None:
+    """Delete a temporary upload file, ignoring files that are already gone."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
 
 class KnowledgeBaseService:
     """Service for knowledge base document processing and RAG operations."""
 
     def __init__(self):
         self.supabase = get_supabase_service()
-        self.embeddings = OpenAIEmbeddings(
-            openai_api_key=settings.OPENAI_API_KEY,
-            model="text-embedding-ada-002"
-        )
+        self._embedding_limiter = AsyncRateLimiter(settings.OPENAI_MAX_RPM, 60)
         self.storage_bucket = "knowledge-base"
+        # Set once the bucket is known to exist; the lock keeps concurrent
+        # first uploads from all checking at once
+        self._bucket_ready = False
+        self._bucket_lock = asyncio.Lock()
         self.chunk_size = 1000
         self.chunk_overlap = 200
+        # Native splitter, built once; sizes stay in characters so chunks match
+        # the ones already indexed by the fallback splitter
+        self._splitter = (
+            TextSplitter(self.chunk_size, overlap=self.chunk_overlap)
+            if TEXT_SPLITTER_AVAILABLE else None
+        )
+        self.query_cache = SemanticQueryCache(
+            ttl=settings.KB_QUERY_CACHE_TTL_SECONDS,
+            similarity_threshold=settings.KB_QUERY_CACHE_SIMILARITY
+        )
 
     # ==================== DOCUMENT UPLOAD ====================
 
     async def upload_document(
         self,
-        file_content: bytes,
+        local_path: str,
         file_name: str,
         file_size: int,
-        uploaded_by: Optional[str] = None
+        uploaded_by: Optional[str] = None,
+        content_hash: Optional[str] = None
     ) -> dict:
         """
         Upload a PDF document to Supabase storage and create a database record.
-        Returns the document record.
+        local_path is a temporary copy of the upload; the service deletes it once
+        it is no longer needed. Returns the document record.
         """
-        # Make sure the storage bucket is present before we attempt an upload
-        await self._ensure_storage_bucket()
+        processing_started = False
+        try:
+            # The same PDF uploaded again reuses the existing document
+            if content_hash:
+                existing = await self._get_document_by_hash(content_hash)
+                if existing:
+                    return existing
 
-        # Generate unique file path
-        file_id = str(uuid.uuid4())
-        file_path = f"documents/{file_id}/{file_name}"
+            # Make sure the storage bucket is present before we attempt an upload
+            await self._ensure_storage_bucket()
 
-        # Upload to Supabase Storage
-        try:
-            await asyncio.to_thread(
-                self.supabase.client.storage.from_(self.storage_bucket).upload,
-                file_path,
-                file_content,
+            # Generate unique file path
+            file_id = str(uuid.uuid4())
+            file_path = f"documents/{file_id}/{file_name}"
+
+            # Upload to Supabase Storage
+            try:
+                await self._upload_file(file_path, local_path)
+            except Exception as e:
+                # If bucket doesn't exist, create it first
+                message = str(e).lower()
+                if "bucket" in message or "not found" in message:
+                    # Bucket missing despite the cached check (e.g. deleted); check again
+                    self._bucket_ready = False
+                    await self._ensure_storage_bucket()
+                    await self._upload_file(file_path, local_path)
+                else:
+                    raise RuntimeError(f"Failed to upload document to storage: {e}") from e
+
+            # Create document record
+            document_data = {
+                "name": file_name,
+                "file_path": file_path,
+                "file_size": file_size,
+                "mime_type": "application/pdf",
+                "status": "processing",
+                "uploaded_by": uploaded_by
+            }
+            if content_hash:
+                document_data["content_hash"] = content_hash
+
+            response = await self.supabase._execute(
+                self.supabase.client.table("knowledge_base_documents")
+                .insert(document_data)
+            )
+
+            document = response.data[0] if response.data else None
+
+            if document:
+                # Start background processing; it removes local_path when done
+                asyncio.create_task(self._process_document(document["id"], local_path))
+                processing_started = True
+
+            return document
+        finally:
+            if not processing_started:
+                _remove_file(local_path)
+
+    async def _upload_file(self, storage_path: str, local_path: str):
+        """Stream a local file to the storage bucket."""
+        with open(local_path, "rb") as f:
+            return await self.supabase.client.storage.from_(self.storage_bucket).upload(
+                storage_path,
+                f,
                 {"content-type": "application/pdf"}
             )
-        except Exception as e:
-            # If bucket doesn't exist, create it first
-            message = str(e).lower()
-            if "bucket" in message or "not found" in message:
-                await self._ensure_storage_bucket()
-                await asyncio.to_thread(
-                    self.supabase.client.storage.from_(self.storage_bucket).upload,
-                    file_path,
-                    file_content,
-                    {"content-type": "application/pdf"}
-                )
-            else:
-                raise RuntimeError(f"Failed to upload document to storage: {e}") from e
-
-        # Create document record
-        document_data = {
-            "name": file_name,
-            "file_path": file_path,
-            "file_size": file_size,
-            "mime_type": "application/pdf",
-            "status": "processing",
-            "uploaded_by": uploaded_by
-        }
 
+    async def _get_document_by_hash(self, content_hash: str) -> Optional[dict]:
+        """Find a non-failed document with the same content hash."""
         response = await self.supabase._execute(
             self.supabase.client.table("knowledge_base_documents")
-            .insert(document_data)
+            .select("*")
+            .eq("content_hash", content_hash)
+            .neq("status", "error")
+            .limit(1)
         )
-
-        document = response.data[0] if response.data else None
-
-        if document:
-            # Start background processing
-            asyncio.create_task(self._process_document(document["id"], file_content))
-
-        return document
+        return response.data[0] if response.data else None
 
     async def _ensure_storage_bucket(self):
-        """Ensure the storage bucket exists."""
+        """Ensure the storage bucket exists (checked once per process)."""
+        if self._bucket_ready:
+            return
+        async with self._bucket_lock:
+            if not self._bucket_ready:
+                self._bucket_ready = await self._check_or_create_bucket()
+
+    async def _check_or_create_bucket(self) -> bool:
+        """Look up the bucket and create it if missing. Returns whether it exists."""
         try:
             # If the bucket already exists, no-op
             try:
-                buckets = await asyncio.to_thread(
-                    self.supabase.client.storage.list_buckets
-                )
-                if any(
-                    b.get("id") == self.storage_bucket
-                    or b.get("name") == self.storage_bucket
-                    for b in buckets or []
-                ):
-                    return
+                buckets = await self.supabase.client.storage.list_buckets()
+                for b in buckets or []:
+                    # storage3 returns bucket models; older versions returned dicts
+                    fields = b if isinstance(b, dict) else vars(b)
+                    if self.storage_bucket in (fields.get("id"), fields.get("name")):
+                        return True
             except Exception:
                 # If listing fails, fall through to create (best effort)
                 pass
 
-            await asyncio.to_thread(
-                self.supabase.client.storage.create_bucket,
+            await self.supabase.client.storage.create_bucket(
                 self.storage_bucket,
                 {
                     "public": False,
@@ -137,32 +367,27 @@ class KnowledgeBaseService:
                     "allowed_mime_types": ["application/pdf"]
                 }
             )
+            return True
         except Exception as e:
-            # Treat any failure as "already handled" to avoid blocking uploads when
-            # the bucket already exists or the API rejects a duplicate create.
-            if "exists" in str(e).lower() or "name must be string" in str(e).lower():
-                return
-            return
+            # Don't block uploads here; a duplicate create means the bucket is
+            # there, anything else is re-checked on the next upload
+            return "exists" in str(e).lower() or "duplicate" in str(e).lower()
 
-    async def _process_document(self, document_id: str, file_content: bytes):
+    async def _process_document(self, document_id: str, local_path: str):
         """Process a PDF document: extract text, chunk, and create embeddings."""
         try:
-            # Extract text from PDF
-            pdf_reader = PdfReader(io.BytesIO(file_content))
-            chunks_data = []
-
-            for page_num, page in enumerate(pdf_reader.pages):
-                text = page.extract_text()
-                if text.strip():
-                    page_chunks = self._split_text(text)
-                    for chunk_idx, chunk in enumerate(page_chunks):
-                        chunks_data.append(
-                            {
-                                "content": chunk,
-                                "page_number": page_num + 1,
-                                "chunk_index": len(chunks_data),
-                            }
-                        )
+            # Extract text from PDF (in worker processes)
+            pages_text = await extract_pdf_pages(local_path)
+            page_chunks = [
+                (page_num, chunk)
+                for page_num, text in enumerate(pages_text, start=1)
+                if text.strip()
+                for chunk in self._split_text(text)
+            ]
+            chunks_data = [
+                {"content": chunk, "page_number": page_num, "chunk_index": index}
+                for index, (page_num, chunk) in enumerate(page_chunks)
+            ]
 
             if not chunks_data:
                 await self._update_document_status(
@@ -170,36 +395,143 @@ class KnowledgeBaseService:
                 )
                 return
 
-            # Generate embeddings for all chunks
-            texts = [chunk["content"] for chunk in chunks_data]
-            embeddings = await asyncio.to_thread(
-                self.embeddings.embed_documents, texts
+            # Repeated text (page headers, footers) is embedded once; only
+            # those embeddings are kept across windows
+            counts = Counter(chunk["content"] for chunk in chunks_data)
+            repeated = {text for text, count in counts.items() if count > 1}
+            shared: dict[str, list[float]] = {}
+
+            # Embed window N+1 while window N is being inserted; at most two
+            # windows of embeddings are held in memory at once
+            window = _EMBEDDING_BATCH_SIZE * settings.EMBEDDING_CONCURRENCY
+            windows = [
+                chunks_data[start:start + window]
+                for start in range(0, len(chunks_data), window)
+            ]
+            pending = asyncio.create_task(
+                self._embed_chunks(windows[0], repeated, shared)
             )
-
-            # Insert chunks with embeddings
-            for i, (chunk, embedding) in enumerate(zip(chunks_data, embeddings)):
-                chunk_record = {
-                    "document_id": document_id,
-                    "content": chunk["content"],
-                    "chunk_index": chunk["chunk_index"],
-                    "page_number": chunk["page_number"],
-                    "embedding": embedding,
-                    "metadata": {}
-                }
-                await self.supabase._execute(
-                    self.supabase.client.table("document_chunks")
-                    .insert(chunk_record)
-                )
+            try:
+                for index, batch in enumerate(windows):
+                    embeddings = await pending
+                    if index + 1 < len(windows):
+                        pending = asyncio.create_task(
+                            self._embed_chunks(windows[index + 1], repeated, shared)
+                        )
+                    await self._insert_chunks(document_id, batch, embeddings)
+            finally:
+                pending.cancel()
 
             # Update document status
             await self._update_document_status(
                 document_id, "ready", chunk_count=len(chunks_data)
             )
+            # New content may answer questions cached as unanswerable
+            self.query_cache.clear_results()
 
         except Exception as e:
             await self._update_document_status(
                 document_id, "error", str(e)
             )
+        finally:
+            _remove_file(local_path)
+
+    async def _embed_texts(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed texts in batches with a few requests in flight at once.
+
+        Overlapping the batch requests hides most of the per-request latency
+        on large PDFs.
+        """
+        semaphore = asyncio.Semaphore(settings.EMBEDDING_CONCURRENCY)
+
+        async def embed_batch(batch: list[str]) -> list[list[float]]:
+            async with semaphore:
+                return await self._embed_with_retry(batch)
+
+        # gather keeps batch order, so the flattened result lines up with texts
+        batches = await asyncio.gather(*(
+            embed_batch(texts[start:start + _EMBEDDING_BATCH_SIZE])
+            for start in range(0, len(texts), _EMBEDDING_BATCH_SIZE)
+        ))
+        return [embedding for batch in batches for embedding in batch]
+
+    async def _embed_with_retry(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed texts with one OpenAI request, throttled to OPENAI_MAX_RPM and
+        retried with backoff on rate limits and transient errors.
+        """
+        for attempt in range(_EMBEDDING_MAX_ATTEMPTS):
+            await self._embedding_limiter.acquire()
+            try:
+                response = await _openai_client.embeddings.create(
+                    model=_EMBEDDING_MODEL,
+                    input=texts,
+                    dimensions=_EMBEDDING_DIMENSIONS
+                )
+                # Stored and query vectors must be unit length: match_documents
+                # ranks by inner product
+                return [unit_vector(item.embedding) for item in response.data]
+            except _RETRYABLE_EMBEDDING_ERRORS as e:
+                if attempt == _EMBEDDING_MAX_ATTEMPTS - 1:
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = 2 ** attempt + random.random()
+                await asyncio.sleep(min(delay, _EMBEDDING_MAX_BACKOFF_SECONDS))
+
+    async def _embed_chunks(
+        self,
+        chunks: list[dict],
+        repeated: set[str],
+        shared: dict[str, list[float]]
+    ) -> list[list[float]]:
+        """
+        Embed chunk contents, sending each distinct text once. Embeddings of
+        `repeated` texts are stored in `shared` for later windows to reuse.
+        """
+        texts = list(dict.fromkeys(
+            chunk["content"] for chunk in chunks if chunk["content"] not in shared
+        ))
+        embedded = dict(zip(texts, await self._embed_texts(texts)))
+        for text in repeated.intersection(embedded):
+            shared[text] = embedded[text]
+        return [
+            embedded[chunk["content"]] if chunk["content"] in embedded else shared[chunk["content"]]
+            for chunk in chunks
+        ]
+
+    async def _insert_chunks(
+        self,
+        document_id: str,
+        chunks: list[dict],
+        embeddings: list[list[float]]
+    ):
+        """Insert chunks with their embeddings in batches instead of one request per chunk."""
+        records = [
+            {
+                "document_id": document_id,
+                "content": chunk["content"],
+                "chunk_index": chunk["chunk_index"],
+                "page_number": chunk["page_number"],
+                "embedding": embedding,
+                "metadata": {}
+            }
+            for chunk, embedding in zip(chunks, embeddings)
+        ]
+        semaphore = asyncio.Semaphore(_CHUNK_INSERT_CONCURRENCY)
+
+        async def insert_batch(batch: list[dict]):
+            async with semaphore:
+                await self.supabase._execute(
+                    self.supabase.client.table("document_chunks")
+                    .insert(batch)
+                )
+
+        await asyncio.gather(*(
+            insert_batch(records[start:start + _CHUNK_INSERT_BATCH_SIZE])
+            for start in range(0, len(records), _CHUNK_INSERT_BATCH_SIZE)
+        ))
 
     async def _update_document_status(
         self,
@@ -223,9 +555,14 @@ class KnowledgeBaseService:
 
     def _split_text(self, text: str) -> list[str]:
         """
-        Lightweight text splitter to avoid importing heavy langchain_text_splitters.
-        Splits on characters with overlap to maintain context without blocking app startup.
+        Split text into overlapping chunks of at most chunk_size characters.
+
+        Uses semantic-text-splitter (Rust, prefers sentence/word boundaries) when
+        installed, otherwise a lightweight fixed-window split.
         """
+        if self._splitter is not None:
+            return self._splitter.chunks(text)
+
         chunks: list[str] = []
         step = max(self.chunk_size - self.chunk_overlap, 1)
         text_length = len(text)
@@ -268,8 +605,7 @@ class KnowledgeBaseService:
 
         # Delete from storage
         try:
-            await asyncio.to_thread(
-                self.supabase.client.storage.from_(self.storage_bucket).remove,
+            await self.supabase.client.storage.from_(self.storage_bucket).remove(
                 [document["file_path"]]
             )
         except Exception:
@@ -281,38 +617,105 @@ class KnowledgeBaseService:
             .delete()
             .eq("id", document_id)
         )
+        self.query_cache.clear_results()
         return True
 
+    async def reindex_documents(self) -> int:
+        """
+        Re-embed documents left in 'processing' by an embedding model change,
+        from the PDFs in storage. Returns the number of documents processed.
+        """
+        response = await self.supabase._execute(
+            self.supabase.client.table("knowledge_base_documents")
+            .select("id, name, file_path")
+            .eq("status", "processing")
+        )
+        documents = response.data or []
+
+        for document in documents:
+            print(f"Reindexing {document['name']}")
+            try:
+                content = await self.supabase.client.storage.from_(self.storage_bucket).download(
+                    document["file_path"]
+                )
+            except Exception as e:
+                await self._update_document_status(
+                    document["id"], "error", f"Failed to download document: {e}"
+                )
+                continue
+
+            fd, local_path = tempfile.mkstemp(suffix=".pdf")
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            del content
+
+            # Drop any chunks left by an earlier partial run
+            await self.supabase._execute(
+                self.supabase.client.table("document_chunks")
+                .delete()
+                .eq("document_id", document["id"])
+            )
+            # Removes local_path when done
+            await self._process_document(document["id"], local_path)
+
+        return len(documents)
+
     # ==================== RAG QUERY ====================
 
     async def query_knowledge_base(
         self,
         query: str,
-        match_threshold: float = 0.7,
-        match_count: int = 5
+        match_threshold: Optional[float] = None,
+        match_count: int = 5,
+        no_cache: bool = False
     ) -> dict:
         """
         Query the knowledge base using semantic search.
         Returns relevant context and confidence score.
+        Repeated or near-identical queries are answered from cache unless no_cache.
         """
-        # Generate query embedding
-        query_embedding = await asyncio.to_thread(
-            self.embeddings.embed_query, query
-        )
+        if match_threshold is None:
+            match_threshold = settings.KB_MATCH_THRESHOLD
+        params = (match_threshold, match_count)
+        if not no_cache:
+            cached = self.query_cache.get_exact(query, params)
+            if cached is not None:
+                return cached
 
-        # Search for similar chunks using the match_documents function
-        response = await self.supabase._execute(
-            self.supabase.client.rpc(
-                "match_documents",
-                {
-                    "query_embedding": query_embedding,
-                    "match_threshold": match_threshold,
-                    "match_count": match_count
-                }
-            )
+        # Generate query embedding
+        query_embedding = self.query_cache.get_embedding(query)
+        if query_embedding is None:
+            query_embedding = (await self._embed_with_retry([query]))[0]
+            self.query_cache.set_embedding(query, query_embedding)
+
+        if not no_cache:
+            cached = self.query_cache.get_similar(query_embedding, params)
+            if cached is not None:
+                return cached
+
+        result = await self._search_chunks(query, query_embedding, match_threshold, match_count)
+        if not no_cache:
+            self.query_cache.set(query, query_embedding, params, result)
+        return result
+
+    async def _search_chunks(
+        self,
+        query: str,
+        query_embedding: list[float],
+        match_threshold: float,
+        match_count: int
+    ) -> dict:
+        """
+        Run vector and keyword search in parallel, fuse the two rankings (RRF)
+        and assemble context, sources and confidence.
+        """
+        # Extra candidates from each list give the fusion something to reorder
+        candidates = match_count * 2
+        vector_chunks, keyword_chunks = await asyncio.gather(
+            self._vector_search(query_embedding, match_threshold, candidates),
+            self._keyword_search(query, candidates)
         )
-
-        chunks = response.data if response.data else []
+        chunks = _fuse_rankings(vector_chunks, keyword_chunks)[:match_count]
 
         if not chunks:
             return {
@@ -322,26 +725,25 @@ class KnowledgeBaseService:
                 "confidence": 0.0
             }
 
-        # Calculate average confidence
-        avg_confidence = sum(chunk["similarity"] for chunk in chunks) / len(chunks)
+        # Confidence is semantic similarity only; keyword-only matches add context
+        # but can't vouch for an answer on their own
+        similarities = [chunk["similarity"] for chunk in chunks if "similarity" in chunk]
+        avg_confidence = sum(similarities) / len(similarities) if similarities else 0.0
 
-        # Combine context from relevant chunks
-        context_parts = []
+        # Combine context from relevant chunks; the search RPCs return document names
+        context_parts = [chunk["content"] for chunk in chunks]
         sources = []
         seen_doc_ids = set()
 
         for chunk in chunks:
-            context_parts.append(chunk["content"])
             if chunk["document_id"] not in seen_doc_ids:
                 seen_doc_ids.add(chunk["document_id"])
-                # Get document name
-                doc = await self.get_document(chunk["document_id"])
-                if doc:
+                if chunk.get("document_name"):
                     sources.append({
                         "document_id": chunk["document_id"],
-                        "document_name": doc["name"],
+                        "document_name": chunk["document_name"],
                         "page_number": chunk["page_number"],
-                        "similarity": chunk["similarity"]
+                        "similarity": chunk.get("similarity")
                     })
 
         context = "\n\n---\n\n".join(context_parts)
@@ -353,7 +755,40 @@ class KnowledgeBaseService:
             "confidence": avg_confidence
         }
 
-    
+    async def _vector_search(
+        self,
+        query_embedding: list[float],
+        match_threshold: float,
+        match_count: int
+    ) -> list[dict]:
+        """Chunks most similar to the query embedding (match_documents)."""
+        response = await self.supabase._execute(
+            self.supabase.client.rpc(
+                "match_documents",
+                {
+                    "query_embedding": query_embedding,
+                    "match_threshold": match_threshold,
+                    "match_count": match_count
+                }
+            )
+        )
+        return response.data or []
+
+    async def _keyword_search(self, query: str, match_count: int) -> list[dict]:
+        """Chunks sharing words with the query (keyword_match_documents)."""
+        try:
+            response = await self.supabase._execute(
+                self.supabase.client.rpc(
+                    "keyword_match_documents",
+                    {"query_text": query, "match_count": match_count}
+                )
+            )
+        except Exception as e:
+            # Keyword search only adds recall; fall back to vector results alone
+            print(f"Keyword search failed: {e}")
+            return []
+        return response.data or []
+
     async def generate_rag_response(
         self,
         user_query: str,
@@ -365,14 +800,11 @@ class KnowledgeBaseService:
         Generate a response using RAG.
         If confidence is low, logs the query for admin review.
         """
-        from langchain_openai import ChatOpenAI
-        from langchain_core.prompts import ChatPromptTemplate
-
         # Query knowledge base
         kb_result = await self.query_knowledge_base(user_query)
 
         # Confidence threshold for escalation
-        CONFIDENCE_THRESHOLD = 0.75
+        CONFIDENCE_THRESHOLD = settings.KB_CONFIDENCE_THRESHOLD
 
         def escalation_response(confidence: float) -> dict:
             """Build a consistent escalation payload."""
@@ -395,39 +827,13 @@ class KnowledgeBaseService:
             return escalation_response(kb_result["confidence"] if kb_result["found"] else 0.0)
 
         # Generate response using LLM with context
-        llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0.3,
-            openai_api_key=settings.OPENAI_API_KEY
-        )
-
-        language_instructions = {
-            "english": "Respond in English.",
-            "malay": "Respond in Bahasa Malaysia.",
-            "chinese": "Respond in Chinese."
-        }
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a helpful customer service assistant for Infinity8 coworking space.
-Answer the user's question ONLY using the information provided in the context below.
-Do NOT make up information. If the context doesn't contain enough information to fully answer the question, reply exactly with: HANDOFF_TO_HUMAN
-Keep your response concise and helpful (2-4 sentences).
-{language_instruction}
-
-Context from our knowledge base:
-{context}"""),
-            ("human", "{question}")
-        ])
-
-        chain = prompt | llm
-
-        response = await asyncio.to_thread(
-            lambda: chain.invoke({
-                "context": kb_result["context"],
-                "question": user_query,
-                "language_instruction": language_instructions.get(language, language_instructions["english"])
-            })
-        )
+        response = await _get_rag_chain().ainvoke({
+            "context": kb_result["context"],
+            "question": user_query,
+            "language_instruction": _RAG_LANGUAGE_INSTRUCTIONS.get(
+                language, _RAG_LANGUAGE_INSTRUCTIONS["english"]
+            )
+        })
 
         answer_text = (response.content or "").strip()
 
@@ -454,7 +860,11 @@ Context from our knowledge base:
         session_id: Optional[str],
         confidence_score: float
     ):
-        """Log an unanswered query for admin review."""
+        """
+        Log an unanswered query for admin review.
+        Queued for the background logger when it is running, so the response
+        doesn't wait on the insert.
+        """
         query_data = {
             "user_message": user_message,
             "user_id": user_id,
@@ -463,13 +873,14 @@ Context from our knowledge base:
             "status": "pending"
         }
 
-        try:
-            await self.supabase._execute(
-                self.supabase.client.table("unanswered_queries")
-                .insert(query_data)
-            )
-        except Exception as e:
-            print(f"Failed to log unanswered query: {e}")
+        if _unanswered_flush_task is not None:
+            try:
+                _unanswered_queue.put_nowait(query_data)
+                return
+            except asyncio.QueueFull:
+                pass  # Backlogged (e.g. database down); write this one directly
+
+        await _insert_unanswered_queries([query_data])
 
     # ==================== ADMIN: UNANSWERED QUERIES ====================
 
@@ -533,3 +944,19 @@ def get_knowledge_base_service() -> KnowledgeBaseService:
     if _kb_service is None:
         _kb_service = KnowledgeBaseService()
     return _kb_service
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["reindex"]:
+        sys.exit("usage: python -m app.services.knowledge_base reindex")
+
+    async def _reindex():
+        try:
+            count = await get_knowledge_base_service().reindex_documents()
+            print(f"Reindexed {count} document(s)")
+        finally:
+            await close_openai_client()
+
+    asyncio.run(_reindex())
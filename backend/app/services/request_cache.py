@@ -0,0 +1,63 @@
+"""Per-request memoization for repeated reads within one HTTP request."""
+import asyncio
+import functools
+import inspect
+from contextvars import ContextVar
+from typing import Optional
+
+# None outside a request scope, so background jobs and scripts never see stale rows
+_request_cache: ContextVar[Optional[dict]] = ContextVar("request_cache", default=None)
+
+
+def start_request_cache():
+    """Open a fresh cache for the current request; returns a token for end_request_cache."""
+    return _request_cache.set({})
+
+
+def end_request_cache(token) -> None:
+    """Close the cache opened by start_request_cache."""
+    _request_cache.reset(token)
+
+
+def invalidate_request_cache(key: str) -> None:
+    """Forget one cached entry, e.g. after writing the row it came from."""
+    cache = _request_cache.get()
+    if cache is not None:
+        cache.pop(key, None)
+
+
+def request_cached(key_template: str):
+    """
+    Cache an async function's result for the rest of the current request.
+
+    key_template is formatted with the call's bound arguments, e.g.
+    "profile:{user_id}". Concurrent callers with the same key share one
+    in-flight call; failures are not cached.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache = _request_cache.get()
+            if cache is None:
+                return await func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = key_template.format(**bound.arguments)
+
+            future = cache.get(key)
+            if future is None:
+                future = asyncio.ensure_future(func(*args, **kwargs))
+                cache[key] = future
+            try:
+                return await asyncio.shield(future)
+            except Exception:
+                if cache.get(key) is future:
+                    del cache[key]
+                raise
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,248 @@
+"""In-process cache of knowledge base search results.
+
+Repeated questions skip both the OpenAI embedding call and the match_documents
+RPC: exact repeats hit on the normalized query text, and rephrasings hit when
+their embedding is close enough to a cached query's embedding.
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+try:
+    import numpy as np  # type: ignore
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None  # type: ignore
+    NUMPY_AVAILABLE = False
+
+try:
+    import hnswlib  # type: ignore
+
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    hnswlib = None  # type: ignore
+    HNSWLIB_AVAILABLE = False
+
+# Candidates fetched per ANN lookup; a few extra cover expired entries and
+# entries cached for other search params
+_ANN_CANDIDATES = 4
+# Rebuild the ANN index once this share of its items has been evicted
+_ANN_REBUILD_RATIO = 0.1
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive cache key for a query."""
+    return " ".join(query.casefold().split())
+
+
+def unit_vector(vector: list[float]) -> list[float]:
+    """Scale a vector to length 1 (so cosine similarity is a dot product)."""
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class _AnnIndex:
+    """HNSW index over cached query embeddings (cosine), labelled by int ids."""
+
+    def __init__(self, dim: int, max_elements: int):
+        self.dim = dim
+        self.max_elements = max_elements
+        self.index = hnswlib.Index(space="cosine", dim=dim)
+        self.index.init_index(max_elements=max_elements, ef_construction=200, M=16)
+        self.index.set_ef(50)
+        self.deleted = 0
+
+    def add(self, label: int, vector: list[float]) -> None:
+        self.index.add_items(np.asarray([vector], dtype=np.float32), [label])
+
+    def remove(self, label: int) -> None:
+        self.index.mark_deleted(label)
+        self.deleted += 1
+
+    def query(self, vector: list[float], k: int) -> list[tuple[int, float]]:
+        """Up to k (label, cosine similarity) pairs, most similar first."""
+        live = self.index.get_current_count() - self.deleted
+        if live <= 0:
+            return []
+        labels, distances = self.index.knn_query(
+            np.asarray([vector], dtype=np.float32), k=min(k, live)
+        )
+        return [(int(label), 1.0 - float(dist)) for label, dist in zip(labels[0], distances[0])]
+
+    def needs_rebuild(self) -> bool:
+        # Deleted items still occupy capacity, so rebuild before it runs out
+        count = self.index.get_current_count()
+        return count >= self.max_elements or self.deleted > count * _ANN_REBUILD_RATIO
+
+
+class SemanticQueryCache:
+    """LRU + TTL cache of search results keyed by query text and embedding.
+
+    `params` (e.g. match threshold and count) is part of every key, so results
+    for different search settings never mix. Similar-query lookups use an HNSW
+    index when hnswlib is installed, otherwise a (numpy) linear scan.
+    Event-loop confined; no locking.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 512,
+        ttl: float = 600,
+        similarity_threshold: float = 0.95,
+        embedding_maxsize: int = 1024
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embedding_maxsize = embedding_maxsize
+        # normalized query -> embedding
+        self._embeddings: OrderedDict[str, list[float]] = OrderedDict()
+        # (normalized query, params) -> (expires_at, unit embedding, params, result, label)
+        self._results: OrderedDict[tuple, tuple[float, list[float], Hashable, dict, int]] = OrderedDict()
+        # Stacked unit embeddings for the linear scan, rebuilt after changes
+        self._matrix = None
+        self._matrix_keys: list[tuple] = []
+        # ANN index and its label -> result key map (hnswlib only)
+        self._ann: Optional[_AnnIndex] = None
+        self._label_keys: dict[int, tuple] = {}
+        self._next_label = 0
+
+    # ---- embeddings ----
+
+    def get_embedding(self, query: str) -> Optional[list[float]]:
+        key = normalize_query(query)
+        embedding = self._embeddings.get(key)
+        if embedding is not None:
+            self._embeddings.move_to_end(key)
+        return embedding
+
+    def set_embedding(self, query: str, embedding: list[float]) -> None:
+        key = normalize_query(query)
+        self._embeddings[key] = embedding
+        self._embeddings.move_to_end(key)
+        while len(self._embeddings) > self.embedding_maxsize:
+            self._embeddings.popitem(last=False)
+
+    # ---- results ----
+
+    def get_exact(self, query: str, params: Hashable) -> Optional[dict]:
+        key = (normalize_query(query), params)
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._evict(key)
+            return None
+        self._results.move_to_end(key)
+        return entry[3]
+
+    def get_similar(self, embedding: list[float], params: Hashable) -> Optional[dict]:
+        """Best cached result whose query embedding has cosine >= the threshold."""
+        if not self._results:
+            return None
+
+        query_vec = unit_vector(embedding)
+        if self._ann is not None:
+            best_key = self._similar_ann(query_vec, params)
+        else:
+            best_key = self._similar_scan(query_vec, params)
+
+        if best_key is None:
+            return None
+        self._results.move_to_end(best_key)
+        return self._results[best_key][3]
+
+    def set(self, query: str, embedding: list[float], params: Hashable, result: dict) -> None:
+        key = (normalize_query(query), params)
+        if key in self._results:
+            self._evict(key)
+
+        vector = unit_vector(embedding)
+        label = self._next_label
+        self._next_label += 1
+        self._results[key] = (time.monotonic() + self.ttl, vector, params, result, label)
+        self._matrix = None
+        self._ann_add(label, key, vector)
+
+        while len(self._results) > self.maxsize:
+            self._evict(next(iter(self._results)))
+
+        if self._ann is not None and self._ann.needs_rebuild():
+            self._rebuild_ann()
+
+    def clear_results(self) -> None:
+        """Drop cached results (e.g. after documents change); embeddings stay valid."""
+        self._results.clear()
+        self._matrix = None
+        self._ann = None
+        self._label_keys.clear()
+
+    def _evict(self, key: tuple) -> None:
+        entry = self._results.pop(key, None)
+        self._matrix = None
+        if entry is not None and self._label_keys.pop(entry[4], None) is not None:
+            self._ann.remove(entry[4])
+
+    def _is_live(self, key: tuple, params: Hashable, now: float) -> bool:
+        entry = self._results.get(key)
+        return entry is not None and entry[2] == params and entry[0] > now
+
+    # ---- similarity search ----
+
+    def _similar_ann(self, query_vec: list[float], params: Hashable) -> Optional[tuple]:
+        now = time.monotonic()
+        for label, score in self._ann.query(query_vec, _ANN_CANDIDATES):
+            if score < self.similarity_threshold:
+                break
+            key = self._label_keys.get(label)
+            if key is not None and self._is_live(key, params, now):
+                return key
+        return None
+
+    def _similar_scan(self, query_vec: list[float], params: Hashable) -> Optional[tuple]:
+        now = time.monotonic()
+        if NUMPY_AVAILABLE:
+            matrix, keys = self._stacked()
+            scores = matrix @ np.asarray(query_vec, dtype=np.float32)
+            for index in np.argsort(scores)[::-1]:
+                if scores[index] < self.similarity_threshold:
+                    break
+                if self._is_live(keys[index], params, now):
+                    return keys[index]
+            return None
+
+        best_key, best_score = None, self.similarity_threshold
+        for key, (expires_at, vec, entry_params, _, _) in self._results.items():
+            if entry_params != params or expires_at <= now:
+                continue
+            score = sum(a * b for a, b in zip(vec, query_vec))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def _stacked(self):
+        if self._matrix is None:
+            self._matrix_keys = list(self._results)
+            self._matrix = np.asarray(
+                [self._results[key][1] for key in self._matrix_keys],
+                dtype=np.float32,
+            )
+        return self._matrix, self._matrix_keys
+
+    def _ann_add(self, label: int, key: tuple, vector: list[float]) -> None:
+        if not (HNSWLIB_AVAILABLE and NUMPY_AVAILABLE):
+            return
+        if self._ann is None:
+            # Headroom for marked-deleted items between rebuilds
+            self._ann = _AnnIndex(len(vector), max_elements=self.maxsize * 2)
+        self._ann.add(label, vector)
+        self._label_keys[label] = key
+
+    def _rebuild_ann(self) -> None:
+        """Rebuild the index from live entries, dropping marked-deleted items."""
+        self._ann = None
+        self._label_keys.clear()
+        for key, (_, vector, _, _, label) in self._results.items():
+            self._ann_add(label, key, vector)
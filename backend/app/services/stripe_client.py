@@ -0,0 +1,42 @@
+"""Process-wide Stripe SDK configuration."""
+from app.config import get_settings
+
+try:
+    import stripe  # type: ignore
+
+    STRIPE_AVAILABLE = True
+except ImportError:
+    stripe = None  # type: ignore
+    STRIPE_AVAILABLE = False
+
+# Sync calls run in worker threads (reconcile, webhooks, notifications); requests'
+# default pool keeps only 10 connections per host and discards the rest
+_POOL_MAXSIZE = 50
+
+
+def configure_stripe() -> None:
+    """
+    Set the Stripe key, a pooled HTTP client and a tight retry budget.
+
+    Called once at startup. Booking creation waits on Stripe inline, so a short
+    per-request timeout and at most one network retry keep its tail latency
+    well inside the agent's own timeout.
+    """
+    if not STRIPE_AVAILABLE:
+        return
+
+    settings = get_settings()
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+    # One shared client: a pooled requests.Session for sync calls, and an httpx
+    # pool for the *_async methods used by create_booking. Retries are left to
+    # the SDK (max_network_retries), so the adapter does not retry on its own.
+    import requests
+
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=_POOL_MAXSIZE))
+    stripe.default_http_client = stripe.RequestsClient(
+        timeout=settings.STRIPE_TIMEOUT_SECONDS,
+        session=session,
+        async_fallback_client=stripe.HTTPXClient(timeout=settings.STRIPE_TIMEOUT_SECONDS),
+    )
@@ -0,0 +1,93 @@
+"""Cache of Stripe Price objects so repeat bookings skip Price.create."""
+import time
+from typing import Optional
+
+from app.config import get_settings
+from app.utils.json import dumps, loads
+
+try:
+    import redis.asyncio as redis_asyncio  # type: ignore
+
+    REDIS_AVAILABLE = True
+except Exception:
+    redis_asyncio = None  # type: ignore
+    REDIS_AVAILABLE = False
+
+# Bound for the in-process fallback; prices are tiny so this is generous
+_LOCAL_MAX_ENTRIES = 1024
+
+
+class StripePriceCache:
+    """Maps (space_id, amount_cents, currency) to an existing Stripe price.
+
+    Uses Redis when REDIS_URL is configured so the cache is shared across
+    workers, otherwise a per-process dict. Cache failures are never fatal: a
+    miss just means a new Price is created.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.ttl = settings.STRIPE_PRICE_CACHE_TTL_SECONDS
+        self.redis = None
+        if REDIS_AVAILABLE and settings.REDIS_URL:
+            self.redis = redis_asyncio.from_url(settings.REDIS_URL)
+        self._local: dict[str, tuple[float, dict]] = {}
+
+    @staticmethod
+    def _key(space_id: str, amount_cents: int, currency: str) -> str:
+        return f"stripe:price:{space_id}:{amount_cents}:{currency}"
+
+    async def get(self, space_id: str, amount_cents: int, currency: str = "myr") -> Optional[dict]:
+        """Return {price_id, product_id} for a cached price, or None."""
+        key = self._key(space_id, amount_cents, currency)
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(key)
+                return loads(raw) if raw else None
+            except Exception as e:
+                print(f"Warning: Stripe price cache read failed: {e}")
+                return None
+
+        entry = self._local.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    async def set(
+        self,
+        space_id: str,
+        amount_cents: int,
+        price_id: str,
+        product_id: str,
+        currency: str = "myr"
+    ) -> None:
+        """Remember a price for later bookings of the same space and amount."""
+        key = self._key(space_id, amount_cents, currency)
+        value = {"price_id": price_id, "product_id": product_id}
+
+        if self.redis is not None:
+            try:
+                await self.redis.setex(key, self.ttl, dumps(value))
+            except Exception as e:
+                print(f"Warning: Stripe price cache write failed: {e}")
+            return
+
+        if len(self._local) >= _LOCAL_MAX_ENTRIES:
+            now = time.monotonic()
+            self._local = {k: v for k, v in self._local.items() if v[0] > now}
+            if len(self._local) >= _LOCAL_MAX_ENTRIES:
+                self._local.clear()
+        self._local[key] = (time.monotonic() + self.ttl, value)
+
+
+# Singleton instance
+_stripe_price_cache: Optional[StripePriceCache] = None
+
+
+def get_stripe_price_cache() -> StripePriceCache:
+    """Get or create the Stripe price cache singleton."""
+    global _stripe_price_cache
+    if _stripe_price_cache is None:
+        _stripe_price_cache = StripePriceCache()
+    return _stripe_price_cache
@@ -1,51 +1,98 @@
 """Supabase service for database operations."""
 import asyncio
+import time
+from functools import lru_cache
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import base64
 import json
-from supabase import create_client, Client
+import httpx
+from supabase import AsyncClient
+from supabase.lib.client_options import AsyncClientOptions
+from postgrest.types import CountMethod, ReturnMethod
 
 from app.config import get_settings
+from app.services.request_cache import request_cached, invalidate_request_cache
+from app.utils.ids import is_uuid
+from app.utils.json import dumps_bytes
 
 settings = get_settings()
 
+# Space rows change rarely but are read on every browse and booking
+_SPACE_CACHE_MAX_ENTRIES = 512
+# Max ids per batched space lookup (keeps the `in` filter URL short)
+_SPACE_LOAD_MAX_BATCH = 100
+
+
+class _JSONClient(httpx.AsyncClient):
+    """httpx client that encodes JSON bodies (PostgREST writes and RPC args) with orjson."""
+
+    def request(self, method, url, *, json=None, **kwargs):
+        if json is not None:
+            headers = httpx.Headers(kwargs.get("headers"))
+            headers["Content-Type"] = "application/json"
+            kwargs["headers"] = headers
+            kwargs["content"] = dumps_bytes(json)
+        return super().request(method, url, **kwargs)
+
+
+@lru_cache(maxsize=1)
+def _warn_if_not_service_role(key: str) -> None:
+    """
+    Decode the Supabase key payload and warn if it is not a service_role key.
+    This helps surface RLS/permission issues early. Runs once per key, however
+    often the service is rebuilt.
+    """
+    try:
+        segments = key.split(".")
+        if len(segments) < 2:
+            return
+        payload_b64 = segments[1] + "=" * (-len(segments[1]) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(payload_b64).decode("utf-8"))
+        role = payload.get("role")
+        if role != "service_role":
+            print("Warning: SUPABASE_SERVICE_KEY is not a service_role key. "
+                  "Database writes may be blocked by RLS. Replace with the service role key.")
+    except Exception:
+        # Don't break startup if we cannot decode
+        pass
+
 
 class SupabaseService:
     """Service class for Supabase operations."""
 
     def __init__(self):
-        self.client: Client = create_client(
+        # One pooled async HTTP client for PostgREST and storage; queries run on the
+        # event loop, with no thread hop per call
+        self.http_client = _JSONClient(
+            limits=httpx.Limits(
+                max_connections=settings.DB_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.DB_MAX_CONNECTIONS // 2,
+            ),
+            timeout=settings.DB_TIMEOUT_SECONDS,
+            follow_redirects=True,
+            http2=True,
+        )
+        # Constructed directly rather than via create_async_client(): with the service
+        # key there is no user session to load, so nothing here needs awaiting
+        self.client: AsyncClient = AsyncClient(
             settings.SUPABASE_URL,
-            settings.SUPABASE_SERVICE_KEY
+            settings.SUPABASE_SERVICE_KEY,
+            options=AsyncClientOptions(httpx_client=self.http_client)
         )
-        self._warn_if_not_service_role()
-
-    def _warn_if_not_service_role(self) -> None:
-        """
-        Decode the Supabase key payload and warn if it is not a service_role key.
-        This helps surface RLS/permission issues early.
-        """
-        try:
-            segments = settings.SUPABASE_SERVICE_KEY.split(".")
-            if len(segments) < 2:
-                return
-            payload_b64 = segments[1] + "=" * (-len(segments[1]) % 4)
-            payload = json.loads(base64.urlsafe_b64decode(payload_b64).decode("utf-8"))
-            role = payload.get("role")
-            if role != "service_role":
-                print("Warning: SUPABASE_SERVICE_KEY is not a service_role key. "
-                      "Database writes may be blocked by RLS. Replace with the service role key.")
-        except Exception:
-            # Don't break startup if we cannot decode
-            pass
+        _warn_if_not_service_role(settings.SUPABASE_SERVICE_KEY)
+        # (kind, *args) -> (expires_at, result); event-loop confined, so no lock needed
+        self._space_cache: dict[tuple, tuple[float, object]] = {}
+        # Space lookups waiting for the next batched fetch (see _load_space)
+        self._space_loads: dict[str, asyncio.Future] = {}
+        self._space_flush: Optional[asyncio.Task] = None
 
     async def _execute(self, query, max_retries=2):
-        """Run blocking Supabase calls in a worker thread with a timeout to avoid agent hangs."""
+        """Execute a Supabase query with a timeout to avoid agent hangs."""
         for attempt in range(max_retries):
             try:
                 return await asyncio.wait_for(
-                    asyncio.to_thread(query.execute),
+                    query.execute(),
                     timeout=settings.DB_TIMEOUT_SECONDS
                 )
             except asyncio.TimeoutError as exc:
@@ -88,6 +135,107 @@ class SupabaseService:
         )
         return response.data
 
+    def _space_cache_get(self, key: tuple):
+        entry = self._space_cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def _space_cache_set(self, key: tuple, value) -> None:
+        if len(self._space_cache) >= _SPACE_CACHE_MAX_ENTRIES:
+            now = time.monotonic()
+            self._space_cache = {k: v for k, v in self._space_cache.items() if v[0] > now}
+            if len(self._space_cache) >= _SPACE_CACHE_MAX_ENTRIES:
+                self._space_cache.clear()
+        self._space_cache[key] = (time.monotonic() + settings.SPACE_CACHE_TTL_SECONDS, value)
+
+    def invalidate_space_cache(self) -> None:
+        """Drop cached space rows (call after writing to the spaces table)."""
+        self._space_cache.clear()
+
+    async def get_spaces_cached(
+        self,
+        space_type: Optional[str] = None,
+        location: Optional[str] = None,
+        is_active: bool = True
+    ) -> list[dict]:
+        """get_spaces with a short in-process TTL cache. Treat results as read-only."""
+        key = ("spaces", space_type, location, is_active)
+        spaces = self._space_cache_get(key)
+        if spaces is None:
+            spaces = await self.get_spaces(space_type, location, is_active)
+            self._space_cache_set(key, spaces)
+        return spaces
+
+    async def get_space_by_id_cached(self, space_id: str) -> Optional[dict]:
+        """get_space_by_id with a short in-process TTL cache. Treat results as read-only."""
+        key = ("space", space_id)
+        space = self._space_cache_get(key)
+        if space is None:
+            space = await self._load_space(space_id)
+            if space:
+                self._space_cache_set(key, space)
+        return space
+
+    async def _load_space(self, space_id: str) -> Optional[dict]:
+        """
+        Fetch a space by ID, coalescing concurrent lookups (e.g. parallel agent
+        tool calls) into one `in` query. Ids that aren't UUIDs resolve to None.
+        """
+        # Anything but a UUID would make Postgres reject the whole batched query
+        if not is_uuid(space_id):
+            return None
+        space_id = space_id.lower()
+        future = self._space_loads.get(space_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._space_loads[space_id] = future
+            if self._space_flush is None:
+                self._space_flush = asyncio.create_task(self._flush_space_loads())
+        # Shielded: one cancelled caller must not cancel the shared lookup
+        return await asyncio.shield(future)
+
+    async def _flush_space_loads(self) -> None:
+        # Yield once so lookups started in the same loop iteration join the batch
+        await asyncio.sleep(0)
+        loads, self._space_loads, self._space_flush = self._space_loads, {}, None
+
+        space_ids = list(loads)
+        for i in range(0, len(space_ids), _SPACE_LOAD_MAX_BATCH):
+            batch = space_ids[i:i + _SPACE_LOAD_MAX_BATCH]
+            try:
+                response = await self._execute(
+                    self.client.table("spaces")
+                    .select("*")
+                    .in_("id", batch)
+                )
+            except Exception:
+                # Retry one by one so a failure is only reported to its own caller
+                await asyncio.gather(
+                    *(self._load_space_alone(space_id, loads[space_id]) for space_id in batch)
+                )
+                continue
+
+            by_id = {row["id"]: row for row in response.data}
+            for space_id in batch:
+                if not loads[space_id].done():
+                    loads[space_id].set_result(by_id.get(space_id))
+
+    async def _load_space_alone(self, space_id: str, future: asyncio.Future) -> None:
+        try:
+            response = await self._execute(
+                self.client.table("spaces")
+                .select("*")
+                .eq("id", space_id)
+                .limit(1)
+            )
+        except Exception as exc:
+            if not future.done():
+                future.set_exception(exc)
+            return
+        if not future.done():
+            future.set_result(response.data[0] if response.data else None)
+
     # ==================== BOOKINGS ====================
 
     async def get_bookings_for_space(
@@ -96,14 +244,14 @@ class SupabaseService:
         start_date: datetime,
         end_date: datetime
     ) -> list[dict]:
-        """Get bookings for a space within a date range."""
+        """Get bookings for a space that overlap a date range."""
         response = await self._execute(
             self.client.table("bookings")
             .select("*")
             .eq("space_id", space_id)
             .neq("status", "cancelled")
-            .gte("start_time", start_date.isoformat())
-            .lte("end_time", end_date.isoformat())
+            .lt("start_time", end_date.isoformat())
+            .gt("end_time", start_date.isoformat())
         )
         return response.data
 
@@ -114,7 +262,7 @@ class SupabaseService:
         end_time: datetime
     ) -> bool:
         """Check if a space is available for the given time slot."""
-        # Find any overlapping bookings
+        # One overlapping booking is enough, so stop at the first match
         response = await self._execute(
             self.client.table("bookings")
             .select("id")
@@ -122,9 +270,31 @@ class SupabaseService:
             .neq("status", "cancelled")
             .lt("start_time", end_time.isoformat())
             .gt("end_time", start_time.isoformat())
+            .limit(1)
         )
         return len(response.data) == 0
 
+    async def get_booked_space_ids(
+        self,
+        space_ids: list[str],
+        start_time: datetime,
+        end_time: datetime
+    ) -> set[str]:
+        """Return the subset of space IDs that have a booking overlapping the time slot."""
+        if not space_ids:
+            return set()
+
+        # One round-trip for all candidate spaces instead of one query per space
+        response = await self._execute(
+            self.client.table("bookings")
+            .select("space_id")
+            .in_("space_id", space_ids)
+            .neq("status", "cancelled")
+            .lt("start_time", end_time.isoformat())
+            .gt("end_time", start_time.isoformat())
+        )
+        return {row["space_id"] for row in response.data}
+
     async def create_booking(
         self,
         user_id: str,
@@ -135,9 +305,10 @@ class SupabaseService:
         total_amount: float,
         attendees_count: int = 1,
         notes: Optional[str] = None,
-        special_requirements: Optional[str] = None
+        special_requirements: Optional[str] = None,
+        booking_id: Optional[str] = None
     ) -> dict:
-        """Create a new booking."""
+        """Create a new booking. Pass booking_id to choose the row's ID up front."""
         booking_data = {
             "user_id": user_id,
             "space_id": space_id,
@@ -150,21 +321,47 @@ class SupabaseService:
             "notes": notes,
             "special_requirements": special_requirements
         }
+        if booking_id:
+            booking_data["id"] = booking_id
         response = await self._execute(
             self.client.table("bookings")
             .insert(booking_data)
         )
         return response.data[0] if response.data else None
 
+    async def get_pending_booking_for_slot(
+        self,
+        user_id: str,
+        space_id: str,
+        start_time: datetime,
+        end_time: datetime
+    ) -> Optional[dict]:
+        """Get the user's pending booking for exactly this space and time slot, if any."""
+        response = await self._execute(
+            self.client.table("bookings")
+            .select("*")
+            .eq("user_id", user_id)
+            .eq("space_id", space_id)
+            .eq("status", "pending")
+            .eq("start_time", start_time.isoformat())
+            .eq("end_time", end_time.isoformat())
+            .limit(1)
+        )
+        return response.data[0] if response.data else None
+
     async def update_booking_status(
         self,
         booking_id: str,
-        status: str
-    ) -> dict:
-        """Update booking status."""
+        status: str,
+        echo: bool = True
+    ) -> Optional[dict]:
+        """Update booking status. With echo=False the row isn't sent back and None is returned."""
         response = await self._execute(
             self.client.table("bookings")
-            .update({"status": status})
+            .update(
+                {"status": status},
+                returning=ReturnMethod.representation if echo else ReturnMethod.minimal,
+            )
             .eq("id", booking_id)
         )
         return response.data[0] if response.data else None
@@ -173,12 +370,16 @@ class SupabaseService:
         self,
         user_id: str,
         status: Optional[str] = None,
-        upcoming_only: bool = True
+        upcoming_only: bool = True,
+        limit: int = 50
     ) -> list[dict]:
-        """Get bookings for a user."""
+        """Get bookings for a user, with the space embedded in the same query."""
         query = (
             self.client.table("bookings")
-            .select("*, spaces(*)")
+            .select(
+                "id,start_time,end_time,status,total_amount,attendees_count,"
+                "spaces(name,type,location)"
+            )
             .eq("user_id", user_id)
         )
 
@@ -188,7 +389,7 @@ class SupabaseService:
         if upcoming_only:
             query = query.gte("start_time", datetime.now().isoformat())
 
-        query = query.order("start_time", desc=False)
+        query = query.order("start_time", desc=False).limit(limit)
         response = await self._execute(query)
         return response.data
 
@@ -202,18 +403,38 @@ class SupabaseService:
         )
         return response.data
 
+    async def get_booking_bundle(self, booking_id: str) -> Optional[dict]:
+        """
+        Get a booking with its space, the guest's profile ("profiles") and its
+        payments ("payments", a list) in one request.
+        """
+        response = await self._execute(
+            self.client.table("bookings")
+            # payments also references profiles, so name the bookings.user_id link
+            .select("*, spaces(*), profiles!user_id(*), payments(*)")
+            .eq("id", booking_id)
+            .limit(1)
+        )
+        return response.data[0] if response.data else None
+
     async def cancel_booking(self, booking_id: str, user_id: str) -> bool:
         """Cancel a booking (only if user owns it)."""
+        # Only the affected-row count is needed, not the updated row
         response = await self._execute(
             self.client.table("bookings")
-            .update({"status": "cancelled"})
+            .update(
+                {"status": "cancelled"},
+                count=CountMethod.exact,
+                returning=ReturnMethod.minimal,
+            )
             .eq("id", booking_id)
             .eq("user_id", user_id)
         )
-        return len(response.data) > 0
+        return bool(response.count)
 
     # ==================== USERS / PROFILES ====================
 
+    @request_cached("profile:{user_id}")
     async def get_user_profile(self, user_id: str) -> Optional[dict]:
         """Get user profile."""
         try:
@@ -231,18 +452,24 @@ class SupabaseService:
     async def update_stripe_customer_id(
         self,
         user_id: str,
-        stripe_customer_id: str
-    ) -> dict:
-        """Update user's Stripe customer ID."""
+        stripe_customer_id: str,
+        echo: bool = True
+    ) -> Optional[dict]:
+        """Update user's Stripe customer ID. With echo=False the row isn't sent back and None is returned."""
         response = await self._execute(
             self.client.table("profiles")
-            .update({"stripe_customer_id": stripe_customer_id})
+            .update(
+                {"stripe_customer_id": stripe_customer_id},
+                returning=ReturnMethod.representation if echo else ReturnMethod.minimal,
+            )
             .eq("id", user_id)
         )
+        invalidate_request_cache(f"profile:{user_id}")
         return response.data[0] if response.data else None
 
     # ==================== MEMBERSHIPS ====================
 
+    @request_cached("membership:{user_id}")
     async def get_active_membership(self, user_id: str) -> Optional[dict]:
         """Get user's active membership."""
         response = await self._execute(
@@ -250,9 +477,10 @@ class SupabaseService:
             .select("*")
             .eq("user_id", user_id)
             .eq("status", "active")
-            .single()
+            .maybe_single()
         )
-        return response.data
+        # maybe_single() yields no response (rather than raising) when nothing matches
+        return response.data if response else None
 
     # ==================== PAYMENTS ====================
 
@@ -287,9 +515,10 @@ class SupabaseService:
         payment_status: str,
         transaction_id: Optional[str] = None,
         paid_at: Optional[datetime] = None,
-        receipt_url: Optional[str] = None
-    ) -> dict:
-        """Update payment status for a booking."""
+        receipt_url: Optional[str] = None,
+        echo: bool = True
+    ) -> Optional[dict]:
+        """Update payment status for a booking. With echo=False the row isn't sent back and None is returned."""
         update_data = {"payment_status": payment_status}
         if transaction_id:
             update_data["transaction_id"] = transaction_id
@@ -300,11 +529,34 @@ class SupabaseService:
 
         response = await self._execute(
             self.client.table("payments")
-            .update(update_data)
+            .update(
+                update_data,
+                returning=ReturnMethod.representation if echo else ReturnMethod.minimal,
+            )
             .eq("booking_id", booking_id)
         )
         return response.data[0] if response.data else None
 
+    async def confirm_booking_payment(
+        self,
+        booking_id: str,
+        transaction_id: Optional[str] = None,
+        paid_at: Optional[datetime] = None,
+        receipt_email: Optional[str] = None
+    ) -> None:
+        """Mark a booking confirmed and its payment completed in one transaction."""
+        await self._execute(
+            self.client.rpc(
+                "confirm_booking_payment",
+                {
+                    "p_booking_id": booking_id,
+                    "p_transaction_id": transaction_id,
+                    "p_paid_at": (paid_at or datetime.now(timezone.utc)).isoformat(),
+                    "p_receipt_email": receipt_email,
+                }
+            )
+        )
+
     async def get_payment_by_booking(
         self,
         booking_id: str
@@ -319,6 +571,77 @@ class SupabaseService:
         return response.data[0] if response.data else None
 
 
+    # ==================== WEBHOOKS ====================
+
+    async def is_webhook_event_recorded(self, event_id: str) -> bool:
+        """Check whether a Stripe event id has already been handled."""
+        response = await self._execute(
+            self.client.table("stripe_webhook_events")
+            .select("id")
+            .eq("id", event_id)
+            .limit(1)
+        )
+        return bool(response.data)
+
+    async def record_webhook_event(self, event_id: str, event_type: str) -> bool:
+        """Record a Stripe event id; returns False if it was already recorded."""
+        response = await self._execute(
+            self.client.table("stripe_webhook_events")
+            .upsert(
+                {"id": event_id, "type": event_type},
+                on_conflict="id",
+                ignore_duplicates=True
+            )
+        )
+        # Conflicting rows are skipped, so nothing comes back for a duplicate
+        return bool(response.data)
+
+    # ==================== EMAIL JOBS ====================
+
+    async def enqueue_email_job(self, kind: str, payload: dict) -> Optional[dict]:
+        """Queue an outbound email for the email worker."""
+        response = await self._execute(
+            self.client.table("email_jobs")
+            .insert({"kind": kind, "payload": payload})
+        )
+        return response.data[0] if response.data else None
+
+    async def claim_email_jobs(self, limit: int = 10) -> list[dict]:
+        """Claim due email jobs for this worker (marks them processing)."""
+        response = await self._execute(
+            self.client.rpc("claim_email_jobs", {"p_limit": limit})
+        )
+        return response.data or []
+
+    async def complete_email_job(self, job_id: str) -> None:
+        """Mark an email job as sent."""
+        await self._execute(
+            self.client.table("email_jobs")
+            .update({"status": "done", "last_error": None, "updated_at": datetime.now(timezone.utc).isoformat()})
+            .eq("id", job_id)
+        )
+
+    async def fail_email_job(
+        self,
+        job_id: str,
+        error: str,
+        retry_at: Optional[datetime] = None
+    ) -> None:
+        """Record a failed attempt; reschedule it, or give up when retry_at is None."""
+        update_data = {
+            "status": "pending" if retry_at else "failed",
+            "last_error": error[:1000],
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        if retry_at:
+            update_data["run_after"] = retry_at.isoformat()
+
+        await self._execute(
+            self.client.table("email_jobs")
+            .update(update_data)
+            .eq("id", job_id)
+        )
+
 # Singleton instance
 _supabase_service: Optional[SupabaseService] = None
 
@@ -329,3 +652,11 @@ def get_supabase_service() -> SupabaseService:
     if _supabase_service is None:
         _supabase_service = SupabaseService()
     return _supabase_service
+
+
+async def close_supabase_service() -> None:
+    """Close pooled connections on shutdown."""
+    global _supabase_service
+    if _supabase_service is not None:
+        await _supabase_service.http_client.aclose()
+        _supabase_service = None
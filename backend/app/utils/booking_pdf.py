@@ -0,0 +1,170 @@
+"""Booking invoice PDF rendering.
+
+Kept free of app config and services so the PDF worker processes (see
+app.utils.pdf) only need fpdf to unpickle and run build_booking_pdf.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from typing import Optional
+
+try:
+    from fpdf import FPDF  # type: ignore
+
+    PDF_ENABLED = True
+except Exception:
+    PDF_ENABLED = False
+
+
+@lru_cache(maxsize=4096)
+def format_datetime(iso_str: str) -> str:
+    """Format ISO datetime strings into a readable local string."""
+    try:
+        dt = datetime.fromisoformat(iso_str)
+        return dt.strftime("%B %d, %Y %I:%M %p")
+    except Exception:
+        return iso_str
+
+
+def _pdf_label_rows(pdf: "FPDF", rows: list[tuple[str, str]]) -> None:
+    """
+    Draw a two-column label/value table.
+
+    Labels are drawn as one bold column and values as one regular column, so
+    the font switches twice per table instead of twice per row.
+    """
+    row_height = 7
+    if pdf.get_y() + row_height * len(rows) > pdf.page_break_trigger:
+        pdf.add_page()
+    top = pdf.get_y()
+
+    pdf.set_font("Helvetica", "B", 11)
+    for label, _ in rows:
+        pdf.cell(40, row_height, label, 0, 1)
+
+    pdf.set_font("Helvetica", "", 11)
+    pdf.set_y(top)
+    for _, value in rows:
+        pdf.set_x(pdf.l_margin + 40)
+        pdf.cell(0, row_height, value, 0, 1)
+
+
+def build_booking_pdf(
+    booking: dict,
+    user_profile: Optional[dict],
+    payment: Optional[dict] = None,
+    checkin_url: Optional[str] = None,
+    qr_png: Optional[bytes] = None,
+) -> Optional[bytes | bytearray]:
+    """Create a booking invoice PDF with optional check-in QR."""
+    if not PDF_ENABLED:
+        return None
+
+    space = booking.get("spaces") or {}
+    
+    # Initialize PDF with proper settings
+    pdf = FPDF(orientation='P', unit='mm', format='A4')
+    pdf.set_margins(left=20, top=20, right=20)
+    pdf.set_auto_page_break(auto=True, margin=20)
+    pdf.add_page()
+    
+    # Title
+    pdf.set_font("Helvetica", "B", 20)
+    pdf.cell(0, 10, "Booking Invoice", ln=1, align='C')
+    pdf.ln(5)
+    
+    # Booking Information Section
+    pdf.set_font("Helvetica", "B", 14)
+    pdf.cell(0, 8, "Booking Information", ln=1)
+    pdf.ln(2)
+    
+    pdf.set_font("Helvetica", "", 11)
+    
+    # Use cell() with proper width calculation instead of multi_cell for simple lines
+    effective_width = pdf.w - pdf.l_margin - pdf.r_margin
+    
+    booking_info = [
+        ("Booking ID:", booking.get('id', 'N/A')),
+        ("Guest:", user_profile.get('full_name') or user_profile.get('email') or 'Guest'),
+        ("Email:", user_profile.get('email', 'N/A') if user_profile else 'N/A'),
+        ("Space:", space.get('name', 'N/A')),
+        ("Location:", space.get('location', '') or 'Kuala Lumpur'),
+        ("Check-in:", format_datetime(booking.get('start_time', ''))),
+        ("Check-out:", format_datetime(booking.get('end_time', ''))),
+        ("Attendees:", str(booking.get('attendees_count', 1))),
+        ("Status:", booking.get('status', '').capitalize() or 'Confirmed'),
+    ]
+    
+    _pdf_label_rows(pdf, [(label, str(value)[:80]) for label, value in booking_info])  # Truncate very long values
+    
+    # Payment Details Section
+    if payment:
+        pdf.ln(5)
+        pdf.set_font("Helvetica", "B", 14)
+        pdf.cell(0, 8, "Payment Details", ln=1)
+        pdf.ln(2)
+        
+        payment_info = [
+            ("Amount:", f"RM {float(payment.get('amount', booking.get('total_amount', 0) or 0)):.2f}"),
+            ("Currency:", payment.get('currency', 'MYR')),
+            ("Status:", payment.get('payment_status', 'completed').capitalize()),
+            ("Transaction ID:", payment.get('transaction_id', 'N/A')[:50]),  # Truncate long IDs
+            ("Paid At:", format_datetime(payment.get('paid_at')) if payment.get('paid_at') else 'N/A'),
+        ]
+        
+        _pdf_label_rows(pdf, [(label, str(value)) for label, value in payment_info])
+    
+    # Total Amount (highlighted)
+    pdf.ln(3)
+    pdf.set_font("Helvetica", "B", 14)
+    pdf.set_fill_color(240, 240, 240)
+    pdf.cell(40, 10, "Total Paid:", 0, 0, fill=True)
+    pdf.cell(0, 10, f"RM {float(booking.get('total_amount', 0) or 0):.2f}", 0, 1, fill=True)
+    
+    # Check-in Section
+    if checkin_url:
+        pdf.ln(8)
+        pdf.set_font("Helvetica", "B", 14)
+        pdf.cell(0, 8, "Check-in Information", ln=1)
+        pdf.ln(2)
+        
+        pdf.set_font("Helvetica", "", 11)
+        pdf.cell(0, 7, "Scan the QR code below or visit the link to check in:", 0, 1)
+        
+        # Add QR code image
+        if qr_png:
+            try:
+                pdf.ln(3)
+                # Center the QR code
+                qr_width = 60
+                x_position = (pdf.w - qr_width) / 2
+                pdf.image(BytesIO(qr_png), x=x_position, w=qr_width)
+                pdf.ln(5)
+            except Exception as e:
+                print(f"Warning: Could not embed QR code in PDF: {e}")
+        
+        # Check-in URL (with line break handling for long URLs)
+        pdf.ln(3)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.set_text_color(0, 0, 255)  # Blue for URL
+        # Split URL if too long
+        if len(checkin_url) > 60:
+            pdf.multi_cell(0, 5, checkin_url, align='C')
+        else:
+            pdf.cell(0, 5, checkin_url, 0, 1, 'C')
+        pdf.set_text_color(0, 0, 0)  # Reset to black
+    
+    # Footer message
+    pdf.ln(10)
+    pdf.set_font("Helvetica", "I", 10)
+    pdf.multi_cell(0, 5, "Thank you for choosing Infinity8. Please present this confirmation upon arrival.", align='C')
+    
+    # fpdf2 returns a bytearray; it is only base64-encoded later, so hand it
+    # over as-is instead of copying it into bytes
+    output = pdf.output()
+    if isinstance(output, str):
+        # Fallback for older FPDF versions that return string
+        return output.encode("latin-1")
+    return output
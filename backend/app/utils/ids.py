@@ -0,0 +1,10 @@
+"""Identifier validation helpers."""
+import re
+
+# Canonical hyphenated UUID, the only form our IDs take; cheaper than constructing uuid.UUID
+UUID_RE = re.compile(r"\A[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z", re.I)
+
+
+def is_uuid(value: str) -> bool:
+    """Return True if `value` is a canonical hyphenated UUID."""
+    return UUID_RE.match(value) is not None
@@ -0,0 +1,48 @@
+"""JSON helpers for agent tool payloads and API responses (orjson when installed, stdlib otherwise)."""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson  # type: ignore
+
+    ORJSON_AVAILABLE = True
+except Exception:
+    orjson = None  # type: ignore
+    ORJSON_AVAILABLE = False
+
+
+def dumps(obj) -> str:
+    """Serialize to a compact JSON string."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def dumps_bytes(obj) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes (for request bodies)."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return dumps(obj).encode("utf-8")
+
+
+def loads(data):
+    """Parse a JSON string or bytes (raises ValueError on invalid input)."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with dumps, for routes that return plain dicts.
+
+    Routes with a response_model should keep the default class: FastAPI then
+    serializes them directly through Pydantic, which is faster still.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(content)
+        return dumps(content).encode("utf-8")
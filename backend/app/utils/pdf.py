@@ -0,0 +1,77 @@
+"""PDF work (text extraction, invoice rendering) in worker processes.
+
+Both are CPU-bound pure Python, so threads would serialize on the GIL.
+Workers are spawned (not forked), so they only import the modules of the
+functions they run: extraction needs nothing beyond pypdf, and invoice
+rendering (app.utils.booking_pdf) nothing beyond fpdf.
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+from pypdf import PdfReader
+
+# Fewer pages than this per worker isn't worth the extra process round-trip
+_MIN_PAGES_PER_TASK = 8
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _pool_size() -> int:
+    return os.cpu_count() or 1
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=_pool_size(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pdf_pool() -> None:
+    """Stop the worker processes (called on app shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_in_pdf_pool(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a picklable module-level function in the PDF worker pool."""
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), func, *args)
+
+
+def _count_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def _extract_page_range(path: str, start: int, end: int) -> list[str]:
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+async def extract_pdf_pages(path: str) -> list[str]:
+    """Return the text of every page, extracting page ranges in parallel."""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+
+    page_count = await loop.run_in_executor(pool, _count_pages, path)
+    if page_count == 0:
+        return []
+
+    per_task = max(_MIN_PAGES_PER_TASK, math.ceil(page_count / _pool_size()))
+    ranges = [
+        (start, min(start + per_task, page_count))
+        for start in range(0, page_count, per_task)
+    ]
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, _extract_page_range, path, start, end)
+        for start, end in ranges
+    ))
+    return [text for chunk in results for text in chunk]
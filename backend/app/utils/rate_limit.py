@@ -0,0 +1,23 @@
+"""Small async rate limiter."""
+import asyncio
+import time
+
+
+class AsyncRateLimiter:
+    """Spaces calls out to at most `max_rate` per `time_period` seconds.
+
+    Each acquire() reserves the next free slot and sleeps until it comes up,
+    so concurrent callers queue in order instead of bursting. Event-loop
+    confined; no locking.
+    """
+
+    def __init__(self, max_rate: float, time_period: float = 60):
+        self.interval = time_period / max_rate
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
@@ -0,0 +1,39 @@
+"""Small in-process TTL cache."""
+import time
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """Bounded dict whose entries expire `ttl` seconds after being set.
+
+    Meant for event-loop-confined use (no locking). When full, expired entries
+    are dropped first, then everything.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: dict[Hashable, tuple[float, Any]] = {}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if key not in self._data and len(self._data) >= self.maxsize:
+            now = time.monotonic()
+            self._data = {k: v for k, v in self._data.items() if v[0] > now}
+            if len(self._data) >= self.maxsize:
+                self._data.clear()
+        self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
@@ -0,0 +1,9 @@
+-- Migration: Composite index for per-user booking listings
+-- Run this in your Supabase SQL Editor
+
+-- ============================================
+-- USER BOOKINGS BY START TIME
+-- ============================================
+-- get_user_bookings filters on user_id and a start_time lower bound, then
+-- orders by start_time; one composite index serves the filter and the sort.
+CREATE INDEX IF NOT EXISTS idx_bookings_user_start ON bookings(user_id, start_time);
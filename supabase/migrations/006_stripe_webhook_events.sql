@@ -0,0 +1,17 @@
+-- Migration: Record processed Stripe webhook events
+-- Run this in your Supabase SQL Editor
+
+-- ============================================
+-- STRIPE WEBHOOK EVENTS
+-- ============================================
+-- Stripe delivers webhooks at least once; the handler skips events that were
+-- already recorded and inserts each event id (ON CONFLICT DO NOTHING) once it
+-- has been handled successfully.
+CREATE TABLE IF NOT EXISTS stripe_webhook_events (
+  id TEXT PRIMARY KEY,
+  type TEXT NOT NULL,
+  received_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Only the backend (service role) touches this table; no policies needed
+ALTER TABLE stripe_webhook_events ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,12 @@
+-- Migration: Content hash for knowledge base documents
+-- Run this in your Supabase SQL Editor
+
+-- ============================================
+-- DOCUMENT CONTENT HASH
+-- ============================================
+-- SHA-256 of the uploaded PDF, computed while the upload is streamed to disk.
+-- Re-uploading an identical file returns the existing document instead of
+-- storing and embedding it again.
+ALTER TABLE knowledge_base_documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_kb_documents_content_hash ON knowledge_base_documents(content_hash);
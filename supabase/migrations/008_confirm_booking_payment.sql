@@ -0,0 +1,29 @@
+-- Migration: Confirm a booking and its payment in one call
+-- Run this in your Supabase SQL Editor
+
+-- ============================================
+-- CONFIRM BOOKING PAYMENT
+-- ============================================
+-- Used by the Stripe webhook and the reconcile endpoint. Both updates run in
+-- the function's transaction, so a booking is never confirmed without its
+-- payment being marked completed (or vice versa), and it costs one round-trip.
+CREATE OR REPLACE FUNCTION confirm_booking_payment(
+  p_booking_id uuid,
+  p_transaction_id text,
+  p_paid_at timestamptz DEFAULT NOW()
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE bookings
+  SET status = 'confirmed'
+  WHERE id = p_booking_id;
+
+  UPDATE payments
+  SET payment_status = 'completed',
+      transaction_id = COALESCE(p_transaction_id, transaction_id),
+      paid_at = p_paid_at
+  WHERE booking_id = p_booking_id;
+END;
+$$;
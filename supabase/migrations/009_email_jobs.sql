@@ -0,0 +1,56 @@
+-- Migration: Durable queue for outbound emails
+-- Run this in your Supabase SQL Editor
+
+-- ============================================
+-- EMAIL JOBS TABLE
+-- ============================================
+-- Webhooks and reconcile enqueue booking confirmations here instead of sending
+-- inline, so a restart mid-send does not lose the email. Workers claim jobs with
+-- claim_email_jobs() and mark them done or reschedule them with a backoff.
+CREATE TABLE IF NOT EXISTS email_jobs (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  kind TEXT NOT NULL,
+  payload JSONB NOT NULL DEFAULT '{}',
+  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'processing', 'done', 'failed')),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,
+  run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_email_jobs_status_run_after ON email_jobs(status, run_after);
+
+-- Only the backend (service role) touches this table; no policies needed
+ALTER TABLE email_jobs ENABLE ROW LEVEL SECURITY;
+
+-- ============================================
+-- CLAIM EMAIL JOBS
+-- ============================================
+-- Atomically picks due jobs for one worker. SKIP LOCKED lets several workers
+-- poll concurrently; jobs stuck in 'processing' (worker died) are reclaimed.
+CREATE OR REPLACE FUNCTION claim_email_jobs(
+  p_limit int DEFAULT 10,
+  p_stale_after interval DEFAULT interval '10 minutes'
+)
+RETURNS SETOF email_jobs
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  UPDATE email_jobs
+  SET status = 'processing',
+      attempts = email_jobs.attempts + 1,
+      updated_at = NOW()
+  WHERE id IN (
+    SELECT j.id
+    FROM email_jobs j
+    WHERE (j.status = 'pending' AND j.run_after <= NOW())
+       OR (j.status = 'processing' AND j.updated_at < NOW() - p_stale_after)
+    ORDER BY j.run_after
+    FOR UPDATE SKIP LOCKED
+    LIMIT p_limit
+  )
+  RETURNING email_jobs.*;
+END;
+$$;
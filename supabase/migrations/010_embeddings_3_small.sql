@@ -0,0 +1,61 @@
+-- Migration: Switch knowledge base embeddings to text-embedding-3-small (512 dimensions)
+-- Run this in your Supabase SQL Editor, then re-embed existing documents with:
+--
+--     cd backend && python -m app.services.knowledge_base reindex
+
+-- ============================================
+-- DOCUMENT CHUNKS
+-- ============================================
+-- ada-002 vectors (1536-d) can't be converted to the new model, so existing
+-- chunks are dropped and rebuilt by the reindex command from the stored PDFs.
+DROP INDEX IF EXISTS idx_document_chunks_embedding;
+
+DELETE FROM document_chunks;
+
+ALTER TABLE document_chunks ALTER COLUMN embedding TYPE vector(512);
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding ON document_chunks
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+
+-- Documents stay hidden from search until they are re-embedded
+UPDATE knowledge_base_documents
+SET status = 'processing', chunk_count = 0, error_message = NULL
+WHERE status = 'ready';
+
+-- ============================================
+-- SIMILARITY SEARCH FUNCTION
+-- ============================================
+DROP FUNCTION IF EXISTS match_documents(vector(1536), float, int);
+
+CREATE OR REPLACE FUNCTION match_documents(
+  query_embedding vector(512),
+  match_threshold float DEFAULT 0.3,
+  match_count int DEFAULT 5
+)
+RETURNS TABLE (
+  id uuid,
+  document_id uuid,
+  content text,
+  page_number int,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    dc.id,
+    dc.document_id,
+    dc.content,
+    dc.page_number,
+    1 - (dc.embedding <=> query_embedding) AS similarity
+  FROM document_chunks dc
+  JOIN knowledge_base_documents kbd ON dc.document_id = kbd.id
+  WHERE kbd.status = 'ready'
+    AND dc.embedding IS NOT NULL
+    AND 1 - (dc.embedding <=> query_embedding) > match_threshold
+  ORDER BY dc.embedding <=> query_embedding
+  LIMIT match_count;
+END;
+$$;
@@ -0,0 +1,57 @@
+-- Migration: Store knowledge base embeddings as halfvec (requires pgvector 0.7+)
+-- Run this in your Supabase SQL Editor after 010_embeddings_3_small.sql
+
+-- ============================================
+-- DOCUMENT CHUNKS
+-- ============================================
+-- 16-bit floats halve the bytes read per candidate during similarity search;
+-- the precision loss doesn't change rankings in practice.
+DROP INDEX IF EXISTS idx_document_chunks_embedding;
+
+ALTER TABLE document_chunks
+  ALTER COLUMN embedding TYPE halfvec(512) USING embedding::halfvec(512);
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding ON document_chunks
+USING hnsw (embedding halfvec_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+
+-- ============================================
+-- SIMILARITY SEARCH FUNCTION
+-- ============================================
+-- The parameter stays vector(512) so callers are unchanged; it is cast once so
+-- the ORDER BY matches the halfvec index. ef_search is pinned rather than left
+-- to server defaults, since status/threshold filters apply after the index scan.
+CREATE OR REPLACE FUNCTION match_documents(
+  query_embedding vector(512),
+  match_threshold float DEFAULT 0.3,
+  match_count int DEFAULT 5
+)
+RETURNS TABLE (
+  id uuid,
+  document_id uuid,
+  content text,
+  page_number int,
+  similarity float
+)
+LANGUAGE plpgsql
+SET hnsw.ef_search = 40
+AS $$
+DECLARE
+  query_half halfvec(512) := query_embedding::halfvec(512);
+BEGIN
+  RETURN QUERY
+  SELECT
+    dc.id,
+    dc.document_id,
+    dc.content,
+    dc.page_number,
+    1 - (dc.embedding <=> query_half) AS similarity
+  FROM document_chunks dc
+  JOIN knowledge_base_documents kbd ON dc.document_id = kbd.id
+  WHERE kbd.status = 'ready'
+    AND dc.embedding IS NOT NULL
+    AND 1 - (dc.embedding <=> query_half) > match_threshold
+  ORDER BY dc.embedding <=> query_half
+  LIMIT match_count;
+END;
+$$;
@@ -0,0 +1,53 @@
+-- Migration: Rank knowledge base chunks by inner product
+-- Run this in your Supabase SQL Editor after 011_halfvec_embeddings.sql
+
+-- ============================================
+-- DOCUMENT CHUNKS INDEX
+-- ============================================
+-- Embeddings are unit length (OpenAI returns normalized vectors and the backend
+-- re-normalizes before storing), so cosine similarity equals the inner product
+-- and the index can skip the per-row norm computations.
+DROP INDEX IF EXISTS idx_document_chunks_embedding;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding ON document_chunks
+USING hnsw (embedding halfvec_ip_ops)
+WITH (m = 16, ef_construction = 64);
+
+-- ============================================
+-- SIMILARITY SEARCH FUNCTION
+-- ============================================
+-- <#> is the negative inner product, so similarity = -(a <#> b).
+CREATE OR REPLACE FUNCTION match_documents(
+  query_embedding vector(512),
+  match_threshold float DEFAULT 0.3,
+  match_count int DEFAULT 5
+)
+RETURNS TABLE (
+  id uuid,
+  document_id uuid,
+  content text,
+  page_number int,
+  similarity float
+)
+LANGUAGE plpgsql
+SET hnsw.ef_search = 40
+AS $$
+DECLARE
+  query_half halfvec(512) := query_embedding::halfvec(512);
+BEGIN
+  RETURN QUERY
+  SELECT
+    dc.id,
+    dc.document_id,
+    dc.content,
+    dc.page_number,
+    -(dc.embedding <#> query_half) AS similarity
+  FROM document_chunks dc
+  JOIN knowledge_base_documents kbd ON dc.document_id = kbd.id
+  WHERE kbd.status = 'ready'
+    AND dc.embedding IS NOT NULL
+    AND -(dc.embedding <#> query_half) > match_threshold
+  ORDER BY dc.embedding <#> query_half
+  LIMIT match_count;
+END;
+$$;
@@ -0,0 +1,62 @@
+-- Migration: Keyword search over knowledge base chunks (for hybrid retrieval)
+-- Run this in your Supabase SQL Editor
+
+-- ============================================
+-- FULL-TEXT SEARCH COLUMN
+-- ============================================
+-- 'simple' config: no stemming or stop words, since documents and questions mix
+-- English, Malay and Chinese, and exact tokens (prices, room names, phone
+-- numbers) are what vector search tends to miss.
+ALTER TABLE document_chunks
+  ADD COLUMN IF NOT EXISTS content_tsv tsvector
+  GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_content_tsv ON document_chunks
+USING gin (content_tsv);
+
+-- ============================================
+-- KEYWORD SEARCH FUNCTION
+-- ============================================
+-- Counterpart to match_documents; the backend fuses both rankings (RRF).
+-- Questions are matched on ANY of their words (without stop-word removal an
+-- AND query would rarely match); ts_rank_cd puts chunks matching more of them,
+-- closer together, first.
+CREATE OR REPLACE FUNCTION keyword_match_documents(
+  query_text text,
+  match_count int DEFAULT 5
+)
+RETURNS TABLE (
+  id uuid,
+  document_id uuid,
+  content text,
+  page_number int,
+  rank float
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  keywords tsquery;
+BEGIN
+  SELECT to_tsquery('simple', string_agg(quote_literal(lexeme), ' | '))
+  INTO keywords
+  FROM unnest(tsvector_to_array(to_tsvector('simple', query_text))) AS lexeme;
+
+  IF keywords IS NULL THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  SELECT
+    dc.id,
+    dc.document_id,
+    dc.content,
+    dc.page_number,
+    ts_rank_cd(dc.content_tsv, keywords)::float AS rank
+  FROM document_chunks dc
+  JOIN knowledge_base_documents kbd ON dc.document_id = kbd.id
+  WHERE kbd.status = 'ready'
+    AND dc.content_tsv @@ keywords
+  ORDER BY ts_rank_cd(dc.content_tsv, keywords) DESC
+  LIMIT match_count;
+END;
+$$;
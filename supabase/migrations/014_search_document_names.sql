@@ -0,0 +1,95 @@
+-- Migration: Return document names from the knowledge base search functions
+-- Run this in your Supabase SQL Editor after 013_document_chunks_keyword_search.sql
+
+-- Both functions already join knowledge_base_documents for the status filter;
+-- returning the name as well saves the backend a second round trip for sources.
+-- The result columns change, so the functions are dropped and recreated.
+
+-- ============================================
+-- SIMILARITY SEARCH FUNCTION
+-- ============================================
+DROP FUNCTION IF EXISTS match_documents(vector(512), float, int);
+
+CREATE OR REPLACE FUNCTION match_documents(
+  query_embedding vector(512),
+  match_threshold float DEFAULT 0.3,
+  match_count int DEFAULT 5
+)
+RETURNS TABLE (
+  id uuid,
+  document_id uuid,
+  content text,
+  page_number int,
+  document_name text,
+  similarity float
+)
+LANGUAGE plpgsql
+SET hnsw.ef_search = 40
+AS $$
+DECLARE
+  query_half halfvec(512) := query_embedding::halfvec(512);
+BEGIN
+  RETURN QUERY
+  SELECT
+    dc.id,
+    dc.document_id,
+    dc.content,
+    dc.page_number,
+    kbd.name,
+    -(dc.embedding <#> query_half) AS similarity
+  FROM document_chunks dc
+  JOIN knowledge_base_documents kbd ON dc.document_id = kbd.id
+  WHERE kbd.status = 'ready'
+    AND dc.embedding IS NOT NULL
+    AND -(dc.embedding <#> query_half) > match_threshold
+  ORDER BY dc.embedding <#> query_half
+  LIMIT match_count;
+END;
+$$;
+
+-- ============================================
+-- KEYWORD SEARCH FUNCTION
+-- ============================================
+DROP FUNCTION IF EXISTS keyword_match_documents(text, int);
+
+CREATE OR REPLACE FUNCTION keyword_match_documents(
+  query_text text,
+  match_count int DEFAULT 5
+)
+RETURNS TABLE (
+  id uuid,
+  document_id uuid,
+  content text,
+  page_number int,
+  document_name text,
+  rank float
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  keywords tsquery;
+BEGIN
+  SELECT to_tsquery('simple', string_agg(quote_literal(lexeme), ' | '))
+  INTO keywords
+  FROM unnest(tsvector_to_array(to_tsvector('simple', query_text))) AS lexeme;
+
+  IF keywords IS NULL THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  SELECT
+    dc.id,
+    dc.document_id,
+    dc.content,
+    dc.page_number,
+    kbd.name,
+    ts_rank_cd(dc.content_tsv, keywords)::float AS rank
+  FROM document_chunks dc
+  JOIN knowledge_base_documents kbd ON dc.document_id = kbd.id
+  WHERE kbd.status = 'ready'
+    AND dc.content_tsv @@ keywords
+  ORDER BY ts_rank_cd(dc.content_tsv, keywords) DESC
+  LIMIT match_count;
+END;
+$$;
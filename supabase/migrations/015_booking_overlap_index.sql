@@ -0,0 +1,12 @@
+-- Migration: Index for booking overlap checks
+-- Run this in your Supabase SQL Editor
+
+-- ============================================
+-- ACTIVE BOOKINGS BY SPACE AND TIME
+-- ============================================
+-- check_space_availability and get_booked_space_ids look for non-cancelled
+-- bookings of a space with start_time < slot end and end_time > slot start.
+-- A partial index keeps cancelled rows out and turns the lookup into a range
+-- scan on (space_id, start_time) with end_time checked from the index.
+CREATE INDEX IF NOT EXISTS idx_bookings_space_active_time ON bookings(space_id, start_time, end_time)
+WHERE status <> 'cancelled';
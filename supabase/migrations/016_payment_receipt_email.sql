@@ -0,0 +1,38 @@
+-- Migration: Keep the Stripe receipt email on the payment row
+-- Run this in your Supabase SQL Editor
+
+-- ============================================
+-- PAYMENTS
+-- ============================================
+-- The confirmation email falls back to this address when the guest has no
+-- profile email, instead of looking the PaymentIntent up on Stripe again.
+ALTER TABLE payments ADD COLUMN IF NOT EXISTS receipt_email text;
+
+-- ============================================
+-- CONFIRM BOOKING PAYMENT
+-- ============================================
+-- Same as 008, plus the receipt email Stripe reported (if any).
+DROP FUNCTION IF EXISTS confirm_booking_payment(uuid, text, timestamptz);
+
+CREATE OR REPLACE FUNCTION confirm_booking_payment(
+  p_booking_id uuid,
+  p_transaction_id text,
+  p_paid_at timestamptz DEFAULT NOW(),
+  p_receipt_email text DEFAULT NULL
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE bookings
+  SET status = 'confirmed'
+  WHERE id = p_booking_id;
+
+  UPDATE payments
+  SET payment_status = 'completed',
+      transaction_id = COALESCE(p_transaction_id, transaction_id),
+      paid_at = p_paid_at,
+      receipt_email = COALESCE(p_receipt_email, receipt_email)
+  WHERE booking_id = p_booking_id;
+END;
+$$;